@@ -0,0 +1,386 @@
+"""
+Per-(station, year) aggregation shared by analysis and ingestion (Problem 3).
+
+`yearly_station_stats` can be built two ways that produce identical values:
+
+- in SQL, with the GROUP BY in `stats_select` (used by `analyze_data.py`
+  and for partitions that already have records in the database), and
+- in NumPy, with `YearlyAccumulator` over parsed columns (used by
+  `ingest_data.py --with-stats` while the files are streamed).
+
+Averages are computed as `sum / count` over the valid (non-NULL) tenths
+values and then scaled, in double precision, exactly like the SQL path.
+`analyze_data.py --engine parallel` uses the NumPy path too, with each
+worker process aggregating the records of one station-id range.
+"""
+
+import logging
+from datetime import date
+
+import numpy as np
+from sqlalchemy import (
+    Date,
+    Float,
+    Integer,
+    and_,
+    cast,
+    create_engine,
+    func,
+    insert,
+    literal,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import MISSING_VALUE, WeatherRecord, YearlyStationStats
+from weather_parser import date_to_day_number
+
+logger = logging.getLogger(__name__)
+
+STAT_COLUMNS = (
+    'station_id',
+    'year',
+    'avg_max_celsius',
+    'avg_min_celsius',
+    'total_precip_cm',
+)
+
+# (station, year) pairs are packed into one int64 key: station * YEAR_SPAN + year.
+YEAR_SPAN = 10000
+
+
+def year_expr(dialect: str):
+    """Calendar year of `WeatherRecord.day_number`."""
+    if dialect == 'sqlite':
+        return func.strftime('%Y', WeatherRecord.day_number * 86400, 'unixepoch')
+    return func.extract(
+        'year', literal(date(1970, 1, 1), Date) + WeatherRecord.day_number
+    )
+
+
+def aggregate_query(session, dialect: str, filters=()):
+    """Per-(station, year) aggregates in tenths; missing (NULL) values are ignored."""
+    year = year_expr(dialect)
+
+    avg_max_expr = func.avg(WeatherRecord.max_temperature_tenths_celsius).label(
+        'avg_max_tenths'
+    )
+    avg_min_expr = func.avg(WeatherRecord.min_temperature_tenths_celsius).label(
+        'avg_min_tenths'
+    )
+    sum_precip_expr = func.sum(WeatherRecord.precipitation_tenths_mm).label(
+        'sum_precip_tenths'
+    )
+
+    return (
+        session.query(
+            WeatherRecord.station_id.label('station_id'),
+            year.label('year'),
+            avg_max_expr,
+            avg_min_expr,
+            sum_precip_expr,
+        )
+        .filter(*filters)
+        .group_by(WeatherRecord.station_id, year)
+    )
+
+
+def stats_select(dialect: str, filters=()):
+    """The aggregate as a Core SELECT with unit conversions done in SQL.
+
+    Averages/sums are cast to double before scaling so every backend performs
+    the same floating point operations as the Python fallback.
+    """
+    year = year_expr(dialect)
+
+    return (
+        select(
+            WeatherRecord.station_id,
+            cast(year, Integer),
+            cast(func.avg(WeatherRecord.max_temperature_tenths_celsius), Float) / 10.0,
+            cast(func.avg(WeatherRecord.min_temperature_tenths_celsius), Float) / 10.0,
+            cast(func.sum(WeatherRecord.precipitation_tenths_mm), Float) / 100.0,
+        )
+        # SQLite needs a WHERE clause to parse INSERT ... SELECT ... ON CONFLICT.
+        .where(true(), *filters)
+        .group_by(WeatherRecord.station_id, year)
+    )
+
+
+def supports_upsert(engine) -> bool:
+    """True when the dialect has INSERT ... ON CONFLICT DO UPDATE."""
+    if engine.dialect.name == 'postgresql':
+        return True
+    if engine.dialect.name == 'sqlite':
+        return engine.dialect.dbapi.sqlite_version_info >= (3, 24, 0)
+    return False
+
+
+def _on_conflict_update(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=['station_id', 'year'],
+        set_={name: stmt.excluded[name] for name in STAT_COLUMNS[2:]},
+    )
+
+
+def dialect_insert(dialect: str):
+    return postgresql_insert if dialect == 'postgresql' else sqlite_insert
+
+
+def upsert_stats_statement(dialect: str, stats_select):
+    """`INSERT INTO yearly_station_stats ... SELECT ... ON CONFLICT ... DO UPDATE`."""
+    return _on_conflict_update(
+        dialect_insert(dialect)(YearlyStationStats.__table__).from_select(
+            STAT_COLUMNS, stats_select
+        )
+    )
+
+
+def stat_values(r):
+    """One aggregate row as `(station_id, year, avg_max_c, avg_min_c, precip_cm)`."""
+    year_val = int(r.year) if isinstance(r.year, str) else int(r.year)
+
+    avg_max_tenths = r.avg_max_tenths
+    avg_min_tenths = r.avg_min_tenths
+    sum_precip_tenths = r.sum_precip_tenths
+
+    # PostgreSQL returns NUMERIC (Decimal) for avg() over integers.
+    avg_max_c = (float(avg_max_tenths) / 10.0) if avg_max_tenths is not None else None
+    avg_min_c = (float(avg_min_tenths) / 10.0) if avg_min_tenths is not None else None
+    total_precip_cm = (
+        (float(sum_precip_tenths) / 100.0) if sum_precip_tenths is not None else None
+    )
+    return r.station_id, year_val, avg_max_c, avg_min_c, total_precip_cm
+
+
+def partition_filters(dialect: str, station_pk: int, years):
+    """Restrict the aggregate to some years of one station.
+
+    The day range turns the scan into a clustered primary-key range read;
+    the year list then drops years in between that are not wanted.
+    """
+    years = sorted(years)
+    return (
+        WeatherRecord.station_id == station_pk,
+        WeatherRecord.day_number >= date_to_day_number(date(years[0], 1, 1)),
+        WeatherRecord.day_number < date_to_day_number(date(years[-1] + 1, 1, 1)),
+        cast(year_expr(dialect), Integer).in_(years),
+    )
+
+
+def store_stats(conn, filters=()) -> int:
+    """Upsert aggregates for the rows matching `filters` inside `conn`'s transaction."""
+    dialect = conn.dialect.name
+    if supports_upsert(conn.engine):
+        return conn.execute(
+            upsert_stats_statement(dialect, stats_select(dialect, filters))
+        ).rowcount
+    session = Session(bind=conn)
+    try:
+        count = upsert_stats_python(session, dialect, filters)
+        session.flush()
+        return count
+    finally:
+        session.close()
+
+
+def upsert_stats_python(session, dialect: str, filters=()) -> int:
+    """Row-by-row upsert for dialects without INSERT ... ON CONFLICT."""
+    rows = aggregate_query(session, dialect, filters).all()
+
+    upsert_count = 0
+    BATCH_SIZE = 500
+
+    for r in rows:
+        _, year_val, avg_max_c, avg_min_c, total_precip_cm = stat_values(r)
+
+        existing = (
+            session.query(YearlyStationStats)
+            .filter_by(station_id=r.station_id, year=year_val)
+            .first()
+        )
+        if existing:
+            existing.avg_max_celsius = avg_max_c
+            existing.avg_min_celsius = avg_min_c
+            existing.total_precip_cm = total_precip_cm
+        else:
+            new = YearlyStationStats(
+                station_id=r.station_id,
+                year=year_val,
+                avg_max_celsius=avg_max_c,
+                avg_min_celsius=avg_min_c,
+                total_precip_cm=total_precip_cm,
+            )
+            session.add(new)
+        upsert_count += 1
+
+        if upsert_count % BATCH_SIZE == 0:
+            session.flush()
+            logger.info(f'Flushed {upsert_count} stat rows...')
+
+    return upsert_count
+
+
+def upsert_stat_rows(conn, rows) -> int:
+    """Upsert computed stat tuples (`STAT_COLUMNS` order) in `conn`'s transaction."""
+    if not rows:
+        return 0
+    stats_table = YearlyStationStats.__table__
+    params = [dict(zip(STAT_COLUMNS, row)) for row in rows]
+    if supports_upsert(conn.engine):
+        conn.execute(
+            _on_conflict_update(dialect_insert(conn.dialect.name)(stats_table)), params
+        )
+        return len(params)
+    for values in params:
+        updated = conn.execute(
+            update(stats_table)
+            .where(
+                and_(
+                    stats_table.c.station_id == values['station_id'],
+                    stats_table.c.year == values['year'],
+                )
+            )
+            .values({name: values[name] for name in STAT_COLUMNS[2:]})
+        ).rowcount
+        if not updated:
+            conn.execute(insert(stats_table).values(values))
+    return len(params)
+
+
+class YearlyAccumulator:
+    """Running per-(station, year) sums and counts of the valid tenths values.
+
+    Feed it parsed columns with `add`; `stat_rows` then yields the same
+    tuples `stats_select` would produce for those records.
+    """
+
+    __slots__ = ('sums',)
+
+    def __init__(self):
+        # key -> [max_sum, max_count, min_sum, min_count, precip_sum, precip_count]
+        self.sums = {}
+
+    def __len__(self):
+        return len(self.sums)
+
+    def add(self, station_ids, day_numbers, max_tenths, min_tenths, precip_tenths):
+        """Accumulate parallel arrays; `station_ids` may be a scalar for one station."""
+        years = (
+            day_numbers.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64)
+            + 1970
+        )
+        self.add_years(station_ids, years, max_tenths, min_tenths, precip_tenths)
+
+    def add_years(self, station_ids, years, max_tenths, min_tenths, precip_tenths):
+        """`add` for rows whose calendar year is already known."""
+        if not len(years):
+            return
+        keys, inverse = np.unique(
+            np.asarray(station_ids, dtype=np.int64) * YEAR_SPAN + years,
+            return_inverse=True,
+        )
+
+        partials = []
+        for values in (max_tenths, min_tenths, precip_tenths):
+            valid = values != MISSING_VALUE
+            # float64 sums of int32 tenths are exact far beyond any station's range.
+            partials.append(
+                np.bincount(
+                    inverse, weights=np.where(valid, values, 0), minlength=len(keys)
+                ).astype(np.int64)
+            )
+            partials.append(
+                np.bincount(inverse, weights=valid, minlength=len(keys)).astype(
+                    np.int64
+                )
+            )
+
+        for key, *sums in zip(keys.tolist(), *(p.tolist() for p in partials)):
+            current = self.sums.get(key)
+            if current is None:
+                self.sums[key] = sums
+            else:
+                for i, value in enumerate(sums):
+                    current[i] += value
+
+    def add_columns(self, station_pk: int, columns):
+        """Accumulate one station's `WeatherColumns`."""
+        self.add(
+            station_pk,
+            columns.day_numbers,
+            columns.max_tenths,
+            columns.min_tenths,
+            columns.precip_tenths,
+        )
+
+    def merge(self, other: 'YearlyAccumulator'):
+        for key, sums in other.sums.items():
+            current = self.sums.get(key)
+            if current is None:
+                self.sums[key] = list(sums)
+            else:
+                for i, value in enumerate(sums):
+                    current[i] += value
+
+    def stat_rows(self):
+        """`(station_id, year, avg_max_c, avg_min_c, total_precip_cm)` tuples by key."""
+        rows = []
+        for key in sorted(self.sums):
+            max_sum, max_count, min_sum, min_count, precip_sum, precip_count = (
+                self.sums[key]
+            )
+            station_pk, year = divmod(key, YEAR_SPAN)
+            rows.append((
+                station_pk,
+                year,
+                max_sum / max_count / 10.0 if max_count else None,
+                min_sum / min_count / 10.0 if min_count else None,
+                float(precip_sum) / 100.0 if precip_count else None,
+            ))
+        return rows
+
+
+def fetch_station_range(conn, first_station: int, last_station: int):
+    """`(station_ids, day_numbers, max, min, precip)` int64 arrays of a station range.
+
+    NULL values come back as -9999. Rows are read straight from the DBAPI
+    cursor: building SQLAlchemy `Row` objects would cost as much as the scan.
+    """
+    stmt = select(
+        WeatherRecord.station_id,
+        WeatherRecord.day_number,
+        *(func.coalesce(column, MISSING_VALUE) for column in (
+            WeatherRecord.max_temperature_tenths_celsius,
+            WeatherRecord.min_temperature_tenths_celsius,
+            WeatherRecord.precipitation_tenths_mm,
+        )),
+    ).where(WeatherRecord.station_id.between(first_station, last_station))
+    sql = str(
+        stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+    )
+
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return np.array(rows, dtype=np.int64).reshape(-1, 5).T
+
+
+def aggregate_station_range(database_url: str, first_station: int, last_station: int):
+    """Process-pool entry point: stat tuples of the station-years in a station range."""
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            columns = fetch_station_range(conn, first_station, last_station)
+    finally:
+        engine.dispose()
+    accumulator = YearlyAccumulator()
+    accumulator.add(*columns)
+    return accumulator.stat_rows()
@@ -3,7 +3,22 @@
 Compute per-year per-station aggregated statistics and store them in the DB (Problem 3).
 
 Usage:
-    python analyze_data.py [--db DATABASE_URL]
+    python analyze_data.py [--db DATABASE_URL] [--full | --incremental]
+                           [--engine {sql,parallel}] [--workers N] [--prefix-sums DIR]
+
+`--full` (the default) re-aggregates every station-year. `--incremental`
+re-aggregates only the (station, year) partitions ingestion marked dirty in
+`stats_dirty`, then clears those markers.
+
+`--engine sql` (the default) runs the aggregate as one set-based statement.
+`--engine parallel` splits `weather_records` into station-id ranges that
+`--workers N` processes fetch and aggregate with NumPy; the results are
+written with one bulk upsert. Both engines store bit-identical values; the
+tests check this on SQLite and, with `TEST_POSTGRES_URL` set, PostgreSQL.
+
+`--prefix-sums DIR` also writes per-station cumulative sums for the
+`/api/weather/aggregate` endpoint (see `prefix_sums`), stamped with the
+dataset version they were computed from.
 
 This file is a standalone copy of the analysis logic adapted to the
 `submission/` layout where `database.py` and `models.py` are sibling modules.
@@ -11,13 +26,24 @@ This file is a standalone copy of the analysis logic adapted to the
 
 import argparse
 import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from pathlib import Path
 
-from sqlalchemy import func, case
+import numpy as np
 
-from database import get_database_manager
-from models import WeatherRecord, YearlyStationStats
+from sqlalchemy import delete, select
+
+from aggregation import (
+    aggregate_station_range,
+    partition_filters,
+    store_stats,
+    supports_upsert,
+    upsert_stat_rows,
+)
+from database import bump_dataset_version, get_database_manager, read_dataset_version
+from models import StatsDirtyPartition, WeatherStation, YearlyStationStats
+from prefix_sums import PrefixSumStore
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,90 +52,202 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+ENGINES = ('sql', 'parallel')
+# Station ranges per worker; more ranges than workers evens out uneven stations.
+RANGES_PER_WORKER = 4
+
+
+def compute_and_store_stats(
+    database_url: str = 'sqlite:///weather.db',
+    incremental: bool = False,
+    engine: str = 'sql',
+    workers: int = 1,
+    prefix_sum_dir=None,
+) -> int:
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown analysis engine: {engine!r} "
+            f"(expected one of {', '.join(ENGINES)})"
+        )
+    if workers < 1:
+        raise ValueError('workers must be a positive integer')
+    if engine == 'parallel' and incremental:
+        raise ValueError("Incremental analysis requires engine='sql'")
 
-def compute_and_store_stats(database_url: str = 'sqlite:///weather.db') -> int:
     dbm = get_database_manager(database_url)
     dbm.init_db()
 
-    session = dbm.get_session()
-    try:
-        dialect = dbm.engine.dialect.name
-        if dialect == 'sqlite':
-            year_expr = func.strftime('%Y', WeatherRecord.observation_date)
-        else:
-            year_expr = func.extract('year', WeatherRecord.observation_date)
-
-        avg_max_expr = func.avg(case((WeatherRecord.max_temperature_tenths_celsius != -9999, WeatherRecord.max_temperature_tenths_celsius), else_=None)).label('avg_max_tenths')
-        avg_min_expr = func.avg(case((WeatherRecord.min_temperature_tenths_celsius != -9999, WeatherRecord.min_temperature_tenths_celsius), else_=None)).label('avg_min_tenths')
-        sum_precip_expr = func.sum(case((WeatherRecord.precipitation_tenths_mm != -9999, WeatherRecord.precipitation_tenths_mm), else_=None)).label('sum_precip_tenths')
-
-        query = (
-            session.query(
-                WeatherRecord.station_id.label('station_id'),
-                year_expr.label('year'),
-                avg_max_expr,
-                avg_min_expr,
-                sum_precip_expr,
-            )
-            .group_by(WeatherRecord.station_id, year_expr)
+    if incremental:
+        upsert_count = _recompute_dirty_partitions(dbm)
+    elif engine == 'parallel':
+        upsert_count = _compute_stats_parallel(dbm, database_url, workers)
+    else:
+        upsert_count = _compute_stats_sql(dbm)
+
+    if prefix_sum_dir:
+        with dbm.engine.connect() as conn:
+            version = read_dataset_version(conn)
+        written = PrefixSumStore(prefix_sum_dir).rebuild(dbm.engine, version)
+        logger.info(
+            f'Wrote prefix sums for {written} stations to {prefix_sum_dir} '
+            f'(dataset version {version})'
         )
+    return upsert_count
+
 
+def _compute_stats_sql(dbm) -> int:
+    dirty_table = StatsDirtyPartition.__table__
+    if supports_upsert(dbm.engine):
+        logger.info('Executing set-based stats upsert...')
+    else:
         logger.info('Executing aggregate query...')
-        rows = query.yield_per(1000)
-
-        upsert_count = 0
-        BATCH_SIZE = 500
-
-        for r in rows:
-            year_val = int(r.year) if isinstance(r.year, str) else int(r.year)
-
-            avg_max_tenths = r.avg_max_tenths
-            avg_min_tenths = r.avg_min_tenths
-            sum_precip_tenths = r.sum_precip_tenths
-
-            avg_max_c = (avg_max_tenths / 10.0) if avg_max_tenths is not None else None
-            avg_min_c = (avg_min_tenths / 10.0) if avg_min_tenths is not None else None
-            total_precip_cm = (sum_precip_tenths / 100.0) if sum_precip_tenths is not None else None
-
-            existing = session.query(YearlyStationStats).filter_by(station_id=r.station_id, year=year_val).first()
-            if existing:
-                existing.avg_max_celsius = avg_max_c
-                existing.avg_min_celsius = avg_min_c
-                existing.total_precip_cm = total_precip_cm
-            else:
-                new = YearlyStationStats(
-                    station_id=r.station_id,
-                    year=year_val,
-                    avg_max_celsius=avg_max_c,
-                    avg_min_celsius=avg_min_c,
-                    total_precip_cm=total_precip_cm,
-                )
-                session.add(new)
-            upsert_count += 1
+    with dbm.engine.begin() as conn:
+        upsert_count = store_stats(conn)
+        # A full recompute covers every pending partition as well.
+        conn.execute(delete(dirty_table))
+        bump_dataset_version(conn)
+    logger.info(f'Finished upserting {upsert_count} yearly-station stat rows')
+    return upsert_count
+
+
+def station_ranges(station_pks, parts: int):
+    """Split station ids into at most `parts` contiguous `(first, last)` ranges."""
+    station_pks = np.sort(np.asarray(list(station_pks), dtype=np.int64))
+    chunks = np.array_split(station_pks, min(parts, len(station_pks)) or 1)
+    return [(int(chunk[0]), int(chunk[-1])) for chunk in chunks if len(chunk)]
 
-            if upsert_count % BATCH_SIZE == 0:
-                session.commit()
-                logger.info(f'Committed {upsert_count} stat rows...')
 
-        session.commit()
-        logger.info(f'Finished upserting {upsert_count} yearly-station stat rows')
-        return upsert_count
+def _compute_stats_parallel(dbm, database_url: str, workers: int) -> int:
+    stations_table = WeatherStation.__table__
+    with dbm.engine.connect() as conn:
+        station_pks = conn.execute(select(stations_table.c.id)).scalars().all()
+    ranges = station_ranges(station_pks, workers * RANGES_PER_WORKER)
+    logger.info(
+        f'Aggregating {len(station_pks)} stations in {len(ranges)} ranges '
+        f'with {workers} worker(s)'
+    )
 
-    except Exception:
-        session.rollback()
-        raise
-    finally:
-        session.close()
+    rows = []
+    if workers == 1:
+        for first, last in ranges:
+            rows.extend(aggregate_station_range(database_url, first, last))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(aggregate_station_range, database_url, first, last)
+                for first, last in ranges
+            ]
+            for future in futures:
+                rows.extend(future.result())
+
+    with dbm.engine.begin() as conn:
+        upsert_count = upsert_stat_rows(conn, rows)
+        conn.execute(delete(StatsDirtyPartition.__table__))
+        bump_dataset_version(conn)
+    logger.info(f'Finished upserting {upsert_count} yearly-station stat rows')
+    return upsert_count
+
+
+def _recompute_dirty_partitions(dbm) -> int:
+    dirty_table = StatsDirtyPartition.__table__
+    stats_table = YearlyStationStats.__table__
+    dialect = dbm.engine.dialect.name
+
+    with dbm.engine.connect() as conn:
+        dirty = conn.execute(select(dirty_table.c.station_id, dirty_table.c.year)).all()
+
+    years_by_station = defaultdict(set)
+    for station_pk, year in dirty:
+        years_by_station[station_pk].add(year)
+    logger.info(
+        f'Re-aggregating {len(dirty)} dirty station-years '
+        f'across {len(years_by_station)} stations'
+    )
+
+    upsert_count = 0
+    for station_pk, years in sorted(years_by_station.items()):
+        with dbm.engine.begin() as conn:
+            # Drop the old rows first so a partition that lost all of its
+            # records does not keep stale stats.
+            conn.execute(
+                delete(stats_table).where(
+                    stats_table.c.station_id == station_pk,
+                    stats_table.c.year.in_(years),
+                )
+            )
+            upsert_count += store_stats(
+                conn, partition_filters(dialect, station_pk, years)
+            )
+            conn.execute(
+                delete(dirty_table).where(
+                    dirty_table.c.station_id == station_pk,
+                    dirty_table.c.year.in_(years),
+                )
+            )
+            bump_dataset_version(conn)
+
+    logger.info(f'Finished upserting {upsert_count} yearly-station stat rows')
+    return upsert_count
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Compute yearly per-station stats and store them in DB')
+    parser = argparse.ArgumentParser(
+        description='Compute yearly per-station stats and store them in DB'
+    )
     parser.add_argument('--db', default='sqlite:///weather.db', help='Database URL')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--full',
+        dest='incremental',
+        action='store_false',
+        help='Re-aggregate every station-year (default)',
+    )
+    mode.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        help='Re-aggregate only station-years marked dirty by ingestion',
+    )
+    parser.set_defaults(incremental=False)
+    parser.add_argument(
+        '--engine',
+        choices=ENGINES,
+        default='sql',
+        help='Aggregate with one SQL statement or with NumPy in worker processes '
+        '(default: sql)',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Processes used by the parallel engine (default: 1)',
+    )
+    parser.add_argument(
+        '--prefix-sums',
+        metavar='DIR',
+        default=None,
+        help='Also write per-station prefix sums for /api/weather/aggregate to DIR',
+    )
     args = parser.parse_args()
 
+    if args.engine == 'parallel' and args.incremental:
+        parser.error('--incremental requires --engine sql')
+    if args.workers > 1 and args.engine != 'parallel':
+        parser.error('--workers requires --engine parallel')
+
     start = datetime.now()
-    logger.info('Starting analysis: computing yearly per-station statistics')
-    count = compute_and_store_stats(args.db)
+    kind = 'incremental' if args.incremental else 'full'
+    logger.info(
+        'Starting analysis: computing yearly per-station statistics '
+        f'({kind}, {args.engine} engine)'
+    )
+    count = compute_and_store_stats(
+        args.db,
+        incremental=args.incremental,
+        engine=args.engine,
+        workers=args.workers,
+        prefix_sum_dir=args.prefix_sums,
+    )
     duration = (datetime.now() - start).total_seconds()
     logger.info(f'Analysis complete: {count} rows upserted in {duration:.2f} seconds')
 
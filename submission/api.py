@@ -6,29 +6,529 @@ Usage:
     python -m submission.app
 
 Or embed with `create_app(database_url=...)` for testing.
+
+Set `STATION_CACHE_DIR` (or pass `station_cache_dir`) to serve single-station
+`/api/weather` requests from the memory-mapped files written by
+`station_cache.py` / `ingest_data.py --station-cache`; stations without a
+cache file are read from the database as usual.
+
+Both list endpoints support offset paging (`limit` / `offset`) and keyset
+paging: every response carries `pagination.next_cursor`, an opaque token
+that can be passed back as `cursor` to fetch the following page with an
+index seek instead of skipping `offset` rows. `next_cursor` is null on the
+last page.
+
+`total` chooses how `pagination.total_count` is produced: `exact` (the
+default) counts the matching rows, `estimate` answers from the
+`weather_record_counts` summary kept by ingestion, and `none` skips counting
+(`total_count` is null). `pagination.total_kind` reports which one was used.
+
+Responses of both list endpoints carry an `ETag` derived from the dataset
+version (bumped by every ingestion and analysis transaction) and the
+normalized query parameters. A matching `If-None-Match` gets a 304 without
+a database query, and repeated queries are answered from an in-process LRU
+(`RESPONSE_CACHE_SIZE` entries, 0 disables it); see `response_cache`. The
+version is re-read at most every `DATASET_VERSION_TTL` seconds, so new data
+can take that long to show up.
+
+`/api/weather/export` streams every matching record as NDJSON or CSV from a
+server-side cursor, in `(station, date)` order, so memory use does not grow
+with the result; it is gzip-compressed when the client accepts it.
+
+Station codes are resolved through the `DatabaseManager.station_directory`
+(code <-> primary key, reloaded when the dataset version changes), so the
+queries filter on the integer key without joining `weather_stations`, and an
+unknown code gets an empty result without a query.
+
+Pages are encoded straight from the row tuples (`serialization`), as an
+array of records or, with `format=columnar`, one array per field. JSON
+responses of 1 KB or more are gzip-compressed when the client sends
+`Accept-Encoding: gzip`.
+
+`POST /api/batch` answers the filters of many stations with one query per
+table and returns the results grouped per station.
+
+`/api/weather/aggregate` answers one station's averages / totals over any
+date range from per-station prefix sums (`prefix_sums`): files written by
+`analyze_data.py --prefix-sums DIR` when `PREFIX_SUM_DIR` points at them and
+they match the dataset version, otherwise sums built from the database on
+first use and kept in memory.
 """
 
-from flask import Flask, request, jsonify, current_app
-from datetime import datetime
-from pathlib import Path
+from flask import Flask, Response, request, jsonify, current_app
+from collections import defaultdict, namedtuple
+from datetime import date, datetime
+from functools import wraps
+from itertools import groupby
+import base64
+import binascii
+import csv
+import gzip
+import hashlib
+import io
+import json
 import os
+import zlib
+
+from sqlalchemy import and_, case, func, or_, select, tuple_
+from werkzeug.datastructures import MultiDict
+
+from database import DEFAULT_READ_POOL_SIZE, RECORDS_VERSION_ID, get_database_manager
+from models import WeatherRecord, WeatherRecordCount, YearlyStationStats
+from prefix_sums import PrefixSumIndex
+from response_cache import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_VERSION_TTL,
+    DatasetVersionTracker,
+    ResponseCache,
+)
+from serialization import (
+    FORMATS,
+    STATS_FIELDS,
+    WEATHER_FIELDS,
+    dumps,
+    encode_data,
+    encode_page,
+    series_texts,
+    stats_texts,
+    weather_texts,
+)
+from weather_parser import date_to_day_number, day_number_to_date
+
+
+# Keyset order of each endpoint; a cursor holds the sort key of the last row returned.
+CURSOR_KEYS = {
+    'weather': ('day_number', 'station_id'),
+    'stats': ('station_id', 'year'),
+}
+
+
+def encode_cursor(kind: str, key) -> str:
+    payload = json.dumps([kind, *[int(v) for v in key]], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b'=').decode()
+
+
+def decode_cursor(kind: str, token: str):
+    """The sort key stored in `token`; ValueError unless it is a `kind` cursor."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('malformed cursor') from None
+    if (
+        not isinstance(payload, list)
+        or len(payload) != len(CURSOR_KEYS[kind]) + 1
+        or payload[0] != kind
+        or not all(isinstance(v, int) for v in payload[1:])
+    ):
+        raise ValueError('malformed cursor')
+    return tuple(payload[1:])
+
+
+TOTAL_KINDS = ('exact', 'estimate', 'none')
+
+
+def _tenths(value):
+    return None if value is None else value / 10.0
+
+
+def weather_row(station_code, day_number, max_tenths, min_tenths, precip_tenths):
+    """One `/api/weather` record from raw column values."""
+    day = day_number_to_date(day_number).isoformat()
+    return {
+        'id': f'{station_code}:{day}',
+        'station_id': station_code,
+        'date': day,
+        'max_temperature_celsius': _tenths(max_tenths),
+        'min_temperature_celsius': _tenths(min_tenths),
+        'precipitation_mm': _tenths(precip_tenths),
+    }
+
+
+def parse_day_range(args):
+    """`(first_day, last_day)` from `date` / `start_date` / `end_date` (None = open).
+
+    Raises ValueError with the client-facing message for a malformed date.
+    """
+    first_day = last_day = None
+    for param, is_start, is_end in (
+        ('date', True, True),
+        ('start_date', True, False),
+        ('end_date', False, True),
+    ):
+        value = args.get(param, type=str)
+        if not value:
+            continue
+        try:
+            day = date_to_day_number(datetime.strptime(value, '%Y-%m-%d').date())
+        except ValueError:
+            raise ValueError(f'Invalid {param} format. Use YYYY-MM-DD') from None
+        if is_start:
+            first_day = day if first_day is None else max(first_day, day)
+        if is_end:
+            last_day = day if last_day is None else min(last_day, day)
+    return first_day, last_day
+
+
+def weather_columns():
+    """Column projection behind `weather_row`.
+
+    The station code comes from the station directory.
+    """
+    return (
+        WeatherRecord.station_id,
+        WeatherRecord.day_number,
+        WeatherRecord.max_temperature_tenths_celsius,
+        WeatherRecord.min_temperature_tenths_celsius,
+        WeatherRecord.precipitation_tenths_mm,
+    )
+
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_FIELDS = (
+    'id',
+    'station_id',
+    'date',
+    'max_temperature_celsius',
+    'min_temperature_celsius',
+    'precipitation_mm',
+)
+# Rows fetched from the server-side cursor, and encoded, per chunk.
+EXPORT_CHUNK_ROWS = 5000
+
+
+def export_statement(station_pk=None, first_day=None, last_day=None):
+    """Every matching weather record in primary-key (station, day) order."""
+    stmt = select(*weather_columns())
+    if station_pk is not None:
+        stmt = stmt.where(WeatherRecord.station_id == station_pk)
+    if first_day is not None:
+        stmt = stmt.where(WeatherRecord.day_number >= first_day)
+    if last_day is not None:
+        stmt = stmt.where(WeatherRecord.day_number <= last_day)
+    return stmt.order_by(WeatherRecord.station_id, WeatherRecord.day_number)
+
+
+def page_response(fields, texts, pagination, columnar: bool = False):
+    """A list endpoint's page from text columns (see `serialization`)."""
+    return current_app.response_class(
+        encode_page(fields, texts, pagination, columnar), mimetype='application/json'
+    )
+
+
+def empty_page(
+    fields, limit: int, offset: int, total_kind: str, columnar: bool = False
+):
+    """Response for a filter that matches nothing (an unknown station code)."""
+    total_kind = 'none' if total_kind == 'none' else 'exact'
+    total = None if total_kind == 'none' else 0
+    pagination = {
+        'total_count': total,
+        'total_kind': total_kind,
+        'limit': limit,
+        'offset': offset,
+        'returned': 0,
+        'next_cursor': None,
+    }
+    return page_response(fields, [[] for _ in fields], pagination, columnar)
+
+
+def parse_format(args) -> bool:
+    """True for `format=columnar`; ValueError for an unknown format."""
+    value = args.get('format', default='records', type=str)
+    if value not in FORMATS:
+        raise ValueError(f"Invalid format. Use one of: {', '.join(FORMATS)}")
+    return value == 'columnar'
+
+
+# Responses smaller than this are not worth compressing.
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def gzip_response(response):
+    """Compress a buffered JSON `response` in place when the client accepts gzip."""
+    response.vary.add('Accept-Encoding')
+    if (
+        not request.accept_encodings['gzip']
+        or response.status_code != 200
+        or response.is_streamed
+        or response.mimetype != 'application/json'
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+    body = response.get_data()
+    if len(body) >= GZIP_MIN_BYTES:
+        response.set_data(gzip.compress(body, GZIP_LEVEL, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 
-from database import get_database_manager
-from models import WeatherRecord, WeatherStation, YearlyStationStats
+def weather_rows(rows, station_codes):
+    """`weather_row` dicts for `(station_pk, day_number, max, min, precip)` rows."""
+    return [
+        weather_row(station_codes[station_pk], *values) for station_pk, *values in rows
+    ]
 
 
-def create_app(database_url: str | None = None) -> Flask:
+def ndjson_chunks(pages):
+    for data in pages:
+        yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in data)
+
+
+def csv_chunks(pages):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(EXPORT_FIELDS)
+    for data in pages:
+        writer.writerows(row.values() for row in data)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def gzip_chunks(chunks, level: int = 6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def estimate_weather_total(
+    session, station_pk=None, first_day=None, last_day=None
+) -> int:
+    """Matching `weather_records` rows according to `weather_record_counts`.
+
+    Whole years inside the date range contribute their stored count; years cut
+    by the range contribute in proportion to the days they overlap.
+    """
+    counts = WeatherRecordCount.__table__
+    stmt = session.query(counts.c.year, func.sum(counts.c.row_count)).group_by(
+        counts.c.year
+    )
+    if station_pk is not None:
+        stmt = stmt.filter(counts.c.station_id == station_pk)
+    first_year = day_number_to_date(first_day).year if first_day is not None else None
+    last_year = day_number_to_date(last_day).year if last_day is not None else None
+    if first_year is not None:
+        stmt = stmt.filter(counts.c.year >= first_year)
+    if last_year is not None:
+        stmt = stmt.filter(counts.c.year <= last_year)
+
+    total = 0.0
+    for year, rows in stmt.all():
+        year_start = date_to_day_number(date(year, 1, 1))
+        year_end = date_to_day_number(date(year + 1, 1, 1))
+        start = year_start if first_day is None else max(year_start, first_day)
+        end = year_end if last_day is None else min(year_end, last_day + 1)
+        total += rows * max(end - start, 0) / (year_end - year_start)
+    return round(total)
+
+
+def estimate_stats_total(
+    session, station_pk=None, first_year=None, last_year=None
+) -> int:
+    """Matching `yearly_station_stats` rows: one per (station, year) with records."""
+    counts = WeatherRecordCount.__table__
+    stmt = session.query(func.count()).select_from(counts)
+    if station_pk is not None:
+        stmt = stmt.filter(counts.c.station_id == station_pk)
+    if first_year is not None:
+        stmt = stmt.filter(counts.c.year >= first_year)
+    if last_year is not None:
+        stmt = stmt.filter(counts.c.year <= last_year)
+    return stmt.scalar()
+
+
+BATCH_KINDS = ('weather', 'stats')
+BATCH_MAX_QUERIES = 500
+# Upper bound on the sum of the per-station limits of one batch.
+BATCH_MAX_ROWS = 100000
+
+BatchQuery = namedtuple(
+    'BatchQuery', ('station_code', 'limit', 'day_range', 'year_range')
+)
+
+
+def parse_batch(payload):
+    """`(kinds, queries, columnar)` from a `/api/batch` body.
+
+    Raises ValueError with the client-facing message.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('queries'), list):
+        raise ValueError('Body must be a JSON object with a "queries" list')
+    kinds = payload.get('include', list(BATCH_KINDS))
+    if not isinstance(kinds, list) or not kinds or not set(kinds) <= set(BATCH_KINDS):
+        raise ValueError(f"include must list some of: {', '.join(BATCH_KINDS)}")
+    if len(payload['queries']) > BATCH_MAX_QUERIES:
+        raise ValueError(f'At most {BATCH_MAX_QUERIES} queries per batch')
+    columnar = parse_format(MultiDict({'format': payload.get('format', 'records')}))
+
+    queries = []
+    seen = set()
+    for i, item in enumerate(payload['queries']):
+        if (
+            not isinstance(item, dict)
+            or not isinstance(item.get('station_id'), str)
+            or not item['station_id']
+        ):
+            raise ValueError(f'queries[{i}]: station_id is required')
+        if item['station_id'] in seen:
+            raise ValueError(
+                f'queries[{i}]: station {item["station_id"]} is listed twice'
+            )
+        seen.add(item['station_id'])
+        args = MultiDict(
+            {
+                **{
+                    k: v
+                    for k, v in payload.items()
+                    if k not in ('queries', 'include', 'format')
+                },
+                **item,
+            }
+        )
+        limit = min(max(1, args.get('limit', default=100, type=int)), 10000)
+        try:
+            day_range = parse_day_range(args)
+        except ValueError as e:
+            raise ValueError(f'queries[{i}]: {e}') from None
+        year, start_year, end_year = (
+            args.get(name, type=int) for name in ('year', 'start_year', 'end_year')
+        )
+        year_range = (
+            max(filter(None, (year, start_year)), default=None),
+            min(filter(None, (year, end_year)), default=None),
+        )
+        queries.append(BatchQuery(item['station_id'], limit, day_range, year_range))
+    if sum(q.limit for q in queries) > BATCH_MAX_ROWS:
+        raise ValueError(
+            f'The per-station limits add up to more than {BATCH_MAX_ROWS} rows; '
+            'lower limit or split the batch'
+        )
+    return kinds, queries, columnar
+
+
+def batch_select(columns, station_column, order_column, ranges, limits):
+    """The first `limits[station pk]` rows of many stations, plus one to flag more.
+
+    `ranges` maps `(low, high)` bounds on `order_column` (None = open) to the
+    station pks that share them, so stations with the same filter share one
+    `IN` list. Rows come back in (station, `order_column`) order.
+    """
+    conditions = []
+    for (low, high), station_pks in ranges.items():
+        condition = [station_column.in_(station_pks)]
+        if low is not None:
+            condition.append(order_column >= low)
+        if high is not None:
+            condition.append(order_column <= high)
+        conditions.append(and_(*condition))
+    row_number = (
+        func.row_number()
+        .over(partition_by=station_column, order_by=order_column)
+        .label('row_number')
+    )
+    ranked = select(*columns, row_number).where(or_(*conditions)).subquery()
+    station, order = ranked.c[station_column.name], ranked.c[order_column.name]
+    distinct_limits = set(limits.values())
+    cap = (
+        distinct_limits.pop()
+        if len(distinct_limits) == 1
+        else case(limits, value=station)
+    )
+    return (
+        select(*(ranked.c[column.name] for column in columns))
+        .where(ranked.c.row_number <= cap + 1)
+        .order_by(station, order)
+    )
+
+
+def create_app(database_url: str | None = None, station_cache_dir: str | None = None,
+               response_cache_size: int | None = None, version_ttl: float | None = None,
+               prefix_sum_dir: str | None = None, read_url: str | None = None,
+               read_pool_size: int | None = None) -> Flask:
     app = Flask(__name__)
 
     db_url = database_url or os.environ.get('DATABASE_URL') or 'sqlite:///weather.db'
+    cache_dir = station_cache_dir or os.environ.get('STATION_CACHE_DIR') or None
+    if response_cache_size is None:
+        response_cache_size = int(
+            os.environ.get('RESPONSE_CACHE_SIZE', DEFAULT_MAX_ENTRIES)
+        )
+    if version_ttl is None:
+        version_ttl = float(os.environ.get('DATASET_VERSION_TTL', DEFAULT_VERSION_TTL))
     app.config['DATABASE_URL'] = db_url
-    app.config['DB_MANAGER'] = get_database_manager(db_url)
+    app.config['DB_MANAGER'] = get_database_manager(
+        db_url,
+        cache_dir,
+        read_url=read_url or os.environ.get('DATABASE_READ_URL') or None,
+        read_pool_size=read_pool_size
+        or int(os.environ.get('DB_READ_POOL_SIZE', DEFAULT_READ_POOL_SIZE)),
+        pool_pre_ping=os.environ.get('DB_POOL_PRE_PING', '').lower()
+        in ('1', 'true', 'yes'),
+    )
+    app.config['DATASET_VERSION'] = DatasetVersionTracker(
+        app.config['DB_MANAGER'].read_engine, version_ttl
+    )
+    # Station cache files follow the records alone, so analysis runs do not
+    # invalidate them.
+    app.config['RECORDS_VERSION'] = DatasetVersionTracker(
+        app.config['DB_MANAGER'].read_engine, version_ttl, RECORDS_VERSION_ID
+    )
+    app.config['RESPONSE_CACHE'] = ResponseCache(response_cache_size)
+    app.config['PREFIX_SUMS'] = PrefixSumIndex(
+        app.config['DB_MANAGER'].read_engine,
+        prefix_sum_dir or os.environ.get('PREFIX_SUM_DIR') or None,
+    )
+
+    def versioned(view):
+        """Serve `view` with a dataset-version ETag, 304s and the response LRU."""
+        @wraps(view)
+        def wrapper():
+            version = current_app.config['DATASET_VERSION'].current()
+            if version is None:
+                return view()
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            etag = f'{version}-{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}'
+            # gzip and identity bodies are separate representations (and cache entries).
+            if request.accept_encodings['gzip']:
+                key, etag = (*key, 'gzip'), f'{etag}-gzip'
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                cache = current_app.config['RESPONSE_CACHE']
+                body = cache.get(key, version)
+                if body is not None:
+                    response = current_app.response_class(
+                        body, mimetype='application/json'
+                    )
+                    if body[:2] == GZIP_MAGIC:
+                        response.headers['Content-Encoding'] = 'gzip'
+                else:
+                    response = current_app.make_response(view())
+                    if response.status_code != 200:
+                        return response
+                    gzip_response(response)
+                    cache.put(key, version, response.get_data())
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
 
+    @app.after_request
+    def compress(response):
+        return gzip_response(response)
 
     @app.route('/api/weather', methods=['GET'])
+    @versioned
     def get_weather():
         dbm = current_app.config['DB_MANAGER']
-        session = dbm.get_session()
+        session = dbm.get_read_session()
         """GET /api/weather
 
         Returns paginated weather records. Supports filtering by station and date range.
@@ -38,75 +538,150 @@ def create_app(database_url: str | None = None) -> Flask:
         - date: YYYY-MM-DD exact date
         - start_date / end_date: YYYY-MM-DD range
         - limit / offset: pagination
+        - cursor: `next_cursor` of the previous page (keyset pagination; offset
+          is ignored)
+        - total: exact (default) | estimate | none
         """
         try:
             station_param = request.args.get('station_id', type=str)
-            date_str = request.args.get('date', type=str)
-            start_date_str = request.args.get('start_date', type=str)
-            end_date_str = request.args.get('end_date', type=str)
             limit = request.args.get('limit', default=100, type=int)
             offset = request.args.get('offset', default=0, type=int)
+            cursor_param = request.args.get('cursor', type=str)
+            total_kind = request.args.get('total', default='exact', type=str)
 
             limit = min(max(1, limit), 10000)
+            if total_kind not in TOTAL_KINDS:
+                return (
+                    jsonify(
+                        {
+                            'error': 'Invalid total. Use one of: '
+                            + ', '.join(TOTAL_KINDS)
+                        }
+                    ),
+                    400,
+                )
+            try:
+                after = decode_cursor('weather', cursor_param) if cursor_param else None
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
 
-            query = session.query(WeatherRecord).join(WeatherStation)
+            try:
+                first_day, last_day = parse_day_range(request.args)
+                columnar = parse_format(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
+            version = current_app.config['DATASET_VERSION'].current()
+            station_pk = None
             if station_param:
-                # station_param might be station_id string (e.g., 'USC00110072')
-                query = query.filter(WeatherStation.station_id == station_param)
-
-            if date_str:
-                try:
-                    d = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    query = query.filter(WeatherRecord.observation_date == d)
-                except ValueError:
-                    return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
-
-            if start_date_str:
-                try:
-                    s = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    query = query.filter(WeatherRecord.observation_date >= s)
-                except ValueError:
-                    return jsonify({'error': 'Invalid start_date format. Use YYYY-MM-DD'}), 400
-
-            if end_date_str:
-                try:
-                    e = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    query = query.filter(WeatherRecord.observation_date <= e)
-                except ValueError:
-                    return jsonify({'error': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
-
-            total = query.count()
-            rows = query.order_by(WeatherRecord.observation_date).offset(offset).limit(limit).all()
-
-            data = []
-            for r in rows:
-                data.append({
-                    'id': r.id,
-                    'station_id': r.station.station_id,
-                    'date': r.observation_date.isoformat(),
-                    'max_temperature_celsius': r.max_temperature_celsius,
-                    'min_temperature_celsius': r.min_temperature_celsius,
-                    'precipitation_mm': r.precipitation_mm,
-                })
-
-            return jsonify({'data': data, 'pagination': {'total_count': total, 'limit': limit, 'offset': offset, 'returned': len(data)}})
+                station_pk = dbm.station_directory.pk(station_param, version)
+                if station_pk is None:
+                    return empty_page(
+                        WEATHER_FIELDS, limit, offset, total_kind, columnar
+                    )
+
+            series = None
+            if station_param and dbm.station_cache:
+                series = dbm.station_cache.get(
+                    station_param, current_app.config['RECORDS_VERSION'].current()
+                )
+            if series is not None:
+                # Cached station: binary search the day range and slice the mapped
+                # columns.
+                start, stop = series.day_range(first_day, last_day)
+                if after is not None:
+                    page_start = min(max(start, series.position_after(*after)), stop)
+                else:
+                    page_start = min(start + max(offset, 0), stop)
+                page_stop = min(page_start + limit, stop)
+                texts = series_texts(station_param, series.slice(page_start, page_stop))
+                next_cursor = None
+                if page_stop < stop:
+                    next_cursor = encode_cursor(
+                        'weather',
+                        (series.day_numbers[page_stop - 1], series.station_pk),
+                    )
+                # The exact total is free here, so `estimate` gets it too.
+                if total_kind == 'estimate':
+                    total_kind = 'exact'
+                total = stop - start if total_kind == 'exact' else None
+                pagination = {
+                    'total_count': total,
+                    'total_kind': total_kind,
+                    'limit': limit,
+                    'offset': offset,
+                    'returned': page_stop - page_start,
+                    'next_cursor': next_cursor,
+                }
+                return page_response(WEATHER_FIELDS, texts, pagination, columnar)
+
+            # Plain column tuples filtered on the integer key; station codes come
+            # from the station directory, so there is no join and no entity hydration.
+            query = session.query(*weather_columns())
+
+            if station_pk is not None:
+                query = query.filter(WeatherRecord.station_id == station_pk)
+            if first_day is not None:
+                query = query.filter(WeatherRecord.day_number >= first_day)
+            if last_day is not None:
+                query = query.filter(WeatherRecord.day_number <= last_day)
+
+            if total_kind == 'exact':
+                total = query.count()
+            elif total_kind == 'estimate':
+                total = estimate_weather_total(session, station_pk, first_day, last_day)
+            else:
+                total = None
+            query = query.order_by(WeatherRecord.day_number, WeatherRecord.station_id)
+            if after is not None:
+                query = query.filter(
+                    tuple_(WeatherRecord.day_number, WeatherRecord.station_id)
+                    > tuple_(*after)
+                )
+            else:
+                query = query.offset(offset)
+            # One extra row tells whether there is a next page.
+            rows = query.limit(limit + 1).all()
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(
+                    'weather', (rows[-1].day_number, rows[-1].station_id)
+                )
+
+            texts = weather_texts(
+                rows,
+                dbm.station_directory.code_map(version, {r.station_id for r in rows}),
+            )
+            pagination = {
+                'total_count': total,
+                'total_kind': total_kind,
+                'limit': limit,
+                'offset': offset,
+                'returned': len(rows),
+                'next_cursor': next_cursor,
+            }
+            return page_response(WEATHER_FIELDS, texts, pagination, columnar)
         finally:
             session.close()
 
-
     @app.route('/api/weather/stats', methods=['GET'])
+    @versioned
     def get_weather_stats():
         dbm = current_app.config['DB_MANAGER']
-        session = dbm.get_session()
+        session = dbm.get_read_session()
         """GET /api/weather/stats
 
-        Returns paginated yearly per-station statistics. Supports filtering by station and year range.
+        Returns paginated yearly per-station statistics. Supports filtering by
+        station and year range.
 
         Query parameters:
         - station_id: station code (string)
         - year / start_year / end_year: integer year filters
         - limit / offset: pagination
+        - cursor: `next_cursor` of the previous page (keyset pagination; offset
+          is ignored)
+        - total: exact (default) | estimate | none
         """
         try:
             station_param = request.args.get('station_id', type=str)
@@ -115,13 +690,46 @@ def create_app(database_url: str | None = None) -> Flask:
             end_year = request.args.get('end_year', type=int)
             limit = request.args.get('limit', default=100, type=int)
             offset = request.args.get('offset', default=0, type=int)
+            cursor_param = request.args.get('cursor', type=str)
+            total_kind = request.args.get('total', default='exact', type=str)
 
             limit = min(max(1, limit), 10000)
+            if total_kind not in TOTAL_KINDS:
+                return (
+                    jsonify(
+                        {
+                            'error': 'Invalid total. Use one of: '
+                            + ', '.join(TOTAL_KINDS)
+                        }
+                    ),
+                    400,
+                )
+            try:
+                after = decode_cursor('stats', cursor_param) if cursor_param else None
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            try:
+                columnar = parse_format(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
-            query = session.query(YearlyStationStats).join(WeatherStation)
-
+            version = current_app.config['DATASET_VERSION'].current()
+            station_pk = None
             if station_param:
-                query = query.filter(WeatherStation.station_id == station_param)
+                station_pk = dbm.station_directory.pk(station_param, version)
+                if station_pk is None:
+                    return empty_page(STATS_FIELDS, limit, offset, total_kind, columnar)
+
+            query = session.query(
+                YearlyStationStats.station_id,
+                YearlyStationStats.year,
+                YearlyStationStats.avg_max_celsius,
+                YearlyStationStats.avg_min_celsius,
+                YearlyStationStats.total_precip_cm,
+            )
+
+            if station_pk is not None:
+                query = query.filter(YearlyStationStats.station_id == station_pk)
             if year:
                 query = query.filter(YearlyStationStats.year == year)
             if start_year:
@@ -129,44 +737,391 @@ def create_app(database_url: str | None = None) -> Flask:
             if end_year:
                 query = query.filter(YearlyStationStats.year <= end_year)
 
-            total = query.count()
-            rows = query.order_by(YearlyStationStats.station_id, YearlyStationStats.year).offset(offset).limit(limit).all()
-
-            data = []
-            for r in rows:
-                # translate station PK to station_id string
-                station_row = session.query(WeatherStation).filter_by(id=r.station_id).first()
-                station_code = station_row.station_id if station_row else None
-                data.append({
-                    'station_id': station_code,
-                    'year': int(r.year),
-                    'avg_max_celsius': r.avg_max_celsius,
-                    'avg_min_celsius': r.avg_min_celsius,
-                    'total_precip_cm': r.total_precip_cm,
-                })
-
-            return jsonify({'data': data, 'pagination': {'total_count': total, 'limit': limit, 'offset': offset, 'returned': len(data)}})
+            if total_kind == 'exact':
+                total = query.count()
+            elif total_kind == 'estimate':
+                first_year = max(filter(None, (year, start_year)), default=None)
+                last_year = min(filter(None, (year, end_year)), default=None)
+                total = estimate_stats_total(session, station_pk, first_year, last_year)
+            else:
+                total = None
+            query = query.order_by(
+                YearlyStationStats.station_id, YearlyStationStats.year
+            )
+            if after is not None:
+                query = query.filter(
+                    tuple_(YearlyStationStats.station_id, YearlyStationStats.year)
+                    > tuple_(*after)
+                )
+            else:
+                query = query.offset(offset)
+            rows = query.limit(limit + 1).all()
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(
+                    'stats', (rows[-1].station_id, rows[-1].year)
+                )
+
+            texts = stats_texts(
+                rows,
+                dbm.station_directory.code_map(version, {r.station_id for r in rows}),
+            )
+            pagination = {
+                'total_count': total,
+                'total_kind': total_kind,
+                'limit': limit,
+                'offset': offset,
+                'returned': len(rows),
+                'next_cursor': next_cursor,
+            }
+            return page_response(STATS_FIELDS, texts, pagination, columnar)
         finally:
             session.close()
 
+    @app.route('/api/weather/aggregate', methods=['GET'])
+    @versioned
+    def aggregate_weather():
+        """GET /api/weather/aggregate
+
+        Averages and totals of one station's records over a date range, from
+        prefix sums.
+
+        Query parameters:
+        - station_id: station code (required)
+        - date / start_date / end_date: YYYY-MM-DD range (open ends cover the
+          whole series)
+        """
+        station_param = request.args.get('station_id', type=str)
+        if not station_param:
+            return jsonify({'error': 'station_id is required'}), 400
+        try:
+            first_day, last_day = parse_day_range(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        version = current_app.config['DATASET_VERSION'].current()
+        station_pk = current_app.config['DB_MANAGER'].station_directory.pk(
+            station_param, version
+        )
+        if station_pk is None:
+            return jsonify({'error': f'Unknown station: {station_param}'}), 404
+        sums = current_app.config['PREFIX_SUMS'].get(station_param, station_pk, version)
+        (
+            record_count,
+            (avg_max, max_count),
+            (avg_min, min_count),
+            (total_precip, precip_count),
+        ) = sums.aggregate(first_day, last_day)
+        return jsonify(
+            {
+                'station_id': station_param,
+                'start_date': (
+                    day_number_to_date(first_day).isoformat()
+                    if first_day is not None
+                    else None
+                ),
+                'end_date': (
+                    day_number_to_date(last_day).isoformat()
+                    if last_day is not None
+                    else None
+                ),
+                'record_count': record_count,
+                'avg_max_celsius': avg_max,
+                'avg_min_celsius': avg_min,
+                'total_precip_cm': total_precip,
+                'valid_counts': {
+                    'max_temperature': max_count,
+                    'min_temperature': min_count,
+                    'precipitation': precip_count,
+                },
+            }
+        )
+
+    @app.route('/api/weather/export', methods=['GET'])
+    def export_weather():
+        """GET /api/weather/export
+
+        Streams every matching weather record; nothing is buffered beyond one chunk.
+
+        Query parameters:
+        - station_id, date, start_date / end_date: as for /api/weather
+        - format: ndjson (default) | csv
+        Sent gzip-compressed when the request has `Accept-Encoding: gzip`.
+        """
+        dbm = current_app.config['DB_MANAGER']
+        station_param = request.args.get('station_id', type=str)
+        export_format = request.args.get('format', default='ndjson', type=str)
+        if export_format not in EXPORT_FORMATS:
+            return (
+                jsonify(
+                    {
+                        'error': 'Invalid format. Use one of: '
+                        + ', '.join(EXPORT_FORMATS)
+                    }
+                ),
+                400,
+            )
+        try:
+            first_day, last_day = parse_day_range(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        version = current_app.config['DATASET_VERSION'].current()
+        station_pk = None
+        if station_param:
+            station_pk = dbm.station_directory.pk(station_param, version)
+        encode = ndjson_chunks if export_format == 'ndjson' else csv_chunks
+
+        def pages():
+            # The connection lives as long as the response; closing the
+            # generator (e.g. the client went away) releases it.
+            with dbm.read_engine.connect() as conn:
+                result = conn.execution_options(yield_per=EXPORT_CHUNK_ROWS).execute(
+                    export_statement(station_pk, first_day, last_day)
+                )
+                for rows in result.partitions():
+                    yield weather_rows(
+                        rows,
+                        dbm.station_directory.code_map(
+                            version, {r.station_id for r in rows}
+                        ),
+                    )
+
+        # An unknown station exports nothing (the CSV header only) without a query.
+        body = encode(
+            pages() if station_pk is not None or not station_param else iter(())
+        )
+        headers = {'Vary': 'Accept-Encoding'}
+        if request.accept_encodings['gzip']:
+            body = gzip_chunks(body)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(body, mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
+    @app.route('/api/batch', methods=['POST'])
+    def batch():
+        """POST /api/batch
+
+        Weather records and/or yearly stats of many stations in one request,
+        with one query per table. Body:
+
+            {"queries": [{"station_id": ..., "start_date": ..., "end_year": ...,
+                          "limit": ...}, ...],
+             "include": ["weather", "stats"], "limit": 100,
+             "format": "records" | "columnar"}
+
+        Each query takes the filters of /api/weather and /api/weather/stats;
+        top-level filters and `limit` are defaults for every query. Results
+        come back in query order, grouped per station, with up to `limit`
+        rows per station and table and a `next_cursor` for the single-station
+        endpoints when there are more.
+        """
+        dbm = current_app.config['DB_MANAGER']
+        try:
+            kinds, queries, columnar = parse_batch(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        version = current_app.config['DATASET_VERSION'].current()
+        station_pks = {
+            q.station_code: dbm.station_directory.pk(q.station_code, version)
+            for q in queries
+        }
+        known = [q for q in queries if station_pks[q.station_code] is not None]
+        limits = {station_pks[q.station_code]: q.limit for q in known}
+        tables = {
+            'weather': (
+                weather_columns(),
+                WeatherRecord.station_id,
+                WeatherRecord.day_number,
+                'day_range',
+                WEATHER_FIELDS,
+                weather_texts,
+            ),
+            'stats': (
+                (
+                    YearlyStationStats.station_id,
+                    YearlyStationStats.year,
+                    YearlyStationStats.avg_max_celsius,
+                    YearlyStationStats.avg_min_celsius,
+                    YearlyStationStats.total_precip_cm,
+                ),
+                YearlyStationStats.station_id,
+                YearlyStationStats.year,
+                'year_range',
+                STATS_FIELDS,
+                stats_texts,
+            ),
+        }
+
+        def page_text(fields, texts=None, returned=0, next_cursor=None):
+            data = encode_data(fields, texts or [[] for _ in fields], columnar)
+            cursor = dumps(next_cursor)
+            return f'{{"data":{data},"returned":{returned},"next_cursor":{cursor}}}'
+
+        # station code -> kind -> JSON text of its page
+        pages = {
+            q.station_code: {kind: page_text(tables[kind][4]) for kind in kinds}
+            for q in queries
+        }
+
+        session = dbm.get_read_session()
+        try:
+            for kind in kinds if known else ():
+                columns, station_column, order_column, range_field, fields, to_texts = (
+                    tables[kind]
+                )
+                ranges = defaultdict(list)
+                for q in known:
+                    ranges[getattr(q, range_field)].append(station_pks[q.station_code])
+                rows = session.execute(
+                    batch_select(columns, station_column, order_column, ranges, limits)
+                ).all()
+                codes = dbm.station_directory.code_map(version, {r[0] for r in rows})
+                for station_pk, station_rows in groupby(rows, key=lambda r: r[0]):
+                    station_rows = list(station_rows)
+                    next_cursor = None
+                    if len(station_rows) > limits[station_pk]:
+                        station_rows = station_rows[:limits[station_pk]]
+                        key = (
+                            (station_rows[-1][1], station_pk)
+                            if kind == 'weather'
+                            else (station_pk, station_rows[-1][1])
+                        )
+                        next_cursor = encode_cursor(kind, key)
+                    pages[codes[station_pk]][kind] = page_text(
+                        fields,
+                        to_texts(station_rows, codes),
+                        len(station_rows),
+                        next_cursor,
+                    )
+        finally:
+            session.close()
+
+        results = ','.join(
+            f'{{"station_id":{dumps(q.station_code)}'
+            + ''.join(
+                f',"{kind}":{pages[q.station_code][kind]}'
+                for kind in pages[q.station_code]
+            )
+            + '}'
+            for q in queries
+        )
+        unknown = [
+            q.station_code for q in queries if station_pks[q.station_code] is None
+        ]
+        body = f'{{"results":[{results}],"unknown_stations":{dumps(unknown)}}}'
+        return current_app.response_class(body.encode(), mimetype='application/json')
 
     @app.route('/openapi.json')
     def openapi_json():
-        # Provide a more detailed OpenAPI spec so Swagger UI shows parameters and response shapes.
+        # Provide a more detailed OpenAPI spec so Swagger UI shows parameters and
+        # response shapes.
+        # Paging parameters shared by the list endpoints.
+        page_params = [
+            {
+                'name': 'cursor',
+                'in': 'query',
+                'schema': {'type': 'string'},
+                'description': 'pagination.next_cursor of the previous page',
+            },
+            {
+                'name': 'total',
+                'in': 'query',
+                'schema': {'type': 'string', 'enum': list(TOTAL_KINDS)},
+                'description': 'How pagination.total_count is computed (default exact)',
+            },
+            {
+                'name': 'format',
+                'in': 'query',
+                'schema': {'type': 'string', 'enum': list(FORMATS)},
+                'description': 'records (default) or columnar (one array per field)',
+            },
+        ]
+        record_id = {'type': 'string', 'description': '<station_id>:<date>'}
+        date = {'type': 'string', 'format': 'date'}
+        batch_query = {
+            'type': 'object',
+            'required': ['station_id'],
+            'properties': {
+                'station_id': {'type': 'string'},
+                'date': date,
+                'start_date': date,
+                'end_date': date,
+                'year': {'type': 'integer'},
+                'start_year': {'type': 'integer'},
+                'end_year': {'type': 'integer'},
+                'limit': {
+                    'type': 'integer',
+                    'description': 'Rows per station and table (default 100)',
+                },
+            },
+        }
+        batch_body = {
+            'type': 'object',
+            'required': ['queries'],
+            'properties': {
+                'queries': {
+                    'type': 'array',
+                    'maxItems': BATCH_MAX_QUERIES,
+                    'items': batch_query,
+                },
+                'include': {
+                    'type': 'array',
+                    'items': {'type': 'string', 'enum': list(BATCH_KINDS)},
+                },
+                'format': {'type': 'string', 'enum': list(FORMATS)},
+                'limit': {
+                    'type': 'integer',
+                    'description': 'Default per-station limit',
+                },
+            },
+        }
         spec = {
             'openapi': '3.0.0',
-            'info': {'title': 'Weather API', 'version': '1.0', 'description': 'Weather and crop-yield API'},
+            'info': {
+                'title': 'Weather API',
+                'version': '1.0',
+                'description': 'Weather and crop-yield API',
+            },
             'paths': {
                 '/api/weather': {
                     'get': {
                         'summary': 'List weather records',
                         'parameters': [
-                            {'name': 'station_id', 'in': 'query', 'schema': {'type': 'string'}, 'description': 'Station code'},
-                            {'name': 'date', 'in': 'query', 'schema': {'type': 'string', 'format': 'date'}, 'description': 'Exact date YYYY-MM-DD'},
-                            {'name': 'start_date', 'in': 'query', 'schema': {'type': 'string', 'format': 'date'}},
-                            {'name': 'end_date', 'in': 'query', 'schema': {'type': 'string', 'format': 'date'}},
-                            {'name': 'limit', 'in': 'query', 'schema': {'type': 'integer'}},
-                            {'name': 'offset', 'in': 'query', 'schema': {'type': 'integer'}},
+                            {
+                                'name': 'station_id',
+                                'in': 'query',
+                                'schema': {'type': 'string'},
+                                'description': 'Station code',
+                            },
+                            {
+                                'name': 'date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                                'description': 'Exact date YYYY-MM-DD',
+                            },
+                            {
+                                'name': 'start_date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                            },
+                            {
+                                'name': 'end_date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                            },
+                            {
+                                'name': 'limit',
+                                'in': 'query',
+                                'schema': {'type': 'integer'},
+                            },
+                            {
+                                'name': 'offset',
+                                'in': 'query',
+                                'schema': {'type': 'integer'},
+                            },
+                            *page_params,
                         ],
                         'responses': {
                             '200': {
@@ -181,34 +1136,239 @@ def create_app(database_url: str | None = None) -> Flask:
                                                     'items': {
                                                         'type': 'object',
                                                         'properties': {
-                                                            'id': {'type': 'integer'},
-                                                            'station_id': {'type': 'string'},
-                                                            'date': {'type': 'string', 'format': 'date'},
-                                                            'max_temperature_celsius': {'type': ['number', 'null']},
-                                                            'min_temperature_celsius': {'type': ['number', 'null']},
-                                                            'precipitation_mm': {'type': ['number', 'null']},
-                                                        }
-                                                    }
+                                                            'id': record_id,
+                                                            'station_id': {
+                                                                'type': 'string'
+                                                            },
+                                                            'date': {
+                                                                'type': 'string',
+                                                                'format': 'date',
+                                                            },
+                                                            'max_temperature_celsius': {
+                                                                'type': [
+                                                                    'number',
+                                                                    'null',
+                                                                ]
+                                                            },
+                                                            'min_temperature_celsius': {
+                                                                'type': [
+                                                                    'number',
+                                                                    'null',
+                                                                ]
+                                                            },
+                                                            'precipitation_mm': {
+                                                                'type': [
+                                                                    'number',
+                                                                    'null',
+                                                                ]
+                                                            },
+                                                        },
+                                                    },
                                                 },
-                                                'pagination': {'type': 'object'}
-                                            }
+                                                'pagination': {'type': 'object'},
+                                            },
                                         }
                                     }
+                                },
+                            }
+                        },
+                    }
+                },
+                '/api/weather/aggregate': {
+                    'get': {
+                        'summary': (
+                            "Averages and totals of one station's records "
+                            'over a date range'
+                        ),
+                        'parameters': [
+                            {
+                                'name': 'station_id',
+                                'in': 'query',
+                                'required': True,
+                                'schema': {'type': 'string'},
+                                'description': 'Station code',
+                            },
+                            {
+                                'name': 'date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                                'description': 'Exact date YYYY-MM-DD',
+                            },
+                            {
+                                'name': 'start_date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                            },
+                            {
+                                'name': 'end_date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                            },
+                        ],
+                        'responses': {
+                            '200': {
+                                'description': (
+                                    'Aggregates over the valid (non-missing) '
+                                    'observations in the range'
+                                ),
+                                'content': {
+                                    'application/json': {
+                                        'schema': {
+                                            'type': 'object',
+                                            'properties': {
+                                                'station_id': {'type': 'string'},
+                                                'start_date': {
+                                                    'type': ['string', 'null'],
+                                                    'format': 'date',
+                                                },
+                                                'end_date': {
+                                                    'type': ['string', 'null'],
+                                                    'format': 'date',
+                                                },
+                                                'record_count': {'type': 'integer'},
+                                                'avg_max_celsius': {
+                                                    'type': ['number', 'null']
+                                                },
+                                                'avg_min_celsius': {
+                                                    'type': ['number', 'null']
+                                                },
+                                                'total_precip_cm': {
+                                                    'type': ['number', 'null']
+                                                },
+                                                'valid_counts': {'type': 'object'},
+                                            },
+                                        }
+                                    }
+                                },
+                            },
+                            '404': {'description': 'Unknown station'},
+                        },
+                    }
+                },
+                '/api/batch': {
+                    'post': {
+                        'summary': (
+                            'Weather records and yearly stats of many '
+                            'stations, grouped per station'
+                        ),
+                        'requestBody': {
+                            'required': True,
+                            'content': {
+                                'application/json': {
+                                    'schema': batch_body
                                 }
+                            },
+                        },
+                        'responses': {
+                            '200': {
+                                'description': 'One result per query, in query order',
+                                'content': {
+                                    'application/json': {
+                                        'schema': {
+                                            'type': 'object',
+                                            'properties': {
+                                                'results': {
+                                                    'type': 'array',
+                                                    'items': {'type': 'object'},
+                                                },
+                                                'unknown_stations': {
+                                                    'type': 'array',
+                                                    'items': {'type': 'string'},
+                                                },
+                                            },
+                                        }
+                                    }
+                                },
+                            },
+                            '400': {'description': 'Malformed batch'},
+                        },
+                    }
+                },
+                '/api/weather/export': {
+                    'get': {
+                        'summary': 'Stream all matching weather records',
+                        'parameters': [
+                            {
+                                'name': 'station_id',
+                                'in': 'query',
+                                'schema': {'type': 'string'},
+                                'description': 'Station code',
+                            },
+                            {
+                                'name': 'date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                                'description': 'Exact date YYYY-MM-DD',
+                            },
+                            {
+                                'name': 'start_date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                            },
+                            {
+                                'name': 'end_date',
+                                'in': 'query',
+                                'schema': {'type': 'string', 'format': 'date'},
+                            },
+                            {
+                                'name': 'format',
+                                'in': 'query',
+                                'schema': {
+                                    'type': 'string',
+                                    'enum': list(EXPORT_FORMATS),
+                                },
+                                'description': 'ndjson (default) or csv',
+                            },
+                        ],
+                        'responses': {
+                            '200': {
+                                'description': (
+                                    'One record per line, ordered by station and '
+                                    'date (gzip with Accept-Encoding: gzip)'
+                                ),
+                                'content': {
+                                    media_type: {'schema': {'type': 'string'}}
+                                    for media_type in EXPORT_FORMATS.values()
+                                },
                             }
-                        }
+                        },
                     }
                 },
                 '/api/weather/stats': {
                     'get': {
                         'summary': 'Yearly per-station statistics',
                         'parameters': [
-                            {'name': 'station_id', 'in': 'query', 'schema': {'type': 'string'}},
-                            {'name': 'year', 'in': 'query', 'schema': {'type': 'integer'}},
-                            {'name': 'start_year', 'in': 'query', 'schema': {'type': 'integer'}},
-                            {'name': 'end_year', 'in': 'query', 'schema': {'type': 'integer'}},
-                            {'name': 'limit', 'in': 'query', 'schema': {'type': 'integer'}},
-                            {'name': 'offset', 'in': 'query', 'schema': {'type': 'integer'}},
+                            {
+                                'name': 'station_id',
+                                'in': 'query',
+                                'schema': {'type': 'string'},
+                            },
+                            {
+                                'name': 'year',
+                                'in': 'query',
+                                'schema': {'type': 'integer'},
+                            },
+                            {
+                                'name': 'start_year',
+                                'in': 'query',
+                                'schema': {'type': 'integer'},
+                            },
+                            {
+                                'name': 'end_year',
+                                'in': 'query',
+                                'schema': {'type': 'integer'},
+                            },
+                            {
+                                'name': 'limit',
+                                'in': 'query',
+                                'schema': {'type': 'integer'},
+                            },
+                            {
+                                'name': 'offset',
+                                'in': 'query',
+                                'schema': {'type': 'integer'},
+                            },
+                            *page_params,
                         ],
                         'responses': {
                             '200': {
@@ -223,28 +1383,44 @@ def create_app(database_url: str | None = None) -> Flask:
                                                     'items': {
                                                         'type': 'object',
                                                         'properties': {
-                                                            'station_id': {'type': 'string'},
+                                                            'station_id': {
+                                                                'type': 'string'
+                                                            },
                                                             'year': {'type': 'integer'},
-                                                            'avg_max_celsius': {'type': ['number', 'null']},
-                                                            'avg_min_celsius': {'type': ['number', 'null']},
-                                                            'total_precip_cm': {'type': ['number', 'null']},
-                                                        }
-                                                    }
+                                                            'avg_max_celsius': {
+                                                                'type': [
+                                                                    'number',
+                                                                    'null',
+                                                                ]
+                                                            },
+                                                            'avg_min_celsius': {
+                                                                'type': [
+                                                                    'number',
+                                                                    'null',
+                                                                ]
+                                                            },
+                                                            'total_precip_cm': {
+                                                                'type': [
+                                                                    'number',
+                                                                    'null',
+                                                                ]
+                                                            },
+                                                        },
+                                                    },
                                                 },
-                                                'pagination': {'type': 'object'}
-                                            }
+                                                'pagination': {'type': 'object'},
+                                            },
                                         }
                                     }
-                                }
+                                },
                             }
-                        }
+                        },
                     }
-                }
-            }
+                },
+            },
         }
         return jsonify(spec)
 
-
     @app.route('/docs')
     def swagger_ui():
         html = '''<!doctype html>
@@ -0,0 +1,332 @@
+"""
+ASGI entry point for the weather API (Problem 4).
+
+Usage:
+    export DATABASE_URL=sqlite:///weather.db
+    uvicorn asgi:app --app-dir submission      # or any other ASGI server
+
+`create_asgi_app` serves a Flask app from `api.create_app` (by default the
+module-level `api.app`, so no second set of connection pools) through a small
+WSGI-to-ASGI adapter, so the routes and JSON contracts are exactly those of
+the WSGI app. The event loop only moves bytes; request handling and every
+database query run in a bounded thread pool:
+
+- at most `ASGI_MAX_CONCURRENCY` requests are handled at once (default:
+  `DB_READ_POOL_SIZE`, so handler threads do not queue for a connection);
+- up to `ASGI_MAX_QUEUE` more (default 100) wait for a slot, each for at
+  most `ASGI_QUEUE_TIMEOUT` seconds (default 5); anything beyond that is
+  answered with 503 and `Retry-After` instead of piling up;
+- a client that disconnects stops a streamed response (`/api/weather/export`)
+  at the next chunk, and the WSGI response is closed, which returns its
+  database connection. A slot is given back only once its thread is done
+  with the request, so cancelled requests cannot overrun the pool.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import api
+from database import DEFAULT_READ_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE = 100
+DEFAULT_QUEUE_TIMEOUT = 5.0
+MAX_BODY_BYTES = 1024 * 1024
+BUSY_BODY = b'{"error": "Server busy, retry later"}'
+
+
+class ConcurrencyLimiter:
+    """At most `limit` holders and `max_queue` waiters, each for up to `timeout` s."""
+
+    def __init__(
+        self,
+        limit: int,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        timeout: float = DEFAULT_QUEUE_TIMEOUT,
+    ):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self._waiting = 0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    async def acquire(self) -> bool:
+        """Take a slot; False when the queue is full or the wait timed out."""
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            return False
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiting -= 1
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    """PEP 3333 environ for an ASGI HTTP `scope` and its request body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class WsgiCall:
+    """One WSGI request, stepped from the thread pool.
+
+    `start`, `next_chunk` and `close` may run on different threads but never
+    at the same time, so closing a cancelled request waits for the chunk
+    being produced.
+    """
+
+    def __init__(self, wsgi_app, environ):
+        self.wsgi_app = wsgi_app
+        self.environ = environ
+        self.status = None
+        self.headers = None
+        self._lock = threading.Lock()
+        self._written = []
+        self._iterable = None
+        self._iterator = None
+
+    def _start_response(self, status, headers, exc_info=None):
+        if exc_info is not None and self.status is not None:
+            raise exc_info[1].with_traceback(exc_info[2])
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ]
+        return self._written.append
+
+    def _next(self):
+        if self._written:
+            return self._written.pop(0)
+        for chunk in self._iterator:
+            if chunk:
+                return chunk
+        return None
+
+    def start(self):
+        """Run the app up to its first body chunk (None when the body is empty)."""
+        with self._lock:
+            self._iterable = self.wsgi_app(self.environ, self._start_response)
+            self._iterator = iter(self._iterable)
+            return self._next()
+
+    def next_chunk(self):
+        """The next body chunk, or None at the end."""
+        with self._lock:
+            return self._next()
+
+    def close(self) -> None:
+        with self._lock:
+            close = getattr(self._iterable, 'close', None)
+            self._iterable = self._iterator = None
+            if close is not None:
+                close()
+
+
+class AsgiAdapter:
+    """ASGI application running a WSGI app in a bounded thread pool."""
+
+    def __init__(
+        self,
+        wsgi_app,
+        max_concurrency: int = DEFAULT_READ_POOL_SIZE,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+        on_shutdown=None,
+    ):
+        self.wsgi_app = wsgi_app
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.on_shutdown = on_shutdown
+        # One spare thread runs the `close` of a cancelled request while its chunk
+        # finishes.
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrency + 1, thread_name_prefix='asgi'
+        )
+        self._limiter = None
+        self._loop = None
+
+    @property
+    def limiter(self) -> ConcurrencyLimiter:
+        # Created on first use so the semaphore belongs to the server's event loop.
+        loop = asyncio.get_running_loop()
+        if self._limiter is None or self._loop is not loop:
+            self._limiter = ConcurrencyLimiter(
+                self.max_concurrency, self.max_queue, self.queue_timeout
+            )
+            self._loop = loop
+        return self._limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f'Unsupported ASGI scope type {scope["type"]!r}')
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+        if self.on_shutdown is not None:
+            self.on_shutdown()
+
+    async def _read_body(self, receive):
+        """The request body; None when the client disconnected first."""
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_BYTES:
+                raise ValueError('Request body too large')
+            if not message.get('more_body', False):
+                return bytes(body)
+
+    @staticmethod
+    async def _send_error(send, status: int, body: bytes, headers=()):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'), *headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _http(self, scope, receive, send):
+        try:
+            body = await self._read_body(receive)
+        except ValueError as e:
+            await self._send_error(send, 413, f'{{"error": "{e}"}}'.encode())
+            return
+        if body is None:
+            return
+        limiter = self.limiter
+        if not await limiter.acquire():
+            logger.warning(
+                f'Rejecting {scope["method"]} {scope["path"]}: '
+                f'{self.max_concurrency} running, {limiter.waiting} queued'
+            )
+            await self._send_error(send, 503, BUSY_BODY, [(b'retry-after', b'1')])
+            return
+
+        loop = asyncio.get_running_loop()
+        call = WsgiCall(self.wsgi_app, wsgi_environ(scope, body))
+        disconnected = loop.create_task(self._wait_for_disconnect(receive))
+        try:
+            chunk = await loop.run_in_executor(self.executor, call.start)
+            await send(
+                {
+                    'type': 'http.response.start',
+                    'status': call.status,
+                    'headers': call.headers,
+                }
+            )
+            while not disconnected.done():
+                following = (
+                    None
+                    if chunk is None
+                    else await loop.run_in_executor(self.executor, call.next_chunk)
+                )
+                await send(
+                    {
+                        'type': 'http.response.body',
+                        'body': chunk or b'',
+                        'more_body': following is not None,
+                    }
+                )
+                if following is None:
+                    break
+                chunk = following
+        finally:
+            disconnected.cancel()
+            # The slot is released by the thread that closes the response, after
+            # any chunk still being produced for a cancelled request.
+            closing = self.executor.submit(call.close)
+            closing.add_done_callback(
+                lambda _: loop.call_soon_threadsafe(limiter.release)
+            )
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+
+def create_asgi_app(
+    flask_app=None,
+    max_concurrency: int | None = None,
+    max_queue: int | None = None,
+    queue_timeout: float | None = None,
+) -> AsgiAdapter:
+    if flask_app is None:
+        # Wrap the module-level app instead of building another set of engines
+        # and pools.
+        flask_app = api.app
+    if max_concurrency is None:
+        max_concurrency = int(
+            os.environ.get('ASGI_MAX_CONCURRENCY')
+            or os.environ.get('DB_READ_POOL_SIZE')
+            or DEFAULT_READ_POOL_SIZE
+        )
+    if max_queue is None:
+        max_queue = int(os.environ.get('ASGI_MAX_QUEUE', DEFAULT_MAX_QUEUE))
+    if queue_timeout is None:
+        queue_timeout = float(
+            os.environ.get('ASGI_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT)
+        )
+    return AsgiAdapter(flask_app, max_concurrency, max_queue, queue_timeout,
+                       on_shutdown=flask_app.config['DB_MANAGER'].dispose)
+
+
+app = create_asgi_app()
@@ -6,52 +6,940 @@ This is a slight reorganization of the original `src/database.py` adapted
 to be self-contained inside `submission/`.
 """
 
+import io
 import logging
+import sqlite3
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from sqlalchemy import create_engine
+from itertools import repeat
+from sqlalchemy import (
+    Integer,
+    and_,
+    cast,
+    create_engine,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    select,
+    update,
+)
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from pathlib import Path
 
-from models import Base, WeatherStation, WeatherRecord, CropYield
+from aggregation import (
+    YearlyAccumulator,
+    dialect_insert,
+    partition_filters,
+    store_stats,
+    supports_upsert,
+    upsert_stat_rows,
+    year_expr,
+)
+from station_cache import StationCache
+from models import (
+    MISSING_VALUE,
+    Base,
+    WeatherStation,
+    WeatherRecord,
+    WeatherRecordCount,
+    CropYield,
+    DatasetVersion,
+    IngestManifest,
+    StatsDirtyPartition,
+    YearlyStationStats,
+)
+from weather_parser import date_to_day_number, day_number_to_date
+from weather_sources import (
+    STDIN,
+    count_station_sources,
+    file_fingerprint,
+    iter_station_sources,
+    read_station_source,
+)
 
 logger = logging.getLogger(__name__)
 
+INGEST_MODES = ('bulk', 'orm')
+DEFAULT_BATCH_SIZE = 10000
+FAST_LOAD_CACHE_KIB = 256 * 1024
+DEFAULT_READ_POOL_SIZE = 5
+
+WEATHER_RECORD_COLUMNS = (
+    'station_id',
+    'day_number',
+    'max_temperature_tenths_celsius',
+    'min_temperature_tenths_celsius',
+    'precipitation_tenths_mm',
+)
+
+
+def record_rows(station_pk: int, columns):
+    """`weather_records` tuples in `WEATHER_RECORD_COLUMNS` order, -9999 as None."""
+    values = []
+    for column in (columns.max_tenths, columns.min_tenths, columns.precip_tenths):
+        column_values = column.astype(object)
+        column_values[column == MISSING_VALUE] = None
+        values.append(column_values.tolist())
+    return list(zip(repeat(station_pk), columns.day_numbers.tolist(), *values))
+
+
+def has_legacy_weather_layout(conn) -> bool:
+    """True when `weather_records` still has the old surrogate-id / DATE layout."""
+    inspector = inspect(conn)
+    if not inspector.has_table(WeatherRecord.__tablename__):
+        return False
+    return 'day_number' not in {
+        column['name'] for column in inspector.get_columns(WeatherRecord.__tablename__)
+    }
+
+
+def add_record_counts(conn, station_pk: int, year_counts) -> None:
+    """Add `(year, rows)` pairs to the station's `weather_record_counts` (in `conn`)."""
+    counts_table = WeatherRecordCount.__table__
+    params = [
+        {'station_id': station_pk, 'year': year, 'row_count': rows}
+        for year, rows in year_counts
+        if rows
+    ]
+    if not params:
+        return
+    if supports_upsert(conn.engine):
+        stmt = dialect_insert(conn.dialect.name)(counts_table)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=['station_id', 'year'],
+            set_={'row_count': counts_table.c.row_count + stmt.excluded.row_count},
+        ), params)
+        return
+    for values in params:
+        updated = conn.execute(
+            update(counts_table)
+            .where(
+                and_(
+                    counts_table.c.station_id == station_pk,
+                    counts_table.c.year == values['year'],
+                )
+            )
+            .values(row_count=counts_table.c.row_count + values['row_count'])
+        ).rowcount
+        if not updated:
+            conn.execute(insert(counts_table).values(values))
+
+
+def rebuild_record_counts(conn) -> int:
+    """Recount `weather_record_counts` from `weather_records`; returns the row count."""
+    counts_table = WeatherRecordCount.__table__
+    year = year_expr(conn.dialect.name)
+    conn.execute(delete(counts_table))
+    return conn.execute(
+        insert(counts_table).from_select(
+            ('station_id', 'year', 'row_count'),
+            select(WeatherRecord.station_id, cast(year, Integer), func.count())
+            .group_by(WeatherRecord.station_id, year),
+        )
+    ).rowcount
+
+
+DATASET_VERSION_ID = 1
+# Second counter, bumped only when `weather_records` changes (not by analysis).
+RECORDS_VERSION_ID = 2
+
+
+def bump_dataset_version(conn, records: bool = False) -> None:
+    """Increment the dataset version (and records version) in `conn`'s transaction."""
+    version_table = DatasetVersion.__table__
+    for counter_id in (
+        (DATASET_VERSION_ID, RECORDS_VERSION_ID) if records else (DATASET_VERSION_ID,)
+    ):
+        updated = conn.execute(
+            update(version_table)
+            .where(version_table.c.id == counter_id)
+            .values(version=version_table.c.version + 1)
+        ).rowcount
+        if not updated:
+            conn.execute(insert(version_table).values(id=counter_id, version=1))
+
+
+def read_dataset_version(conn, counter_id: int = DATASET_VERSION_ID):
+    """The current dataset version (0 before any write).
+
+    None when the database has no `dataset_version` table.
+
+    `counter_id=RECORDS_VERSION_ID` reads the version of `weather_records` alone.
+    """
+    if not inspect(conn).has_table(DatasetVersion.__tablename__):
+        return None
+    version_table = DatasetVersion.__table__
+    version = conn.execute(
+        select(version_table.c.version).where(version_table.c.id == counter_id)
+    ).scalar_one_or_none()
+    return version or 0
+
+
+class StationDirectory:
+    """Station code <-> primary key map (plus `state`), loaded once per dataset version.
+
+    Lookups take the caller's current dataset version and reload the map
+    when it differs from the one it was loaded at, so filters can use the
+    integer key without joining `weather_stations`. Stations this process
+    inserts are added directly. The map is loaded through the read engine, so
+    lookups do not wait for a connection the loader holds.
+    """
+
+    _UNLOADED = object()
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._version = self._UNLOADED
+        self._pks = {}
+        self._codes = {}
+        self._states = {}
+
+    def __len__(self):
+        return len(self._pks)
+
+    def refresh(self, version=None, engine=None) -> None:
+        """Reload the map from `weather_stations` and remember `version`.
+
+        Writers pass their own `engine`: a replica behind it may not have
+        stations that were just committed.
+        """
+        stations_table = WeatherStation.__table__
+        with (engine or self.engine).connect() as conn:
+            rows = conn.execute(
+                select(
+                    stations_table.c.id,
+                    stations_table.c.station_id,
+                    stations_table.c.state,
+                )
+            ).all()
+        with self._lock:
+            self._pks = {code: pk for pk, code, _ in rows}
+            self._codes = {pk: code for pk, code, _ in rows}
+            self._states = {pk: state for pk, _, state in rows}
+            self._version = version
+
+    def _current(self, version) -> None:
+        if self._version is self._UNLOADED or version != self._version:
+            self.refresh(version)
+
+    def pk(self, station_code: str, version=None):
+        """Primary key of `station_code`, or None when there is no such station."""
+        self._current(version)
+        return self._pks.get(station_code)
+
+    def pks(self, version=None) -> dict:
+        """Copy of the code -> primary key map."""
+        self._current(version)
+        return dict(self._pks)
+
+    def state(self, station_code: str, version=None):
+        self._current(version)
+        return self._states.get(self._pks.get(station_code))
+
+    def code_map(self, version=None, station_pks=()) -> dict:
+        """Primary key -> code map covering `station_pks` (reloaded if one is missing).
+
+        The returned dict is not copied; treat it as read-only.
+        """
+        self._current(version)
+        codes = self._codes
+        if any(pk not in codes for pk in station_pks):
+            # Rows from a station inserted after the last reload.
+            self.refresh(version)
+            codes = self._codes
+        return codes
+
+    def add(self, station_code: str, station_pk: int, state=None) -> None:
+        """Record a station this process has just committed."""
+        with self._lock:
+            self._pks = {**self._pks, station_code: station_pk}
+            self._codes = {**self._codes, station_pk: station_code}
+            self._states = {**self._states, station_pk: state}
+
+
+def copy_buffer(rows) -> io.StringIO:
+    """Render rows in PostgreSQL COPY text format (tab-separated, NULL as \\N)."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join('\\N' if value is None else str(value) for value in row))
+        buf.write('\n')
+    buf.seek(0)
+    return buf
+
+
+def copy_rows(conn, table_name: str, column_names, rows) -> None:
+    """Stream rows into `table_name` with `COPY ... FROM STDIN` on `conn`'s transaction.
+
+    Works with both psycopg2 (`copy_expert`) and psycopg 3 (`cursor.copy`).
+    """
+    sql = f"COPY {table_name} ({', '.join(column_names)}) FROM STDIN"
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(sql, copy_buffer(rows))
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(copy_buffer(rows).getvalue())
+    finally:
+        cursor.close()
+
+
+def iter_parsed_station_sources(items, workers: int = 1):
+    """Yield `(key, result)` in input order for `(key, job)` items.
+
+    `result` is `read_station_source(*job)`, or None when `job` is None
+    (a source that needs no parsing). With `workers > 1` sources are parsed
+    in a process pool. At most `2 * workers` items are buffered, so neither
+    parsed rows nor streamed file contents pile up faster than the single
+    writer consumes them.
+    """
+    if workers <= 1:
+        for key, job in items:
+            yield key, (read_station_source(*job) if job is not None else None)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        pending = iter(items)
+        while True:
+            while len(in_flight) < 2 * workers:
+                item = next(pending, None)
+                if item is None:
+                    break
+                key, job = item
+                future = (
+                    executor.submit(read_station_source, *job)
+                    if job is not None
+                    else None
+                )
+                in_flight.append((key, future))
+            if not in_flight:
+                break
+            key, future = in_flight.popleft()
+            yield key, (future.result() if future is not None else None)
+
+
+def is_sqlite_file(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (
+        None,
+        '',
+        ':memory:',
+    )
+
+
+def _use_wal(dbapi_connection, connection_record):
+    # Readers never wait for a writer (and vice versa) once the file is in WAL mode.
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+    except sqlite3.OperationalError:
+        # Another connection holds a lock; the mode is persistent, the next connect
+        # sets it.
+        pass
+    finally:
+        cursor.close()
+
+
+def _read_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+
+def create_read_engine(
+    database_url: str,
+    read_url: str | None = None,
+    pool_size: int = DEFAULT_READ_POOL_SIZE,
+    pool_pre_ping: bool = False,
+):
+    """Pooled engine for queries only.
+
+    SQLite files get WAL journaling and `PRAGMA query_only` on every pooled
+    connection. PostgreSQL reads go to `read_url` (e.g. a streaming replica)
+    when given, in read-only transactions.
+    """
+    url = read_url or database_url
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        # SQLAlchemy 1.4 defaults file databases to NullPool, which takes no pool
+        # size, and leaves pysqlite's same-thread check on; pooled connections move
+        # between threads.
+        engine = create_engine(
+            url,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=pool_size,
+            pool_pre_ping=pool_pre_ping,
+            connect_args={'check_same_thread': False},
+        )
+        event.listen(engine, 'connect', _use_wal)
+        event.listen(engine, 'connect', _read_only)
+        return engine
+    connect_args = (
+        {'options': '-c default_transaction_read_only=on'}
+        if backend == 'postgresql'
+        else {}
+    )
+    return create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=pool_size,
+        pool_pre_ping=pool_pre_ping,
+        connect_args=connect_args,
+    )
+
 
 class DatabaseManager:
-    def __init__(self, database_url: str = 'sqlite:///weather.db'):
+    """Write engine (`engine`) for ingestion/analysis, pooled read engine for queries.
+
+    `read_engine` is the same engine for in-memory SQLite databases, which
+    cannot be shared between connections.
+    """
+
+    def __init__(
+        self,
+        database_url: str = 'sqlite:///weather.db',
+        station_cache_dir=None,
+        read_url: str | None = None,
+        read_pool_size: int = DEFAULT_READ_POOL_SIZE,
+        pool_pre_ping: bool = False,
+    ):
         self.database_url = database_url
-        self.engine = create_engine(database_url, echo=False)
+        self.engine = create_engine(
+            database_url, echo=False, pool_pre_ping=pool_pre_ping
+        )
+        if is_sqlite_file(database_url):
+            event.listen(self.engine, 'connect', _use_wal)
+        if (
+            read_url is None
+            and make_url(database_url).get_backend_name() == 'sqlite'
+            and not is_sqlite_file(database_url)
+        ):
+            self.read_engine = self.engine
+        else:
+            self.read_engine = create_read_engine(
+                database_url, read_url, read_pool_size, pool_pre_ping
+            )
         self.SessionLocal = sessionmaker(bind=self.engine)
+        self.ReadSessionLocal = sessionmaker(bind=self.read_engine)
+        self.station_directory = StationDirectory(self.read_engine)
+        # Optional per-station columnar files kept in step with ingestion.
+        self.station_cache = (
+            StationCache(station_cache_dir) if station_cache_dir else None
+        )
 
     def init_db(self):
+        with self.engine.connect() as conn:
+            if has_legacy_weather_layout(conn):
+                raise RuntimeError(
+                    'weather_records uses the old layout; '
+                    'run migrate_schema.py to convert it first'
+                )
+            counts_missing = not inspect(conn).has_table(
+                WeatherRecordCount.__tablename__
+            )
         Base.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            version_table = DatasetVersion.__table__
+            if conn.execute(select(version_table.c.id)).first() is None:
+                conn.execute(
+                    insert(version_table).values(id=DATASET_VERSION_ID, version=0)
+                )
+        if counts_missing:
+            # Databases loaded before the counts table existed: count them once.
+            with self.engine.begin() as conn:
+                if (
+                    conn.execute(select(WeatherRecord.station_id).limit(1)).first()
+                    is not None
+                ):
+                    logger.info(
+                        f"Backfilled {rebuild_record_counts(conn):,} "
+                        "weather_record_counts rows"
+                    )
         print("Database tables created successfully.")
 
     def drop_db(self):
         Base.metadata.drop_all(self.engine)
+        if self.station_cache is not None:
+            self.station_cache.clear()
         print("Database tables dropped successfully.")
 
     def get_session(self):
         return self.SessionLocal()
 
-    def ingest_weather_data(self, wx_data_dir: str) -> int:
+    def get_read_session(self):
+        """Session on the read engine; for queries only."""
+        return self.ReadSessionLocal()
+
+    def dispose(self) -> None:
+        self.engine.dispose()
+        if self.read_engine is not self.engine:
+            self.read_engine.dispose()
+
+    @property
+    def supports_copy(self) -> bool:
+        """True when bulk writes can use PostgreSQL `COPY` (psycopg2 or psycopg 3)."""
+        return (
+            self.engine.dialect.name == 'postgresql'
+            and self.engine.dialect.driver in ('psycopg2', 'psycopg')
+        )
+
+    @contextmanager
+    def fast_load(self, cache_size_kib: int = FAST_LOAD_CACHE_KIB):
+        """Bulk-load tuning for SQLite.
+
+        While the block runs, `weather_records` has no secondary indexes and
+        every pooled connection uses WAL journaling, `synchronous=NORMAL`, a
+        large page cache and in-memory temp storage. On exit (including on
+        error) the indexes are rebuilt once and `ANALYZE` refreshes the
+        planner statistics. Other dialects run the block unchanged.
+        """
+        if self.engine.dialect.name != 'sqlite':
+            logger.info(
+                "Fast-load tuning is SQLite-only; "
+                f"loading {self.engine.dialect.name} with default settings"
+            )
+            yield
+            return
+
+        def tune_connection(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute(f'PRAGMA cache_size=-{int(cache_size_kib)}')
+            cursor.execute('PRAGMA temp_store=MEMORY')
+            cursor.close()
+
+        deferred_indexes = sorted(
+            WeatherRecord.__table__.indexes, key=lambda idx: idx.name
+        )
+
+        self.engine.dispose()
+        event.listen(self.engine, 'connect', tune_connection)
+        try:
+            with self.engine.begin() as conn:
+                for index in deferred_indexes:
+                    index.drop(conn, checkfirst=True)
+            logger.info(
+                f"Fast load: deferred {len(deferred_indexes)} weather_records indexes"
+            )
+
+            yield
+        finally:
+            with self.engine.begin() as conn:
+                for index in deferred_indexes:
+                    logger.info(f"Fast load: building index {index.name}")
+                    index.create(conn, checkfirst=True)
+                conn.exec_driver_sql('ANALYZE')
+            event.remove(self.engine, 'connect', tune_connection)
+            self.engine.dispose()
+
+    def ingest_weather_data(
+        self,
+        wx_data_dir: str,
+        mode: str = 'bulk',
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: int = 1,
+        resume: bool = False,
+        with_stats: bool = False,
+    ) -> int:
+        """Load every station file found at `wx_data_dir`.
+
+        In bulk mode `wx_data_dir` may be a directory, a single (optionally
+        gzip/bz2/xz-compressed) station file, a tar archive or `-` for a tar
+        stream on stdin; see `weather_sources`. The ORM path reads `*.txt`
+        files from a directory only.
+
+        `mode='bulk'` parses each file into plain tuples and writes them with
+        batched Core `insert()` executemany calls (`COPY ... FROM STDIN` on
+        PostgreSQL); `mode='orm'` keeps the
+        original one-`WeatherRecord`-per-line unit-of-work path for comparison.
+        In bulk mode `workers > 1` parses station files in a process pool
+        while this process remains the only writer.
+
+        Bulk mode also keeps an `ingest_manifest` row per station (size,
+        mtime, content hash, last ingested date). Unchanged files are
+        skipped without being read; files that grew are verified against
+        the stored hash and only their appended tail is parsed and inserted.
+
+        Each station is loaded in a single transaction together with its
+        manifest row, its `weather_record_counts` and a `dataset_version`
+        bump, so a crash never leaves a half-loaded station behind; rerunning
+        simply continues with the stations that have no manifest.
+        `resume=True` additionally reloads stations that have a station row
+        but no manifest (partial loads left by older versions), replacing
+        whatever records they already had.
+
+        `with_stats=True` (bulk mode) also keeps `yearly_station_stats` up to
+        date in the same per-station transaction, so no separate analysis
+        pass is needed. New stations are aggregated from the parsed columns
+        while they are loaded; for appended files only the touched years are
+        re-aggregated from the table.
+
+        With a station cache configured, a station's cache file is removed
+        before its records change and exported again once they are
+        committed.
+        """
+        if mode not in INGEST_MODES:
+            raise ValueError(
+                f"Unknown ingest mode: {mode!r} "
+                f"(expected one of {', '.join(INGEST_MODES)})"
+            )
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        if workers < 1:
+            raise ValueError('workers must be a positive integer')
+        if mode == 'bulk':
+            return self._ingest_weather_data_bulk(
+                wx_data_dir, batch_size, workers, resume, with_stats
+            )
+        if workers > 1:
+            raise ValueError("Parallel parsing requires mode='bulk'")
+        if resume:
+            raise ValueError("Resuming requires mode='bulk'")
+        if with_stats:
+            raise ValueError("Computing stats during ingestion requires mode='bulk'")
+        if not Path(wx_data_dir).is_dir() and Path(wx_data_dir).exists():
+            raise ValueError("mode='orm' reads station files from a directory only")
+        return self._ingest_weather_data_orm(wx_data_dir, batch_size)
+
+    def _ingest_weather_data_bulk(
+        self,
+        wx_data_dir: str,
+        batch_size: int,
+        workers: int,
+        resume: bool,
+        with_stats: bool,
+    ) -> int:
+        if str(wx_data_dir) != STDIN and not Path(wx_data_dir).exists():
+            raise FileNotFoundError(f"Weather data directory not found: {wx_data_dir}")
+
+        total_files = count_station_sources(wx_data_dir)
+        if total_files is not None:
+            logger.info(f"Found {total_files} weather station files")
+        else:
+            logger.info(f"Streaming weather station files from {wx_data_dir}")
+
+        stations_table = WeatherStation.__table__
+        manifest_table = IngestManifest.__table__
+        total_records = 0
+        stat_count = 0
+        committed = 0
+
+        try:
+            self.station_directory.refresh(engine=self.engine)
+            station_pks = self.station_directory.pks()
+            with self.engine.connect() as conn:
+                manifests = {
+                    row.station_id: row for row in conn.execute(select(manifest_table))
+                }
+                start_version = read_dataset_version(conn, RECORDS_VERSION_ID)
+
+            # Stations without a manifest were loaded by an older, non-atomic
+            # version and may be partial: they are skipped as before unless
+            # resuming, in which case they are reloaded.
+            incomplete = set(station_pks.values()) - set(manifests) if resume else set()
+            if resume:
+                logger.info(f"Resuming: {len(manifests)} stations already complete, "
+                            f"{len(incomplete)} incomplete stations will be reloaded")
+
+            def plan_jobs():
+                # Decide per source: full load, tail read, or skip (job None).
+                for source in iter_station_sources(wx_data_dir):
+                    station_pk = station_pks.get(source.station_id)
+                    manifest = manifests.get(station_pk)
+                    if station_pk is None or station_pk in incomplete:
+                        yield source, (source, 0, None)
+                    elif manifest is None:
+                        yield source, None
+                    elif (
+                        source.size == manifest.file_size
+                        and source.mtime == manifest.file_mtime
+                    ):
+                        yield source, None
+                    else:
+                        yield source, (
+                            source,
+                            manifest.file_size,
+                            manifest.content_hash,
+                        )
+
+            loaded = set()
+            parsed_sources = iter_parsed_station_sources(plan_jobs(), workers)
+
+            for file_index, (source, parsed) in enumerate(parsed_sources, 1):
+                station_id = source.station_id
+                station_pk = station_pks.get(station_id)
+                progress = (
+                    f"[{file_index}/{total_files}]"
+                    if total_files is not None
+                    else f"[{file_index}]"
+                )
+
+                if parsed is None:
+                    reason = (
+                        'unchanged since last ingest'
+                        if station_pk in manifests
+                        else 'already in database'
+                    )
+                    logger.debug(f"{progress} Skipping {station_id} - {reason}")
+                    continue
+                if station_id in loaded:
+                    logger.warning(
+                        f"{progress} Skipping {source.name} - station {station_id} "
+                        "already loaded from another file"
+                    )
+                    continue
+                loaded.add(station_id)
+
+                columns, appended, size, mtime, content_hash = parsed
+                for line in columns.bad_lines:
+                    logger.warning(f"  Error parsing line in {station_id}: {line}")
+                columns, duplicates = columns.unique_days()
+                if duplicates:
+                    logger.warning(
+                        f"  {station_id}: {duplicates} repeated dates skipped "
+                        "(first occurrence kept)"
+                    )
+
+                manifest = manifests.get(station_pk)
+                if manifest is not None:
+                    if not appended:
+                        logger.warning(
+                            f"  {station_id}: file was rewritten since last ingest; "
+                            "only dates after the last ingested date are loaded"
+                        )
+                    if manifest.last_observation_date is not None:
+                        last_day = date_to_day_number(manifest.last_observation_date)
+                        columns = columns.select(columns.day_numbers > last_day)
+
+                last_date = (
+                    day_number_to_date(columns.day_numbers.max())
+                    if len(columns)
+                    else None
+                )
+                manifest_values = {
+                    'file_name': source.name,
+                    'file_size': size,
+                    'file_mtime': mtime,
+                    'content_hash': content_hash,
+                }
+
+                if self.station_cache is not None:
+                    self.station_cache.invalidate(station_id)
+                with self.engine.begin() as conn:
+                    if station_pk is None:
+                        station_pk = conn.execute(
+                            insert(stations_table).values(station_id=station_id)
+                        ).inserted_primary_key[0]
+                    elif station_pk in incomplete:
+                        removed = conn.execute(
+                            delete(WeatherRecord.__table__).where(
+                                WeatherRecord.__table__.c.station_id == station_pk
+                            )
+                        ).rowcount
+                        counts_table = WeatherRecordCount.__table__
+                        conn.execute(
+                            delete(counts_table).where(
+                                counts_table.c.station_id == station_pk
+                            )
+                        )
+                        logger.warning(
+                            f"  {station_id}: reloading incomplete station "
+                            f"({removed:,} partial records replaced)"
+                        )
+
+                    self._write_station_records(conn, station_pk, columns, batch_size)
+                    add_record_counts(conn, station_pk, columns.year_counts())
+                    bump_dataset_version(conn, records=True)
+                    if with_stats:
+                        stat_count += self._write_station_stats(
+                            conn, station_pk, columns, fresh=manifest is None
+                        )
+                    else:
+                        self.mark_stats_dirty(conn, station_pk, columns.years())
+
+                    if manifest is None:
+                        conn.execute(
+                            insert(manifest_table).values(
+                                station_id=station_pk,
+                                last_observation_date=last_date,
+                                **manifest_values,
+                            )
+                        )
+                    else:
+                        if last_date is not None:
+                            manifest_values['last_observation_date'] = last_date
+                        conn.execute(
+                            manifest_table.update()
+                            .where(manifest_table.c.station_id == station_pk)
+                            .values(**manifest_values)
+                        )
+
+                committed += 1
+                if station_id not in station_pks:
+                    station_pks[station_id] = station_pk
+                    self.station_directory.add(station_id, station_pk)
+                self.refresh_station_cache(station_pk, station_id)
+                record_count = len(columns)
+                total_records += record_count
+
+                status = ""
+                if columns.error_count > 0:
+                    status = f" ({columns.error_count} errors skipped)"
+                kind = " new" if manifest is not None else ""
+                logger.info(
+                    f"{progress} {station_id}: {record_count:,}{kind} records{status}"
+                )
+
+            self.restamp_station_cache(start_version, committed)
+        except Exception as e:
+            logger.error(f"Error during weather data ingestion: {e}")
+            raise
+
+        if with_stats:
+            logger.info(
+                f"Upserted {stat_count:,} yearly-station stat rows during ingestion"
+            )
+        return total_records
+
+    def _write_station_records(
+        self, conn, station_pk: int, columns, batch_size: int
+    ) -> None:
+        records_table = WeatherRecord.__table__
+        rows = record_rows(station_pk, columns)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            if self.supports_copy:
+                copy_rows(conn, records_table.name, WEATHER_RECORD_COLUMNS, batch)
+            else:
+                conn.execute(
+                    insert(records_table),
+                    [dict(zip(WEATHER_RECORD_COLUMNS, row)) for row in batch],
+                )
+            logger.debug(
+                f"  Batch insert: {start + len(batch):,} records "
+                f"for station {station_pk}"
+            )
+
+    def _write_station_stats(self, conn, station_pk: int, columns, fresh: bool) -> int:
+        """Bring the station's yearly stats up to date with the records just written.
+
+        `fresh` means `columns` are all of the station's records, so the stats
+        come straight from the accumulators; otherwise the touched years
+        also hold earlier records and are re-aggregated in SQL.
+        """
+        stats_table = YearlyStationStats.__table__
+        dirty_table = StatsDirtyPartition.__table__
+        years = columns.years()
+        if fresh:
+            # Reloads replace every record, so stats for any other year are stale too.
+            conn.execute(
+                delete(stats_table).where(stats_table.c.station_id == station_pk)
+            )
+            accumulator = YearlyAccumulator()
+            accumulator.add_columns(station_pk, columns)
+            count = upsert_stat_rows(conn, accumulator.stat_rows())
+        elif years:
+            count = store_stats(
+                conn, partition_filters(conn.dialect.name, station_pk, years)
+            )
+        else:
+            count = 0
+        dirty = delete(dirty_table).where(dirty_table.c.station_id == station_pk)
+        if not fresh:
+            dirty = dirty.where(dirty_table.c.year.in_(years))
+        conn.execute(dirty)
+        return count
+
+    def refresh_station_cache(self, station_pk: int, station_id: str) -> None:
+        """Re-export one station's cache file from the committed records.
+
+        No-op without a station cache.
+        """
+        if self.station_cache is None:
+            return
+        with self.engine.connect() as conn:
+            self.station_cache.export_station(conn, station_pk, station_id)
+
+    def restamp_station_cache(self, start_version, committed: int) -> None:
+        """Carry the cache files over to the records version an ingestion run ended at.
+
+        Every station the run committed bumped the version once, so when it
+        moved by exactly `committed` nothing else wrote records in between
+        and files stamped from `start_version` on still match the database.
+        """
+        if self.station_cache is None or start_version is None or not committed:
+            return
+        with self.engine.connect() as conn:
+            version = read_dataset_version(conn, RECORDS_VERSION_ID)
+        if version == start_version + committed:
+            self.station_cache.restamp(start_version, version)
+        else:
+            logger.warning(
+                'Records changed outside this ingestion run; stations it did not load '
+                'are no longer served from the station cache until station_cache.py '
+                're-exports them'
+            )
+
+    def mark_stats_dirty(self, conn, station_pk: int, years) -> None:
+        """Record that `yearly_station_stats` of these station-years is stale."""
+        dirty_table = StatsDirtyPartition.__table__
+        years = sorted(set(years))
+        if not years:
+            return
+        already = set(
+            conn.execute(
+                select(dirty_table.c.year).where(
+                    dirty_table.c.station_id == station_pk,
+                    dirty_table.c.year.in_(years),
+                )
+            ).scalars()
+        )
+        new_rows = [
+            {'station_id': station_pk, 'year': year}
+            for year in years
+            if year not in already
+        ]
+        if new_rows:
+            conn.execute(insert(dirty_table), new_rows)
+
+    def _ingest_weather_data_orm(self, wx_data_dir: str, batch_size: int) -> int:
         session = self.get_session()
         total_records = 0
 
         try:
             wx_path = Path(wx_data_dir)
             if not wx_path.exists():
-                raise FileNotFoundError(f"Weather data directory not found: {wx_data_dir}")
+                raise FileNotFoundError(
+                    f"Weather data directory not found: {wx_data_dir}"
+                )
 
             txt_files = sorted(wx_path.glob('*.txt'))
             logger.info(f"Found {len(txt_files)} weather station files")
+            self.station_directory.refresh(engine=self.engine)
+            with self.engine.connect() as conn:
+                start_version = read_dataset_version(conn, RECORDS_VERSION_ID)
+            committed = 0
 
             for file_index, file_path in enumerate(txt_files, 1):
                 station_id = file_path.stem
 
-                existing_station = session.query(WeatherStation).filter_by(station_id=station_id).first()
-                if existing_station:
-                    logger.debug(f"[{file_index}/{len(txt_files)}] Skipping {station_id} - already in database")
+                if self.station_directory.pk(station_id) is not None:
+                    logger.debug(
+                        f"[{file_index}/{len(txt_files)}] Skipping {station_id} "
+                        "- already in database"
+                    )
                     continue
 
                 station = WeatherStation(station_id=station_id)
@@ -60,6 +948,9 @@ class DatabaseManager:
 
                 record_count = 0
                 error_count = 0
+                last_date = None
+                year_counts = Counter()
+                seen_days = set()
 
                 with open(file_path, 'r') as f:
                     for line in f:
@@ -79,6 +970,12 @@ class DatabaseManager:
                             precip = int(parts[3])
 
                             obs_date = datetime.strptime(date_str, '%Y%m%d').date()
+                            if obs_date in seen_days:
+                                logger.warning(
+                                    f"  Repeated date in {station_id} skipped: {line}"
+                                )
+                                continue
+                            seen_days.add(obs_date)
 
                             record = WeatherRecord(
                                 station_id=station.id,
@@ -89,24 +986,61 @@ class DatabaseManager:
                             )
                             session.add(record)
                             record_count += 1
+                            last_date = (
+                                obs_date
+                                if last_date is None
+                                else max(last_date, obs_date)
+                            )
+                            year_counts[obs_date.year] += 1
 
-                            if record_count % 10000 == 0:
-                                session.commit()
-                                logger.debug(f"  Batch commit: {record_count:,} records for {station_id}")
+                            if record_count % batch_size == 0:
+                                # Flush, not commit: the station becomes visible only
+                                # once all of its records are in.
+                                session.flush()
+                                session.expunge_all()
+                                logger.debug(
+                                    f"  Batch flush: {record_count:,} records "
+                                    f"for {station_id}"
+                                )
 
                         except (ValueError, IndexError):
                             error_count += 1
-                            logger.warning(f"  Error parsing line in {station_id}: {line}")
+                            logger.warning(
+                                f"  Error parsing line in {station_id}: {line}"
+                            )
                             continue
 
+                if last_date is not None:
+                    session.flush()
+                    add_record_counts(
+                        session.connection(), station.id, sorted(year_counts.items())
+                    )
+                    self.mark_stats_dirty(session.connection(), station.id, year_counts)
+                    bump_dataset_version(session.connection(), records=True)
+                    committed += 1
+                size, mtime, content_hash = file_fingerprint(file_path)
+                session.add(IngestManifest(
+                    station_id=station.id,
+                    file_name=file_path.name,
+                    file_size=size,
+                    file_mtime=mtime,
+                    content_hash=content_hash,
+                    last_observation_date=last_date,
+                ))
                 session.commit()
+                self.station_directory.add(station_id, station.id)
+                self.refresh_station_cache(station.id, station_id)
                 total_records += record_count
 
                 status = ""
                 if error_count > 0:
                     status = f" ({error_count} errors skipped)"
-                logger.info(f"[{file_index}/{len(txt_files)}] {station_id}: {record_count:,} records{status}")
+                logger.info(
+                    f"[{file_index}/{len(txt_files)}] {station_id}: "
+                    f"{record_count:,} records{status}"
+                )
 
+            self.restamp_station_cache(start_version, committed)
         except Exception as e:
             session.rollback()
             logger.error(f"Error during weather data ingestion: {e}")
@@ -121,7 +1055,9 @@ class DatabaseManager:
         try:
             yld_path = Path(yld_data_dir)
             if not yld_path.exists():
-                raise FileNotFoundError(f"Crop yield data directory not found: {yld_data_dir}")
+                raise FileNotFoundError(
+                    f"Crop yield data directory not found: {yld_data_dir}"
+                )
 
             txt_files = sorted(yld_path.glob('*.txt'))
             logger.info(f"Found {len(txt_files)} crop yield data files")
@@ -153,12 +1089,15 @@ class DatabaseManager:
                             continue
 
             records_inserted = 0
-            for year, yield_amount in sorted(all_years.items()):
-                existing = session.query(CropYield).filter_by(year=year).first()
-                if not existing:
-                    crop_yield = CropYield(year=year, yield_amount=yield_amount)
-                    session.add(crop_yield)
-                    records_inserted += 1
+            if self.supports_copy:
+                records_inserted = self._copy_crop_yield(sorted(all_years.items()))
+            else:
+                for year, yield_amount in sorted(all_years.items()):
+                    existing = session.query(CropYield).filter_by(year=year).first()
+                    if not existing:
+                        crop_yield = CropYield(year=year, yield_amount=yield_amount)
+                        session.add(crop_yield)
+                        records_inserted += 1
 
             session.commit()
 
@@ -168,8 +1107,12 @@ class DatabaseManager:
             if error_count > 0:
                 status_parts.append(f"{error_count} errors skipped")
 
-            status = " (" + ", ".join(status_parts) + ")"
-            logger.info(f"Crop yield data: {records_inserted:,} records ingested{status if duplicates_found > 0 or error_count > 0 else ''}")
+            status = ''
+            if duplicates_found > 0 or error_count > 0:
+                status = " (" + ", ".join(status_parts) + ")"
+            logger.info(
+                f"Crop yield data: {records_inserted:,} records ingested{status}"
+            )
 
             return records_inserted
 
@@ -180,6 +1123,29 @@ class DatabaseManager:
         finally:
             session.close()
 
+    def _copy_crop_yield(self, rows) -> int:
+        # COPY into a staging table so existing years are kept, as in the ORM path.
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                'CREATE TEMP TABLE crop_yield_stage '
+                '(year INTEGER, yield_amount INTEGER) ON COMMIT DROP'
+            )
+            copy_rows(conn, 'crop_yield_stage', ('year', 'yield_amount'), rows)
+            result = conn.exec_driver_sql(
+                'INSERT INTO crop_yield (year, yield_amount) '
+                'SELECT year, yield_amount FROM crop_yield_stage '
+                'ON CONFLICT (year) DO NOTHING'
+            )
+            return result.rowcount
+
 
-def get_database_manager(database_url: str = 'sqlite:///weather.db') -> DatabaseManager:
-    return DatabaseManager(database_url)
+def get_database_manager(
+    database_url: str = 'sqlite:///weather.db',
+    station_cache_dir=None,
+    read_url: str | None = None,
+    read_pool_size: int = DEFAULT_READ_POOL_SIZE,
+    pool_pre_ping: bool = False,
+) -> DatabaseManager:
+    return DatabaseManager(
+        database_url, station_cache_dir, read_url, read_pool_size, pool_pre_ping
+    )
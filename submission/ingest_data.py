@@ -3,19 +3,52 @@
 Ingestion script for weather and crop yield data (Problem 2).
 
 Usage:
-    python ingest_data.py [--reset] [--db DATABASE_URL]
+    python ingest_data.py [--reset] [--db DATABASE_URL] [--mode {bulk,orm}]
+                          [--batch-size N] [--workers N] [--fast-load] [--resume]
+                          [--with-stats] [--station-cache DIR] [--wx-data PATH]
+    python ingest_data.py --compare [--batch-size N] [--workers N] [--fast-load]
+                          [--wx-data PATH]
 
 This script initializes the DB and ingests data from `data/wx_data` and
-`data/yld_data` located at the repository root.
+`data/yld_data` located at the repository root. `--wx-data` points weather
+ingestion elsewhere: a directory, a `.gz`/`.bz2`/`.xz` station file, a tar
+archive, or `-` to read a tar stream from stdin, e.g.
+
+    curl -s https://example.org/wx.tar.gz | python ingest_data.py --wx-data -
+
+`--mode bulk` (the default) writes weather records with batched Core
+inserts; `--mode orm` keeps the original per-object ORM path.
+`--compare` loads the same weather directory once per mode, each into a
+fresh temporary SQLite database, and reports both records/second figures side
+by side; `--db` is not touched and crop yields are skipped. `--workers N` parses
+station files
+in N processes while a single writer keeps SQLite's one-writer rule.
+`--fast-load` defers the `weather_records` indexes and relaxes SQLite
+durability pragmas for the duration of the load (ignored on other databases).
+
+Every station is committed atomically with its manifest row, so after an
+interrupted run re-running continues with the stations still missing.
+`--resume` also reloads stations left half-loaded by older versions.
+
+`--with-stats` fills `yearly_station_stats` while loading: per-(station, year)
+sums and counts are accumulated from the parsed files and written in the same
+transaction as each station's records, so `analyze_data.py` does not need to
+scan the table afterwards.
+
+`--station-cache DIR` keeps the API's memory-mapped per-station files (see
+`station_cache.py`) in step with the load: every station whose records change
+is re-exported after its transaction commits.
 """
 
 import sys
 import argparse
 import logging
+import tempfile
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
 
-from database import get_database_manager
+from database import get_database_manager, INGEST_MODES, DEFAULT_BATCH_SIZE
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,17 +58,144 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def compare_modes(
+    wx_data_dir, batch_size=DEFAULT_BATCH_SIZE, workers=1, fast_load=False
+) -> dict:
+    """Load `wx_data_dir` with every ingest mode into its own temporary database.
+
+    Returns `{mode: (records_ingested, seconds)}`.
+    """
+    results = {}
+    for mode in INGEST_MODES:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_manager = get_database_manager(
+                f'sqlite:///{Path(tmp_dir) / "compare.db"}'
+            )
+            try:
+                db_manager.init_db()
+                start = datetime.now()
+                with db_manager.fast_load() if fast_load else nullcontext():
+                    records = db_manager.ingest_weather_data(
+                        str(wx_data_dir),
+                        mode=mode,
+                        batch_size=batch_size,
+                        workers=workers if mode == 'bulk' else 1,
+                    )
+                results[mode] = (records, (datetime.now() - start).total_seconds())
+            finally:
+                db_manager.dispose()
+    return results
+
+
 def main():
     parser = argparse.ArgumentParser(description='Ingest weather and crop yield data.')
-    parser.add_argument('--reset', action='store_true', help='Reset database (drop and recreate tables)')
-    parser.add_argument('--db', default='sqlite:///weather.db', help='Database URL (default: sqlite:///weather.db)')
+    parser.add_argument(
+        '--reset', action='store_true', help='Reset database (drop and recreate tables)'
+    )
+    parser.add_argument(
+        '--db',
+        default='sqlite:///weather.db',
+        help='Database URL (default: sqlite:///weather.db)',
+    )
+    parser.add_argument(
+        '--mode',
+        choices=INGEST_MODES,
+        default='bulk',
+        help='Weather ingestion path: batched Core inserts or per-object ORM '
+        '(default: bulk)',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f'Rows per insert/flush batch (default: {DEFAULT_BATCH_SIZE})',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Processes used to parse station files in bulk mode (default: 1)',
+    )
+    parser.add_argument(
+        '--fast-load',
+        action='store_true',
+        help='SQLite only: build indexes after the load and relax durability '
+        'pragmas while loading',
+    )
+    parser.add_argument(
+        '--wx-data',
+        default=None,
+        help="Weather input: directory, compressed file, tar archive or '-' for "
+        'stdin (default: data/wx_data)',
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Continue an interrupted load, reloading stations without a '
+        'completed manifest',
+    )
+    parser.add_argument(
+        '--station-cache',
+        default=None,
+        help='Directory of per-station API cache files to keep up to date',
+    )
+    parser.add_argument(
+        '--with-stats',
+        action='store_true',
+        help='Compute yearly per-station stats while loading (bulk mode only)',
+    )
+    parser.add_argument(
+        '--compare',
+        action='store_true',
+        help='Load the weather data with every mode into temporary SQLite '
+        'databases and report records/second for each',
+    )
     args = parser.parse_args()
 
+    if args.compare and (
+        args.reset or args.resume or args.with_stats or args.station_cache
+    ):
+        parser.error(
+            '--compare cannot be combined with --reset, --resume, --with-stats '
+            'or --station-cache'
+        )
+
+    if args.resume and args.reset:
+        parser.error('--resume cannot be combined with --reset')
+    if args.resume and args.mode != 'bulk':
+        parser.error('--resume requires --mode bulk')
+    if args.with_stats and args.mode != 'bulk':
+        parser.error('--with-stats requires --mode bulk')
+    if args.wx_data == '-' and args.mode != 'bulk':
+        parser.error('reading from stdin requires --mode bulk')
+
+    if args.workers > 1 and args.mode != 'bulk' and not args.compare:
+        parser.error('--workers requires --mode bulk')
+
     script_dir = Path(__file__).parent
     project_root = script_dir.parent
-    wx_data_dir = project_root / 'data' / 'wx_data'
+    wx_data_dir = args.wx_data or project_root / 'data' / 'wx_data'
     yld_data_dir = project_root / 'data' / 'yld_data'
 
+    if args.compare and not Path(wx_data_dir).is_dir():
+        parser.error('--compare requires a directory of station files')
+    if args.compare:
+        logger.info(f'Comparing ingest modes on {wx_data_dir}')
+        try:
+            results = compare_modes(
+                wx_data_dir, args.batch_size, args.workers, args.fast_load
+            )
+        except Exception as e:
+            logger.error(f'✗ Failed to compare ingest modes: {e}')
+            return False
+        for mode, (records, seconds) in results.items():
+            rate = f'{records / seconds:.0f}' if records and seconds > 0 else 'n/a'
+            logger.info(
+                f'  - {mode}: {records:,} records in {seconds:.2f} seconds '
+                f'({rate} records/second)'
+            )
+        return True
+
     start_time = datetime.now()
     logger.info('=' * 70)
     logger.info('DATA INGESTION PROCESS STARTED')
@@ -43,11 +203,19 @@ def main():
     logger.info(f'Start time: {start_time.strftime("%Y-%m-%d %H:%M:%S")}')
     logger.info(f'Database: {args.db}')
     logger.info(f'Reset: {args.reset}')
+    logger.info(f'Resume: {args.resume}')
+    logger.info(f'Fast load: {args.fast_load}')
+    logger.info(f'Stats during ingestion: {args.with_stats}')
+    logger.info(f'Station cache: {args.station_cache or "disabled"}')
+    logger.info(
+        f'Ingest mode: {args.mode} (batch size {args.batch_size:,}, '
+        f'{args.workers} parse worker(s))'
+    )
     logger.info(f'Weather data directory: {wx_data_dir}')
     logger.info(f'Crop yield data directory: {yld_data_dir}')
 
     try:
-        db_manager = get_database_manager(args.db)
+        db_manager = get_database_manager(args.db, args.station_cache)
     except Exception as e:
         logger.error(f'Failed to initialize database manager: {e}')
         return False
@@ -75,7 +243,16 @@ def main():
     try:
         logger.info('Ingesting weather data...')
         weather_start = datetime.now()
-        records_ingested = db_manager.ingest_weather_data(str(wx_data_dir))
+        # Index rebuild time is part of the fast-load cost, so time it too.
+        with db_manager.fast_load() if args.fast_load else nullcontext():
+            records_ingested = db_manager.ingest_weather_data(
+                str(wx_data_dir),
+                mode=args.mode,
+                batch_size=args.batch_size,
+                workers=args.workers,
+                resume=args.resume,
+                with_stats=args.with_stats,
+            )
         weather_end = datetime.now()
         weather_duration = (weather_end - weather_start).total_seconds()
 
@@ -83,7 +260,10 @@ def main():
         logger.info(f'  - Records ingested: {records_ingested:,}')
         logger.info(f'  - Duration: {weather_duration:.2f} seconds')
         if records_ingested > 0 and weather_duration > 0:
-            logger.info(f'  - Rate: {records_ingested / weather_duration:.0f} records/second')
+            logger.info(
+                f'  - Rate ({args.mode}): '
+                f'{records_ingested / weather_duration:.0f} records/second'
+            )
         weather_success = True
     except Exception as e:
         logger.error(f'✗ Failed to ingest weather data: {e}')
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""
+Convert `weather_records` from the original layout to the compact one (Problem 1).
+
+Usage:
+    python migrate_schema.py [--db DATABASE_URL] [--no-vacuum]
+
+The original table had a surrogate `id`, a DATE `observation_date`, -9999
+sentinels for missing values and three overlapping indexes. The compact
+layout is keyed by `(station_id, day_number)` (WITHOUT ROWID on SQLite),
+stores missing values as NULL and keeps a single secondary index on
+`day_number`; see `models.WeatherRecord`.
+
+Rows are copied in primary-key order inside one transaction, so an
+interrupted migration leaves the old table untouched. Repeated dates keep
+their first row, as ingestion does. The dataset version is bumped in the
+same transaction, so caches keyed by it are dropped. Source files are not
+known here, so stations without an `ingest_manifest` row are reported: run
+`ingest_data.py --resume` once to give them one. On SQLite the file is
+VACUUMed afterwards so the freed pages are returned to the filesystem.
+Running the tool on an already migrated database does nothing.
+"""
+
+import argparse
+import logging
+import os
+from datetime import date, datetime
+
+from sqlalchemy import (
+    Date,
+    Integer,
+    MetaData,
+    Table,
+    cast,
+    func,
+    inspect,
+    literal,
+    select,
+    true,
+)
+from sqlalchemy.engine import make_url
+
+from aggregation import dialect_insert
+from database import (
+    WEATHER_RECORD_COLUMNS,
+    bump_dataset_version,
+    get_database_manager,
+    has_legacy_weather_layout,
+    rebuild_record_counts,
+)
+from models import (
+    MISSING_VALUE,
+    DatasetVersion,
+    IngestManifest,
+    WeatherRecord,
+    WeatherRecordCount,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+LEGACY_TABLE = 'weather_records_legacy'
+# julianday('1970-01-01')
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+
+def _day_number_expr(dialect: str, observation_date):
+    if dialect == 'sqlite':
+        return cast(func.julianday(observation_date) - UNIX_EPOCH_JULIAN_DAY, Integer)
+    return cast(observation_date - literal(date(1970, 1, 1), Date), Integer)
+
+
+def _sqlite_file_size(database_url: str):
+    url = make_url(database_url)
+    if (
+        url.get_backend_name() != 'sqlite'
+        or not url.database
+        or url.database == ':memory:'
+    ):
+        return None
+    return os.path.getsize(url.database) if os.path.exists(url.database) else None
+
+
+def _stations_without_manifest(conn) -> int:
+    """Stations with records but no `ingest_manifest` row.
+
+    These were loaded before manifests existed.
+    """
+    stations = select(WeatherRecord.station_id).distinct()
+    if inspect(conn).has_table(IngestManifest.__tablename__):
+        stations = stations.where(
+            WeatherRecord.station_id.not_in(select(IngestManifest.station_id))
+        )
+    return conn.execute(
+        select(func.count()).select_from(stations.subquery())
+    ).scalar_one()
+
+
+def migrate_weather_records(
+    database_url: str = 'sqlite:///weather.db', vacuum: bool = True
+) -> int:
+    """Migrate `weather_records` in place. Returns the number of rows copied."""
+    dbm = get_database_manager(database_url)
+    engine = dbm.engine
+    dialect = engine.dialect.name
+    size_before = _sqlite_file_size(database_url)
+
+    with engine.begin() as conn:
+        if not has_legacy_weather_layout(conn):
+            logger.info(
+                'weather_records already uses the compact layout; nothing to do'
+            )
+            return 0
+
+        logger.info(f'Renaming weather_records to {LEGACY_TABLE}')
+        conn.exec_driver_sql(
+            f'ALTER TABLE {WeatherRecord.__tablename__} RENAME TO {LEGACY_TABLE}'
+        )
+        # The old indexes moved with the table; they are dropped with it, but
+        # dropping them first keeps their names free and speeds up the copy.
+        inspector = inspect(conn)
+        for index in inspector.get_indexes(LEGACY_TABLE):
+            conn.exec_driver_sql(f'DROP INDEX {index["name"]}')
+        primary_key = inspector.get_pk_constraint(LEGACY_TABLE).get('name')
+        if dialect == 'postgresql' and primary_key:
+            # PostgreSQL index names are schema-wide; free `weather_records_pkey`.
+            conn.exec_driver_sql(
+                f'ALTER TABLE {LEGACY_TABLE} RENAME CONSTRAINT {primary_key} '
+                f'TO {LEGACY_TABLE}_pkey'
+            )
+
+        WeatherRecord.__table__.create(conn)
+        legacy = Table(LEGACY_TABLE, MetaData(), autoload_with=conn)
+
+        def present(column):
+            return func.nullif(column, MISSING_VALUE)
+
+        rows = (
+            select(
+                legacy.c.station_id,
+                _day_number_expr(dialect, legacy.c.observation_date),
+                present(legacy.c.max_temperature_tenths_celsius),
+                present(legacy.c.min_temperature_tenths_celsius),
+                present(legacy.c.precipitation_tenths_mm),
+            )
+            # SQLite needs a WHERE clause to parse INSERT ... SELECT ... ON CONFLICT.
+            .where(true())
+            .order_by(legacy.c.station_id, legacy.c.observation_date, legacy.c.id)
+        )
+        logger.info('Copying records into the compact layout...')
+        conn.execute(
+            dialect_insert(dialect)(WeatherRecord.__table__)
+            .from_select(WEATHER_RECORD_COLUMNS, rows)
+            .on_conflict_do_nothing()
+        )
+        legacy_count = conn.execute(
+            select(func.count()).select_from(legacy)
+        ).scalar_one()
+        copied = conn.execute(
+            select(func.count()).select_from(WeatherRecord.__table__)
+        ).scalar_one()
+        conn.exec_driver_sql(f'DROP TABLE {LEGACY_TABLE}')
+        WeatherRecordCount.__table__.create(conn, checkfirst=True)
+        rebuild_record_counts(conn)
+        # Cached responses, station cache and prefix-sum files of the old table
+        # are stale.
+        DatasetVersion.__table__.create(conn, checkfirst=True)
+        bump_dataset_version(conn, records=True)
+        unmanifested = _stations_without_manifest(conn)
+
+    if legacy_count != copied:
+        logger.warning(
+            f'{legacy_count - copied:,} rows with repeated (station, date) were dropped'
+        )
+    logger.info(f'Copied {copied:,} weather records')
+    if unmanifested:
+        logger.warning(
+            f'{unmanifested:,} stations have no ingest manifest, so incremental '
+            'ingestion skips data appended to their files; run '
+            '`ingest_data.py --resume` once to reload them with one'
+        )
+
+    if dialect == 'sqlite' and vacuum:
+        logger.info('Running VACUUM and ANALYZE...')
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('VACUUM')
+            conn.exec_driver_sql('ANALYZE')
+        size_after = _sqlite_file_size(database_url)
+        if size_before and size_after:
+            logger.info(
+                f'Database file: {size_before / 1e6:,.1f} MB -> '
+                f'{size_after / 1e6:,.1f} MB'
+            )
+    engine.dispose()
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Migrate weather_records to the compact '
+        '(station_id, day_number) layout'
+    )
+    parser.add_argument(
+        '--db',
+        default='sqlite:///weather.db',
+        help='Database URL (default: sqlite:///weather.db)',
+    )
+    parser.add_argument(
+        '--no-vacuum',
+        dest='vacuum',
+        action='store_false',
+        help='Skip the SQLite VACUUM after migrating',
+    )
+    args = parser.parse_args()
+
+    start = datetime.now()
+    count = migrate_weather_records(args.db, vacuum=args.vacuum)
+    logger.info(
+        f'Migration complete: {count:,} records in '
+        f'{(datetime.now() - start).total_seconds():.2f} seconds'
+    )
+
+
+if __name__ == '__main__':
+    main()
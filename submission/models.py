@@ -6,8 +6,21 @@ to avoid floating point storage issues; conversions are provided as
 properties and performed at aggregation / API layers.
 """
 
-from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey, Index
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Integer,
+    String,
+    Date,
+    Float,
+    ForeignKey,
+    Index,
+)
+from sqlalchemy.orm import declarative_base, relationship, validates
+
+from weather_parser import date_to_day_number, day_number_to_date
+
+MISSING_VALUE = -9999
 
 Base = declarative_base()
 
@@ -19,18 +32,31 @@ class WeatherStation(Base):
     station_id = Column(String(20), unique=True, nullable=False, index=True)
     state = Column(String(50), nullable=True)
 
-    weather_records = relationship('WeatherRecord', back_populates='station', cascade='all, delete-orphan')
+    weather_records = relationship(
+        'WeatherRecord', back_populates='station', cascade='all, delete-orphan'
+    )
 
     def __repr__(self):
         return f'<WeatherStation {self.station_id} ({self.state})>'
 
 
 class WeatherRecord(Base):
+    """One station-day, clustered by `(station_id, day_number)`.
+
+    `day_number` counts days since 1970-01-01; `observation_date` converts
+    to and from it. On SQLite the table is WITHOUT ROWID, so the primary key
+    is the table itself and station/date-range scans are clustered reads.
+    Missing values (-9999 in the raw files) are stored as NULL.
+    """
     __tablename__ = 'weather_records'
 
-    id = Column(Integer, primary_key=True)
-    station_id = Column(Integer, ForeignKey('weather_stations.id'), nullable=False)
-    observation_date = Column(Date, nullable=False)
+    station_id = Column(
+        Integer,
+        ForeignKey('weather_stations.id'),
+        primary_key=True,
+        autoincrement=False,
+    )
+    day_number = Column(Integer, primary_key=True, autoincrement=False)
     max_temperature_tenths_celsius = Column(Integer, nullable=True)
     min_temperature_tenths_celsius = Column(Integer, nullable=True)
     precipitation_tenths_mm = Column(Integer, nullable=True)
@@ -38,33 +64,83 @@ class WeatherRecord(Base):
     station = relationship('WeatherStation', back_populates='weather_records')
 
     __table_args__ = (
-        Index('idx_station_date', 'station_id', 'observation_date'),
-        Index('idx_observation_date', 'observation_date'),
-        Index('idx_station_id', 'station_id'),
+        Index('idx_day_number', 'day_number'),
+        {'sqlite_with_rowid': False},
     )
 
     def __repr__(self):
         return f'<WeatherRecord {self.observation_date} Station={self.station_id}>'
 
+    @property
+    def observation_date(self):
+        return (
+            day_number_to_date(self.day_number) if self.day_number is not None else None
+        )
+
+    @observation_date.setter
+    def observation_date(self, value):
+        self.day_number = date_to_day_number(value)
+
+    @validates(
+        'max_temperature_tenths_celsius',
+        'min_temperature_tenths_celsius',
+        'precipitation_tenths_mm',
+    )
+    def _normalize_missing(self, key, value):
+        return None if value == MISSING_VALUE else value
+
     @property
     def max_temperature_celsius(self):
-        if self.max_temperature_tenths_celsius is None or self.max_temperature_tenths_celsius == -9999:
+        if (
+            self.max_temperature_tenths_celsius is None
+            or self.max_temperature_tenths_celsius == -9999
+        ):
             return None
         return self.max_temperature_tenths_celsius / 10.0
 
     @property
     def min_temperature_celsius(self):
-        if self.min_temperature_tenths_celsius is None or self.min_temperature_tenths_celsius == -9999:
+        if (
+            self.min_temperature_tenths_celsius is None
+            or self.min_temperature_tenths_celsius == -9999
+        ):
             return None
         return self.min_temperature_tenths_celsius / 10.0
 
     @property
     def precipitation_mm(self):
-        if self.precipitation_tenths_mm is None or self.precipitation_tenths_mm == -9999:
+        if (
+            self.precipitation_tenths_mm is None
+            or self.precipitation_tenths_mm == -9999
+        ):
             return None
         return self.precipitation_tenths_mm / 10.0
 
 
+class WeatherRecordCount(Base):
+    """Number of `weather_records` rows per (station, year).
+
+    Kept up to date by ingestion in the same transaction as the records so
+    the API can estimate result sizes without a COUNT(*) over the records.
+    """
+    __tablename__ = 'weather_record_counts'
+
+    id = Column(Integer, primary_key=True)
+    station_id = Column(Integer, ForeignKey('weather_stations.id'), nullable=False)
+    year = Column(Integer, nullable=False)
+    row_count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('idx_counts_station_year', 'station_id', 'year', unique=True),
+    )
+
+    def __repr__(self):
+        return (
+            f'<WeatherRecordCount station={self.station_id} year={self.year} '
+            f'rows={self.row_count}>'
+        )
+
+
 class CropYield(Base):
     __tablename__ = 'crop_yield'
 
@@ -80,7 +156,9 @@ class YearlyStationStats(Base):
     __tablename__ = 'yearly_station_stats'
 
     id = Column(Integer, primary_key=True)
-    station_id = Column(Integer, ForeignKey('weather_stations.id'), nullable=False, index=True)
+    station_id = Column(
+        Integer, ForeignKey('weather_stations.id'), nullable=False, index=True
+    )
     year = Column(Integer, nullable=False, index=True)
 
     avg_max_celsius = Column(Float, nullable=True)
@@ -94,4 +172,72 @@ class YearlyStationStats(Base):
     )
 
     def __repr__(self):
-        return f'<YearlyStationStats station={self.station_id} year={self.year} max={self.avg_max_celsius}>'
+        return (
+            f'<YearlyStationStats station={self.station_id} year={self.year} '
+            f'max={self.avg_max_celsius}>'
+        )
+
+
+class DatasetVersion(Base):
+    """Counters bumped by the transactions that change API-visible data.
+
+    Ingestion and analysis increment row `DATASET_VERSION_ID` alongside their
+    writes; the API uses it to key cached responses and ETags. Row
+    `RECORDS_VERSION_ID` only moves when `weather_records` changes and keys
+    the station cache files (see `database.bump_dataset_version`).
+    """
+    __tablename__ = 'dataset_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DatasetVersion {self.version}>'
+
+
+class StatsDirtyPartition(Base):
+    """A (station, year) whose records changed since the stats were computed.
+
+    Written by ingestion in the same transaction as the records and cleared
+    by `analyze_data.py` once the partition has been re-aggregated.
+    """
+    __tablename__ = 'stats_dirty'
+
+    id = Column(Integer, primary_key=True)
+    station_id = Column(Integer, ForeignKey('weather_stations.id'), nullable=False)
+    year = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('idx_dirty_station_year', 'station_id', 'year', unique=True),
+    )
+
+    def __repr__(self):
+        return f'<StatsDirtyPartition station={self.station_id} year={self.year}>'
+
+
+class IngestManifest(Base):
+    """Per-station record of the source file state at the last bulk ingest.
+
+    `file_size` doubles as the byte offset ingestion has consumed (up to the
+    last complete line) and `content_hash` is the SHA-256 of those bytes, so
+    an appended file can be verified and only its tail parsed on the next run.
+    """
+    __tablename__ = 'ingest_manifest'
+
+    id = Column(Integer, primary_key=True)
+    station_id = Column(
+        Integer, ForeignKey('weather_stations.id'), nullable=False, unique=True
+    )
+    file_name = Column(String(255), nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    file_mtime = Column(Float, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    last_observation_date = Column(Date, nullable=True)
+
+    station = relationship('WeatherStation')
+
+    def __repr__(self):
+        return (
+            f'<IngestManifest station={self.station_id} {self.file_name} '
+            f'size={self.file_size}>'
+        )
@@ -0,0 +1,246 @@
+"""
+Per-station prefix sums for arbitrary date-range aggregates (Problem 4).
+
+For each station the valid (non -9999) max/min/precip tenths values and
+their counts are accumulated day by day::
+
+    cumulative[k][i] = sum of column k over the station's first i records
+
+so the aggregate of any day range is two binary searches and a difference,
+whatever the range length. Averages are `sum / count / 10.0` and totals
+`sum / 100.0` (cm), the same operations `yearly_station_stats` uses, so a
+calendar-year range reproduces the stored yearly row exactly.
+
+`analyze_data.py --prefix-sums DIR` writes one `<station code>.wxp` file per
+station::
+
+    'WXP1' | uint32 station pk | int64 dataset version | uint32 n
+           | int32 day_number[n] | int64 cumulative[6][n + 1]
+
+The dataset version (see `database.bump_dataset_version`) is the one the
+data had when the file was written; a file from another version is
+ignored. `PrefixSumIndex` serves mapped files when they are current and
+otherwise builds the sums from the database and keeps them in a small LRU.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import select
+
+from aggregation import fetch_station_range
+from models import MISSING_VALUE, WeatherStation
+from station_cache import STATION_CODE_RE
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WXP1'
+HEADER = struct.Struct('<4sIqI')
+FILE_SUFFIX = '.wxp'
+DAY_DTYPE = np.dtype('<i4')
+SUM_DTYPE = np.dtype('<i8')
+# max_sum, max_count, min_sum, min_count, precip_sum, precip_count
+SUM_COLUMNS = 6
+DEFAULT_MAX_STATIONS = 64
+
+
+class PrefixSums:
+    """One station's sorted day numbers and cumulative (sum, count) columns."""
+
+    __slots__ = ('station_pk', 'version', 'day_numbers', 'cumulative')
+
+    def __init__(self, station_pk, version, day_numbers, cumulative):
+        self.station_pk = station_pk
+        self.version = version
+        self.day_numbers = day_numbers
+        self.cumulative = cumulative
+
+    def __len__(self):
+        return len(self.day_numbers)
+
+    @classmethod
+    def from_columns(
+        cls, station_pk, version, day_numbers, max_tenths, min_tenths, precip_tenths
+    ):
+        order = np.argsort(day_numbers, kind='stable')
+        cumulative = np.zeros((SUM_COLUMNS, len(order) + 1), dtype=SUM_DTYPE)
+        for k, column in enumerate((max_tenths, min_tenths, precip_tenths)):
+            column = np.asarray(column, dtype=np.int64)[order]
+            valid = column != MISSING_VALUE
+            np.cumsum(np.where(valid, column, 0), out=cumulative[2 * k, 1:])
+            np.cumsum(valid, out=cumulative[2 * k + 1, 1:])
+        return cls(
+            station_pk,
+            version,
+            np.asarray(day_numbers)[order].astype(DAY_DTYPE),
+            cumulative,
+        )
+
+    def aggregate(self, first_day=None, last_day=None):
+        """`(record_count, max, min, precip)` over days in `[first_day, last_day]`.
+
+        None bounds are open. `max` / `min` are `(avg_celsius, valid_count)`,
+        `precip` is `(total_cm, valid_count)`; the value is None when the range
+        has no valid observation.
+        """
+        start = (
+            0
+            if first_day is None
+            else int(np.searchsorted(self.day_numbers, first_day, side='left'))
+        )
+        stop = (
+            len(self)
+            if last_day is None
+            else int(np.searchsorted(self.day_numbers, last_day, side='right'))
+        )
+        stop = max(start, stop)
+        totals = (self.cumulative[:, stop] - self.cumulative[:, start]).tolist()
+        max_sum, max_count, min_sum, min_count, precip_sum, precip_count = totals
+        return (
+            stop - start,
+            (max_sum / max_count / 10.0 if max_count else None, max_count),
+            (min_sum / min_count / 10.0 if min_count else None, min_count),
+            (float(precip_sum) / 100.0 if precip_count else None, precip_count),
+        )
+
+
+def build_prefix_sums(conn, station_pk: int, version) -> PrefixSums:
+    _, day_numbers, max_tenths, min_tenths, precip_tenths = fetch_station_range(
+        conn, station_pk, station_pk
+    )
+    return PrefixSums.from_columns(
+        station_pk, version, day_numbers, max_tenths, min_tenths, precip_tenths
+    )
+
+
+class PrefixSumStore:
+    """Directory of `.wxp` files."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, station_code: str) -> Path:
+        if not STATION_CODE_RE.fullmatch(station_code or ''):
+            raise ValueError(f'Station code cannot be stored: {station_code!r}')
+        return self.directory / f'{station_code}{FILE_SUFFIX}'
+
+    def write(self, station_code: str, sums: PrefixSums) -> None:
+        """Write one station's sums atomically (temp file + rename)."""
+        path = self.path(station_code)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=self.directory, prefix=f'.{station_code}.', suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, sums.station_pk, sums.version, len(sums)))
+                f.write(sums.day_numbers.astype(DAY_DTYPE).tobytes())
+                f.write(
+                    np.ascontiguousarray(sums.cumulative, dtype=SUM_DTYPE).tobytes()
+                )
+            os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    def read(self, station_code: str):
+        """The mapped `PrefixSums` of a station, or None when there is no valid file."""
+        try:
+            path = self.path(station_code)
+            size = os.stat(path).st_size
+        except (FileNotFoundError, ValueError):
+            return None
+        if size < HEADER.size:
+            logger.warning(f'Ignoring truncated prefix-sum file {path}')
+            return None
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, station_pk, version, count = HEADER.unpack_from(buf)
+        if (
+            magic != MAGIC
+            or len(buf)
+            != HEADER.size
+            + count * DAY_DTYPE.itemsize
+            + SUM_COLUMNS * (count + 1) * SUM_DTYPE.itemsize
+        ):
+            logger.warning(f'Ignoring malformed prefix-sum file {path}')
+            return None
+        day_numbers = np.frombuffer(
+            buf, dtype=DAY_DTYPE, count=count, offset=HEADER.size
+        )
+        cumulative = np.frombuffer(
+            buf,
+            dtype=SUM_DTYPE,
+            count=SUM_COLUMNS * (count + 1),
+            offset=HEADER.size + count * DAY_DTYPE.itemsize,
+        ).reshape(SUM_COLUMNS, count + 1)
+        return PrefixSums(station_pk, version, day_numbers, cumulative)
+
+    def rebuild(self, engine, version) -> int:
+        """Write every station's sums for dataset `version`; returns the file count."""
+        stations_table = WeatherStation.__table__
+        written = 0
+        with engine.connect() as conn:
+            stations = conn.execute(
+                select(stations_table.c.id, stations_table.c.station_id)
+            ).all()
+            for station_pk, station_code in stations:
+                if not STATION_CODE_RE.fullmatch(station_code):
+                    logger.warning(
+                        f'Not writing prefix sums for station code {station_code!r}'
+                    )
+                    continue
+                self.write(station_code, build_prefix_sums(conn, station_pk, version))
+                written += 1
+        return written
+
+
+class PrefixSumIndex:
+    """Prefix sums by station code for the current dataset version.
+
+    Looks in memory, then in the store's files, and finally builds the sums
+    from the database. Up to `max_stations` stations are kept in memory.
+    """
+
+    def __init__(
+        self, engine, directory=None, max_stations: int = DEFAULT_MAX_STATIONS
+    ):
+        self.engine = engine
+        self.store = PrefixSumStore(directory) if directory else None
+        self.max_stations = max_stations
+        self._lock = threading.Lock()
+        self._cached = OrderedDict()
+
+    def get(self, station_code: str, station_pk: int, version) -> PrefixSums:
+        """`PrefixSums` for the station at dataset `version`."""
+        with self._lock:
+            sums = self._cached.get(station_code)
+            if sums is not None and version is not None and sums.version == version:
+                self._cached.move_to_end(station_code)
+                return sums
+
+        sums = self.store.read(station_code) if self.store is not None else None
+        if (
+            sums is None
+            or version is None
+            or sums.version != version
+            or sums.station_pk != station_pk
+        ):
+            with self.engine.connect() as conn:
+                sums = build_prefix_sums(conn, station_pk, version)
+
+        if version is not None and self.max_stations > 0:
+            with self._lock:
+                self._cached[station_code] = sums
+                self._cached.move_to_end(station_code)
+                while len(self._cached) > self.max_stations:
+                    self._cached.popitem(last=False)
+        return sums
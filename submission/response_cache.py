@@ -0,0 +1,105 @@
+"""
+In-process response caching for the read API (Problem 4).
+
+`weather_records` and `yearly_station_stats` only change when ingestion or
+analysis runs, and both bump `dataset_version.version` in the transaction
+that changes them (see `database.bump_dataset_version`). The API keys its
+cached response bodies and ETags on that version:
+
+- `DatasetVersionTracker` reads the version at most once per `ttl` seconds,
+  so a conditional request can be answered with 304 without a query;
+- `ResponseCache` is a size-limited LRU of response bodies for the current
+  version. Entries of older versions are dropped as soon as a newer one is
+  seen.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from database import DATASET_VERSION_ID, read_dataset_version
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_VERSION_TTL = 1.0
+
+
+class DatasetVersionTracker:
+    """The dataset version, re-read from the database at most every `ttl` seconds.
+
+    `counter_id` picks the counter (`database.RECORDS_VERSION_ID` for the
+    records version).
+    """
+
+    def __init__(
+        self,
+        engine,
+        ttl: float = DEFAULT_VERSION_TTL,
+        counter_id: int = DATASET_VERSION_ID,
+    ):
+        self.engine = engine
+        self.ttl = ttl
+        self.counter_id = counter_id
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = None
+
+    def current(self):
+        """Current version, or None when the database has no `dataset_version` table."""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.ttl:
+                return self._version
+        with self.engine.connect() as conn:
+            version = read_dataset_version(conn, self.counter_id)
+        with self._lock:
+            self._version, self._checked_at = version, now
+        return version
+
+
+class ResponseCache:
+    """LRU of response bodies for one dataset version, bounded by entries and bytes."""
+
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _reset(self, version) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        self._version = version
+
+    def get(self, key, version):
+        with self._lock:
+            if version != self._version:
+                return None
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, version, body: bytes) -> None:
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if version != self._version:
+                if self._version is not None and version < self._version:
+                    return
+                self._reset(version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
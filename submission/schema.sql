@@ -9,19 +9,30 @@ CREATE TABLE IF NOT EXISTS weather_stations (
     state TEXT
 );
 
+-- One row per station-day; day_number = days since 1970-01-01, NULL = missing
 CREATE TABLE IF NOT EXISTS weather_records (
-    id INTEGER PRIMARY KEY,
     station_id INTEGER NOT NULL,
-    observation_date DATE NOT NULL,
+    day_number INTEGER NOT NULL,
     max_temperature_tenths_celsius INTEGER,
     min_temperature_tenths_celsius INTEGER,
     precipitation_tenths_mm INTEGER,
+    PRIMARY KEY (station_id, day_number),
+    FOREIGN KEY(station_id) REFERENCES weather_stations(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_day_number ON weather_records(day_number);
+
+-- Rows per (station, year) in weather_records; maintained by ingestion so the
+-- API can estimate totals without COUNT(*)
+CREATE TABLE IF NOT EXISTS weather_record_counts (
+    id INTEGER PRIMARY KEY,
+    station_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
     FOREIGN KEY(station_id) REFERENCES weather_stations(id) ON DELETE CASCADE
 );
 
-CREATE INDEX IF NOT EXISTS idx_station_date ON weather_records(station_id, observation_date);
-CREATE INDEX IF NOT EXISTS idx_observation_date ON weather_records(observation_date);
-CREATE INDEX IF NOT EXISTS idx_station_id ON weather_records(station_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_counts_station_year ON weather_record_counts(station_id, year);
 
 CREATE TABLE IF NOT EXISTS crop_yield (
     id INTEGER PRIMARY KEY,
@@ -41,4 +52,34 @@ CREATE TABLE IF NOT EXISTS yearly_station_stats (
 
 CREATE UNIQUE INDEX IF NOT EXISTS idx_stats_station_year ON yearly_station_stats(station_id, year);
 
+-- (station, year) partitions whose stats are stale; written by ingestion,
+-- cleared by `analyze_data.py --incremental` (or any full recompute)
+CREATE TABLE IF NOT EXISTS stats_dirty (
+    id INTEGER PRIMARY KEY,
+    station_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    FOREIGN KEY(station_id) REFERENCES weather_stations(id) ON DELETE CASCADE
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_dirty_station_year ON stats_dirty(station_id, year);
+
+-- Single-row counter bumped by every ingestion/analysis transaction; keys the
+-- API's response cache and ETags
+CREATE TABLE IF NOT EXISTS dataset_version (
+    id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Source-file state per station at the last bulk ingest (incremental appends)
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    id INTEGER PRIMARY KEY,
+    station_id INTEGER NOT NULL UNIQUE,
+    file_name TEXT NOT NULL,
+    file_size BIGINT NOT NULL,
+    file_mtime REAL NOT NULL,
+    content_hash TEXT NOT NULL,
+    last_observation_date DATE,
+    FOREIGN KEY(station_id) REFERENCES weather_stations(id) ON DELETE CASCADE
+);
+
 COMMIT;
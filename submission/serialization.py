@@ -0,0 +1,153 @@
+"""
+JSON encoding of API pages straight from row values (Problem 4).
+
+Building a dict and a `date` per row and handing the page to `jsonify`
+costs more than the query on large pages. Here each field's column is
+turned into JSON text with one list comprehension (dates and station codes
+through small lookup tables) and the texts are joined, either as one
+object per row (`records`, the default) or as one array per field
+(`columnar`)::
+
+    {"data": {"station_id": ["USC00110072", ...], "date": ["1990-01-01", ...], ...},
+     "pagination": {...}}
+
+Numbers are written with `float.__repr__`, as `json.dumps` writes them, so
+both shapes carry exactly the values of the dict-based encoding.
+"""
+
+import json
+
+from models import MISSING_VALUE
+from weather_parser import day_number_to_date
+
+FORMATS = ('records', 'columnar')
+WEATHER_FIELDS = (
+    'id',
+    'station_id',
+    'date',
+    'max_temperature_celsius',
+    'min_temperature_celsius',
+    'precipitation_mm',
+)
+STATS_FIELDS = (
+    'station_id',
+    'year',
+    'avg_max_celsius',
+    'avg_min_celsius',
+    'total_precip_cm',
+)
+
+dumps = json.JSONEncoder(separators=(',', ':')).encode
+
+# day number -> '"YYYY-MM-DD"' and tenths -> number text; both bounded by the
+# range of the data (dates covered, plausible measurements).
+_DAY_TEXT = {}
+_TENTHS_TEXT = {None: 'null', MISSING_VALUE: 'null'}
+
+
+def _day_text(day_number: int) -> str:
+    text = _DAY_TEXT[day_number] = f'"{day_number_to_date(day_number).isoformat()}"'
+    return text
+
+
+def day_texts(day_numbers):
+    """Quoted ISO dates of day numbers."""
+    cache = _DAY_TEXT
+    return [cache.get(day) or _day_text(day) for day in day_numbers]
+
+
+def _tenths_text(tenths: int) -> str:
+    text = _TENTHS_TEXT[tenths] = repr(tenths / 10.0)
+    return text
+
+
+def tenths_texts(values):
+    """Tenths as JSON numbers in units; None and the -9999 sentinel become null."""
+    cache = _TENTHS_TEXT
+    return [cache.get(v) or _tenths_text(v) for v in values]
+
+
+def number_texts(values):
+    return ['null' if v is None else repr(float(v)) for v in values]
+
+
+def station_texts(station_pks, station_codes):
+    """Quoted station codes for primary keys, through `station_codes` (pk -> code)."""
+    quoted = {pk: dumps(station_codes[pk]) for pk in set(station_pks)}
+    return [quoted[pk] for pk in station_pks]
+
+
+def record_id_texts(stations, days):
+    """Quoted `"<station code>:<YYYY-MM-DD>"` record ids from quoted codes and dates."""
+    return [f'{station[:-1]}:{day[1:]}' for station, day in zip(stations, days)]
+
+
+def weather_texts(rows, station_codes):
+    """Text columns in `WEATHER_FIELDS` order.
+
+    Rows are `(station_pk, day_number, max, min, precip)`.
+    """
+    station_pks, day_numbers, max_tenths, min_tenths, precip_tenths = (
+        zip(*rows) if rows else ((),) * 5
+    )
+    stations, days = station_texts(station_pks, station_codes), day_texts(day_numbers)
+    return [
+        record_id_texts(stations, days),
+        stations,
+        days,
+        tenths_texts(max_tenths),
+        tenths_texts(min_tenths),
+        tenths_texts(precip_tenths),
+    ]
+
+
+def stats_texts(rows, station_codes):
+    """Text columns in `STATS_FIELDS` order.
+
+    Rows are `(station_pk, year, avg_max, avg_min, total_precip)`.
+    """
+    station_pks, years, avg_max, avg_min, total_precip = (
+        zip(*rows) if rows else ((),) * 5
+    )
+    return [
+        station_texts(station_pks, station_codes),
+        [str(int(year)) for year in years],
+        number_texts(avg_max),
+        number_texts(avg_min),
+        number_texts(total_precip),
+    ]
+
+
+def encode_data(fields, texts, columnar: bool = False) -> str:
+    """JSON text of a page: an array of objects, or object of arrays if `columnar`."""
+    if columnar:
+        return (
+            '{'
+            + ','.join(
+                f'"{name}":[{",".join(column)}]' for name, column in zip(fields, texts)
+            )
+            + '}'
+        )
+    template = '{' + ','.join(f'"{name}":%s' for name in fields) + '}'
+    return '[' + ','.join(template % values for values in zip(*texts)) + ']'
+
+
+def encode_page(fields, texts, pagination, columnar: bool = False) -> bytes:
+    """`{"data": ..., "pagination": ...}` as UTF-8 bytes."""
+    data = encode_data(fields, texts, columnar)
+    return f'{{"data":{data},"pagination":{dumps(pagination)}}}'.encode()
+
+
+def series_texts(station_code: str, series):
+    """Text columns in `WEATHER_FIELDS` order for a `station_cache.StationSeries`."""
+    stations, days = [dumps(station_code)] * len(series.day_numbers), day_texts(
+        series.day_numbers.tolist()
+    )
+    return [
+        record_id_texts(stations, days),
+        stations,
+        days,
+        tenths_texts(series.max_tenths.tolist()),
+        tenths_texts(series.min_tenths.tolist()),
+        tenths_texts(series.precip_tenths.tolist()),
+    ]
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+Memory-mapped columnar cache of raw weather series, one file per station (Problem 4).
+
+Usage:
+    python station_cache.py --cache-dir DIR [--db DATABASE_URL] [--station CODE ...]
+
+Each station's records are exported from `weather_records` to
+`<cache-dir>/<station code>.wxc`::
+
+    'WXC4' | uint32 station pk | int64 records version | uint32 n
+           | int32 day_number[n] | int16 max[n] | int16 min[n] | int16 precip[n]
+
+little-endian and sorted by day number (days since 1970-01-01), with missing
+values stored as -9999. The station's primary key is kept so cached answers
+can emit the same pagination cursors as the database path. The API maps these
+files and answers station / date-range queries with a binary search and slices,
+without building ORM objects. The database stays the source of truth: a file
+holds the records version (`database.RECORDS_VERSION_ID`, bumped by every
+change to `weather_records` but not by analysis) it was exported at, and a file
+from another version, like a missing one, sends the API back to the database.
+Ingestion removes a station's file before changing its records, exports it
+again after the commit and, when nothing else wrote records in between,
+carries the run's files over to the version it ended at (`restamp`).
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, select
+
+from aggregation import fetch_station_range
+import database  # module import: `database` imports this module too
+from models import WeatherStation
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WXC4'
+HEADER = struct.Struct('<4sIqI')
+FILE_SUFFIX = '.wxc'
+DAY_DTYPE = np.dtype('<i4')
+VALUE_DTYPE = np.dtype('<i2')
+# Station codes become file names; anything else is never looked up on disk.
+STATION_CODE_RE = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9_.-]*')
+# Stamped on files exported without a `dataset_version` table; matches no version.
+NO_VERSION = -1
+
+
+class StationSeries:
+    """A station's cached columns (read-only views over the mapped file)."""
+
+    __slots__ = (
+        'station_pk',
+        'version',
+        'day_numbers',
+        'max_tenths',
+        'min_tenths',
+        'precip_tenths',
+    )
+
+    def __init__(
+        self, station_pk, version, day_numbers, max_tenths, min_tenths, precip_tenths
+    ):
+        self.station_pk = station_pk
+        self.version = version
+        self.day_numbers = day_numbers
+        self.max_tenths = max_tenths
+        self.min_tenths = min_tenths
+        self.precip_tenths = precip_tenths
+
+    def __len__(self):
+        return len(self.day_numbers)
+
+    def day_range(self, first_day=None, last_day=None):
+        """`(start, stop)` rows of days in `[first_day, last_day]` (None = open)."""
+        start = (
+            0
+            if first_day is None
+            else int(np.searchsorted(self.day_numbers, first_day, side='left'))
+        )
+        stop = (
+            len(self)
+            if last_day is None
+            else int(np.searchsorted(self.day_numbers, last_day, side='right'))
+        )
+        return start, max(start, stop)
+
+    def position_after(self, day_number, station_pk):
+        """First row sorting after `(day_number, station_pk)` in day, station order."""
+        side = 'right' if self.station_pk <= station_pk else 'left'
+        return int(np.searchsorted(self.day_numbers, day_number, side=side))
+
+    def slice(self, start, stop):
+        return StationSeries(
+            self.station_pk,
+            self.version,
+            self.day_numbers[start:stop],
+            self.max_tenths[start:stop],
+            self.min_tenths[start:stop],
+            self.precip_tenths[start:stop],
+        )
+
+
+class StationCache:
+    """Directory of `.wxc` files plus the mappings this process has opened."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        # station code -> ((st_ino, st_mtime_ns, st_size), StationSeries)
+        self._mapped = {}
+
+    def path(self, station_code: str) -> Path:
+        if not STATION_CODE_RE.fullmatch(station_code or ''):
+            raise ValueError(f'Station code cannot be cached: {station_code!r}')
+        return self.directory / f'{station_code}{FILE_SUFFIX}'
+
+    def write_station(
+        self,
+        station_code: str,
+        station_pk: int,
+        version,
+        day_numbers,
+        max_tenths,
+        min_tenths,
+        precip_tenths,
+    ) -> None:
+        """Write one station's series at records `version` via temp file + rename."""
+        path = self.path(station_code)
+        order = np.argsort(day_numbers, kind='stable')
+        values = []
+        for column in (max_tenths, min_tenths, precip_tenths):
+            column = np.asarray(column)[order]
+            if len(column) and (
+                column.min() < np.iinfo(VALUE_DTYPE).min
+                or column.max() > np.iinfo(VALUE_DTYPE).max
+            ):
+                raise ValueError(
+                    f'{station_code}: values do not fit the int16 cache format'
+                )
+            values.append(column.astype(VALUE_DTYPE))
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=self.directory, prefix=f'.{station_code}.', suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(
+                    HEADER.pack(
+                        MAGIC,
+                        station_pk,
+                        NO_VERSION if version is None else version,
+                        len(order),
+                    )
+                )
+                f.write(np.asarray(day_numbers)[order].astype(DAY_DTYPE).tobytes())
+                for column in values:
+                    f.write(column.tobytes())
+            os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    def export_station(self, conn, station_pk: int, station_code: str) -> int:
+        """Export one station from the database. Returns the number of rows written."""
+        # Version first: a write landing in between leaves the file stale, never wrong.
+        version = database.read_dataset_version(conn, database.RECORDS_VERSION_ID)
+        _, day_numbers, max_tenths, min_tenths, precip_tenths = fetch_station_range(
+            conn, station_pk, station_pk
+        )
+        try:
+            self.write_station(
+                station_code,
+                station_pk,
+                version,
+                day_numbers,
+                max_tenths,
+                min_tenths,
+                precip_tenths,
+            )
+        except ValueError as e:
+            logger.warning(f'Not caching {e}')
+            self.invalidate(station_code)
+            return 0
+        return len(day_numbers)
+
+    def invalidate(self, station_code: str) -> None:
+        """Remove a station's file so readers fall back to the database."""
+        try:
+            self.path(station_code).unlink()
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def clear(self) -> None:
+        if self.directory.is_dir():
+            for path in self.directory.glob(f'*{FILE_SUFFIX}'):
+                path.unlink()
+
+    def restamp(self, from_version: int, to_version: int) -> int:
+        """Mark files exported at `from_version`..`to_version` current at `to_version`.
+
+        Only for callers that know the data of those files did not change in
+        between. Returns the number of files updated.
+        """
+        updated = 0
+        if not self.directory.is_dir():
+            return updated
+        for path in self.directory.glob(f'*{FILE_SUFFIX}'):
+            with open(path, 'r+b') as f:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    continue
+                magic, station_pk, version, count = HEADER.unpack(header)
+                if magic != MAGIC or not from_version <= version < to_version:
+                    continue
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, station_pk, to_version, count))
+            updated += 1
+        return updated
+
+    def rebuild(self, engine, station_codes=None) -> int:
+        """Export every station (or only `station_codes`); returns the file count."""
+        stations_table = WeatherStation.__table__
+        stmt = select(stations_table.c.id, stations_table.c.station_id).order_by(
+            stations_table.c.station_id
+        )
+        if station_codes:
+            stmt = stmt.where(stations_table.c.station_id.in_(station_codes))
+        written = 0
+        with engine.connect() as conn:
+            for station_pk, station_code in conn.execute(stmt).all():
+                self.export_station(conn, station_pk, station_code)
+                written += 1
+        return written
+
+    def get(self, station_code: str, version):
+        """The mapped `StationSeries` of a station at records `version`, or None."""
+        try:
+            path = self.path(station_code)
+            stat = os.stat(path)
+        except (FileNotFoundError, ValueError):
+            self._mapped.pop(station_code, None)
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        mapped = self._mapped.get(station_code)
+        if mapped is not None and mapped[0] == key:
+            return (
+                mapped[1]
+                if version is not None and mapped[1].version == version
+                else None
+            )
+
+        if stat.st_size < HEADER.size:
+            logger.warning(f'Ignoring truncated cache file {path}')
+            return None
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, station_pk, file_version, count = HEADER.unpack_from(buf)
+        if magic != MAGIC or len(buf) != HEADER.size + count * (
+            DAY_DTYPE.itemsize + 3 * VALUE_DTYPE.itemsize
+        ):
+            logger.warning(f'Ignoring malformed cache file {path}')
+            return None
+        offset = HEADER.size
+        day_numbers = np.frombuffer(buf, dtype=DAY_DTYPE, count=count, offset=offset)
+        offset += count * DAY_DTYPE.itemsize
+        columns = []
+        for _ in range(3):
+            columns.append(
+                np.frombuffer(buf, dtype=VALUE_DTYPE, count=count, offset=offset)
+            )
+            offset += count * VALUE_DTYPE.itemsize
+        series = StationSeries(station_pk, file_version, day_numbers, *columns)
+        self._mapped[station_code] = (key, series)
+        return series if version is not None and file_version == version else None
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(
+        description='Export per-station columnar cache files for the API'
+    )
+    parser.add_argument(
+        '--db',
+        default='sqlite:///weather.db',
+        help='Database URL (default: sqlite:///weather.db)',
+    )
+    parser.add_argument(
+        '--cache-dir', required=True, help='Directory for the .wxc files'
+    )
+    parser.add_argument(
+        '--station',
+        action='append',
+        default=None,
+        help='Only export this station code (repeatable)',
+    )
+    args = parser.parse_args()
+
+    start = datetime.now()
+    cache = StationCache(args.cache_dir)
+    engine = create_engine(args.db)
+    try:
+        count = cache.rebuild(engine, args.station)
+    finally:
+        engine.dispose()
+    logger.info(
+        f'Exported {count} stations to {args.cache_dir} in '
+        f'{(datetime.now() - start).total_seconds():.2f} seconds'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""
+Vectorized parser for GHCN-style daily weather station files (Problem 2).
+
+Every well-formed line has the same fixed-width layout::
+
+    YYYYMMDD\\t  max\\t  min\\t  precip
+
+i.e. an 8-digit date followed by three tab-separated, right-aligned 5-char
+integer fields (26 bytes per line). A file is read in one call and decoded
+as a NumPy byte matrix, so dates become integer day numbers (days since
+1970-01-01) without calling `datetime.strptime` per row.
+
+Lines that do not match the fixed-width layout are handed to the scalar
+`parse_station_lines` parser, which keeps the original ingestion semantics
+(and its per-line error reporting) for anything unusual.
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+LINE_WIDTH = 26
+DATE_WIDTH = 8
+TAB_POSITIONS = (8, 14, 20)
+VALUE_SLICES = (slice(9, 14), slice(15, 20), slice(21, 26))
+
+
+def date_to_day_number(d: date) -> int:
+    return d.toordinal() - EPOCH_ORDINAL
+
+
+def day_number_to_date(day_number: int) -> date:
+    return date.fromordinal(int(day_number) + EPOCH_ORDINAL)
+
+
+class WeatherColumns:
+    """Parsed station file as parallel int32 columns.
+
+    `day_numbers` holds days since 1970-01-01; the value columns hold the raw
+    tenths values (including the -9999 missing-value sentinel). Malformed
+    lines are reported through `error_count` / `bad_lines` exactly as the
+    scalar parser reports them.
+    """
+
+    __slots__ = (
+        'day_numbers',
+        'max_tenths',
+        'min_tenths',
+        'precip_tenths',
+        'error_count',
+        'bad_lines',
+    )
+
+    def __init__(
+        self,
+        day_numbers,
+        max_tenths,
+        min_tenths,
+        precip_tenths,
+        error_count=0,
+        bad_lines=None,
+    ):
+        self.day_numbers = day_numbers
+        self.max_tenths = max_tenths
+        self.min_tenths = min_tenths
+        self.precip_tenths = precip_tenths
+        self.error_count = error_count
+        self.bad_lines = bad_lines if bad_lines is not None else []
+
+    def __len__(self):
+        return len(self.day_numbers)
+
+    def select(self, mask):
+        """Rows where the boolean `mask` is true (error counters are kept)."""
+        return WeatherColumns(
+            self.day_numbers[mask],
+            self.max_tenths[mask],
+            self.min_tenths[mask],
+            self.precip_tenths[mask],
+            self.error_count,
+            self.bad_lines,
+        )
+
+    def unique_days(self):
+        """Rows sorted by day with repeated days dropped (first occurrence wins).
+
+        Returns `(columns, dropped)`; records are keyed by (station, day).
+        """
+        days, first = np.unique(self.day_numbers, return_index=True)
+        if (
+            len(days) == len(self.day_numbers)
+            and (first == np.arange(len(first))).all()
+        ):
+            return self, 0
+        return self.select(first), len(self.day_numbers) - len(days)
+
+    def years(self):
+        """Sorted distinct calendar years present in the file."""
+        return [year for year, _ in self.year_counts()]
+
+    def year_counts(self):
+        """`(year, rows)` pairs for the calendar years present, sorted by year."""
+        years = (
+            self.day_numbers.astype('datetime64[D]')
+            .astype('datetime64[Y]')
+            .astype(np.int64)
+            + 1970
+        )
+        values, counts = np.unique(years, return_counts=True)
+        return list(zip(values.tolist(), counts.tolist()))
+
+    def dates(self):
+        """Observation dates as a list of `datetime.date` objects."""
+        return self.day_numbers.astype('datetime64[D]').astype(object).tolist()
+
+    def iter_rows(self):
+        """Yield `(date, max, min, precip)` tuples, as `parse_station_lines` does."""
+        return zip(
+            self.dates(),
+            self.max_tenths.tolist(),
+            self.min_tenths.tolist(),
+            self.precip_tenths.tolist(),
+        )
+
+
+def parse_station_lines(lines):
+    """Parse raw station lines into `(date, max, min, precip)` tuples.
+
+    Returns `(rows, error_count, bad_lines)`. Lines with too few fields are
+    only counted; lines whose values cannot be converted are also returned
+    in `bad_lines` so the caller can log them (worker processes do not
+    share the parent's logging configuration).
+    """
+    rows = []
+    error_count = 0
+    bad_lines = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        parts = line.split('\t')
+        if len(parts) < 4:
+            error_count += 1
+            continue
+
+        try:
+            obs_date = datetime.strptime(parts[0], '%Y%m%d').date()
+            rows.append((obs_date, int(parts[1]), int(parts[2]), int(parts[3])))
+        except (ValueError, IndexError):
+            error_count += 1
+            bad_lines.append(line)
+            continue
+
+    return rows, error_count, bad_lines
+
+
+def _decode_digits(matrix):
+    """Decode an (n, width) uint8 matrix of plain digits. Returns `(values, ok)`."""
+    values = np.zeros(len(matrix), dtype=np.int32)
+    ok = np.ones(len(matrix), dtype=bool)
+    for k in range(matrix.shape[1]):
+        column = matrix[:, k]
+        ok &= (column >= ord('0')) & (column <= ord('9'))
+        values = values * 10 + (column - ord('0'))
+    return values, ok
+
+
+def _decode_field(matrix):
+    """Decode right-aligned, optionally negative integer fields.
+
+    `matrix` is an (n, width) uint8 array. Returns `(values, ok)` where `ok`
+    marks rows that are exactly `spaces* '-'? digits+`. Works one byte
+    column at a time so every operation is a 1-D pass over all rows.
+    """
+    n = len(matrix)
+    values = np.zeros(n, dtype=np.int32)
+    ok = np.ones(n, dtype=bool)
+    seen_digit = np.zeros(n, dtype=bool)
+    negative = np.zeros(n, dtype=bool)
+    prev_minus = np.zeros(n, dtype=bool)
+    is_digit = seen_digit
+    for k in range(matrix.shape[1]):
+        column = matrix[:, k]
+        is_digit = (column >= ord('0')) & (column <= ord('9'))
+        is_minus = column == ord('-')
+        # Padding and a single '-' may only appear before the digits, and a
+        # '-' must be immediately followed by a digit.
+        ok &= is_digit | (~seen_digit & ((column == ord(' ')) | is_minus))
+        ok &= ~prev_minus | is_digit
+        values = values * 10 + np.where(is_digit, column - ord('0'), 0)
+        negative |= is_minus
+        seen_digit |= is_digit
+        prev_minus = is_minus
+    ok &= is_digit
+    return np.where(negative, -values, values).astype(np.int32), ok
+
+
+def _decode_fixed_width(matrix):
+    """Decode an (n, LINE_WIDTH) byte matrix. Returns `(columns, ok)`."""
+    ok = np.ones(len(matrix), dtype=bool)
+    for pos in TAB_POSITIONS:
+        ok &= matrix[:, pos] == ord('\t')
+
+    year, year_ok = _decode_digits(matrix[:, 0:4])
+    month, month_ok = _decode_digits(matrix[:, 4:6])
+    day, day_ok = _decode_digits(matrix[:, 6:DATE_WIDTH])
+    ok &= year_ok & month_ok & day_ok
+    ok &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1)
+
+    months = (np.where(ok, year, 1970) - 1970).astype('datetime64[Y]').astype(
+        'datetime64[M]'
+    ) + (np.where(ok, month, 1) - 1)
+    days = months.astype('datetime64[D]') + (np.where(ok, day, 1) - 1)
+    # Reject day-of-month overflow (e.g. 20200231) by checking the month round-trips.
+    ok &= days.astype('datetime64[M]') == months
+    day_numbers = days.astype(np.int64).astype(np.int32)
+
+    values = []
+    for field in VALUE_SLICES:
+        column, field_ok = _decode_field(matrix[:, field])
+        values.append(column)
+        ok &= field_ok
+
+    return (day_numbers, *values), ok
+
+
+def parse_weather_bytes(data: bytes) -> WeatherColumns:
+    """Parse the full contents of a station file into `WeatherColumns`."""
+    record_width = LINE_WIDTH + 1
+    if data and len(data) % record_width == 0 and (
+        np.frombuffer(data, dtype=np.uint8)[LINE_WIDTH::record_width] == ord('\n')
+    ).all():
+        # Fast path: every line is fixed width, decode the buffer in place.
+        lines = None
+        matrix = np.frombuffer(data, dtype=np.uint8).reshape(-1, record_width)[
+            :, :LINE_WIDTH
+        ]
+        line_index = np.arange(len(matrix))
+    else:
+        lines = data.split(b'\n')
+        if lines and lines[-1] == b'':
+            lines.pop()
+        lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+        line_index = np.flatnonzero(lengths == LINE_WIDTH)
+        padded = (
+            np.array(lines, dtype=f'S{LINE_WIDTH}')
+            if lines
+            else np.empty(0, dtype=f'S{LINE_WIDTH}')
+        )
+        matrix = padded.view(np.uint8).reshape(-1, LINE_WIDTH)[line_index]
+
+    columns, ok = _decode_fixed_width(matrix)
+    good_index = line_index[ok]
+    columns = [c[ok] for c in columns]
+
+    # Anything that is not a clean fixed-width line goes through the scalar
+    # parser, which decides whether it is valid, blank or an error.
+    total_lines = len(matrix) if lines is None else len(lines)
+    fallback_index = np.setdiff1d(
+        np.arange(total_lines), good_index, assume_unique=True
+    )
+    if not len(fallback_index):
+        return WeatherColumns(*columns)
+
+    if lines is None:
+        lines = data.split(b'\n')
+    error_count = 0
+    bad_lines = []
+    parsed_index = []
+    parsed_rows = []
+    for idx in fallback_index.tolist():
+        rows, line_errors, line_bad = parse_station_lines(
+            [lines[idx].decode('utf-8', errors='replace')]
+        )
+        error_count += line_errors
+        bad_lines.extend(line_bad)
+        if rows:
+            parsed_index.append(idx)
+            parsed_rows.append(rows[0])
+
+    if parsed_rows:
+        day_col = [date_to_day_number(r[0]) for r in parsed_rows]
+        extra = [
+            np.array(col, dtype=np.int32)
+            for col in (day_col, *list(zip(*parsed_rows))[1:])
+        ]
+        # Restore file order between fast-path and fallback rows.
+        order = np.argsort(np.concatenate([good_index, parsed_index]), kind='stable')
+        columns = [np.concatenate([c, e])[order] for c, e in zip(columns, extra)]
+
+    return WeatherColumns(*columns, error_count=error_count, bad_lines=bad_lines)
+
+
+def parse_weather_file(file_path) -> WeatherColumns:
+    """Read a station file in one call and parse it. Safe to use in a process pool."""
+    with open(file_path, 'rb') as f:
+        return parse_weather_bytes(f.read())
@@ -0,0 +1,256 @@
+"""
+Station file sources for weather ingestion (Problem 2).
+
+`iter_station_sources` turns an ingestion input into a stream of
+`StationSource` objects, one per station file. Supported inputs:
+
+- a directory containing `*.txt` files, optionally compressed
+  (`*.txt.gz`, `*.txt.bz2`, `*.txt.xz`), and/or tar archives
+- a single plain or compressed station file
+- a tar archive (`.tar`, `.tar.gz`/`.tgz`, `.tar.bz2`, `.tar.xz`)
+- `-` for a (possibly compressed) tar stream on stdin
+
+Archives and compressed files are read as forward-only streams and nothing
+is extracted to disk, but each station file is decompressed into memory
+whole: it is parsed and committed as one unit, possibly in a worker
+process. Memory use therefore follows the largest station file (times the
+few sources buffered for the workers, see
+`database.iter_parsed_station_sources`), not the bundle size; it is not
+constant. Plain files are left on disk so incremental ingestion can seek
+past already-ingested bytes.
+"""
+
+import bz2
+import gzip
+import hashlib
+import logging
+import lzma
+import os
+import sys
+import tarfile
+from pathlib import Path
+
+from weather_parser import parse_weather_bytes
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1 << 20
+
+STATION_SUFFIX = '.txt'
+COMPRESSED_SUFFIXES = {
+    '.gz': gzip.decompress,
+    '.bz2': bz2.decompress,
+    '.xz': lzma.decompress,
+}
+COMPRESSED_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+STDIN = '-'
+
+
+class StationSource:
+    """One station file: either a `path` on disk or already-read `data`."""
+
+    __slots__ = ('station_id', 'name', 'path', 'data', 'size', 'mtime')
+
+    def __init__(self, station_id, name, path=None, data=None, size=None, mtime=None):
+        self.station_id = station_id
+        self.name = name
+        self.path = path
+        self.data = data
+        self.size = size
+        self.mtime = mtime
+
+    @property
+    def seekable(self) -> bool:
+        return self.path is not None
+
+    def __repr__(self):
+        return f'<StationSource {self.station_id} ({self.name})>'
+
+
+def _station_file_name(name: str):
+    """Return `(station_id, compression_suffix)` for a station file name, or None."""
+    base = Path(name).name
+    suffix = ''
+    for candidate in COMPRESSED_SUFFIXES:
+        if base.endswith(STATION_SUFFIX + candidate):
+            suffix = candidate
+            base = base[:-len(candidate)]
+            break
+    if not base.endswith(STATION_SUFFIX) or base.startswith('.'):
+        return None
+    return base[:-len(STATION_SUFFIX)], suffix
+
+
+def is_archive(name: str) -> bool:
+    return str(name).endswith(TAR_SUFFIXES)
+
+
+def _iter_tar(tar):
+    for member in tar:
+        if not member.isfile():
+            continue
+        parsed = _station_file_name(member.name)
+        if parsed is None:
+            continue
+        station_id, suffix = parsed
+        data = tar.extractfile(member).read()
+        if suffix:
+            data = COMPRESSED_SUFFIXES[suffix](data)
+        yield StationSource(
+            station_id,
+            member.name,
+            data=data,
+            size=len(data),
+            mtime=float(member.mtime),
+        )
+
+
+def _iter_path(path: Path):
+    if is_archive(path.name):
+        with tarfile.open(path, mode='r|*') as tar:
+            yield from _iter_tar(tar)
+        return
+
+    parsed = _station_file_name(path.name)
+    if parsed is None:
+        return
+    station_id, suffix = parsed
+    stat = path.stat()
+    if not suffix:
+        yield StationSource(
+            station_id, path.name, path=path, size=stat.st_size, mtime=stat.st_mtime
+        )
+        return
+    with COMPRESSED_OPENERS[suffix](path, 'rb') as f:
+        data = f.read()
+    yield StationSource(
+        station_id, path.name, data=data, size=len(data), mtime=stat.st_mtime
+    )
+
+
+def iter_station_sources(location):
+    """Yield a `StationSource` per station file found at `location`."""
+    if str(location) == STDIN:
+        with tarfile.open(fileobj=sys.stdin.buffer, mode='r|*') as tar:
+            yield from _iter_tar(tar)
+        return
+
+    path = Path(location)
+    if not path.exists():
+        raise FileNotFoundError(f"Weather data directory not found: {location}")
+    if not path.is_dir():
+        yield from _iter_path(path)
+        return
+    for entry in sorted(path.iterdir()):
+        if entry.is_file():
+            yield from _iter_path(entry)
+
+
+def count_station_sources(location):
+    """Number of stations at `location`, or None when it depends on archive contents."""
+    if str(location) == STDIN:
+        return None
+    path = Path(location)
+    entries = sorted(path.iterdir()) if path.is_dir() else [path]
+    count = 0
+    for entry in entries:
+        if is_archive(entry.name):
+            return None
+        if entry.is_file() and _station_file_name(entry.name) is not None:
+            count += 1
+    return count
+
+
+def file_fingerprint(file_path):
+    """Return `(size, mtime, sha256)` of a file, hashed in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        mtime = os.fstat(f.fileno()).st_mtime
+        size = 0
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, mtime, digest.hexdigest()
+
+
+def complete_length(data: bytes) -> int:
+    """Length of `data` up to and including its last newline."""
+    return data.rfind(b'\n') + 1
+
+
+def read_station_file(file_path, offset: int = 0, prefix_hash: str | None = None):
+    """Read and parse a station file, skipping an already-ingested prefix.
+
+    When the first `offset` bytes still hash to `prefix_hash` only the bytes
+    after `offset` are parsed; otherwise the whole file is parsed. Returns
+    `(columns, appended, size, mtime, content_hash)` where `size`, `mtime`
+    and `content_hash` describe the bytes up to the last newline, so a last
+    line without one is read again on the next run. When appending, such a
+    line (a writer may still be adding to it) is not parsed until it is
+    complete. Safe to use in a process pool.
+    """
+    digest = hashlib.sha256()
+    appended = False
+    with open(file_path, 'rb') as f:
+        mtime = os.fstat(f.fileno()).st_mtime
+        if offset and prefix_hash:
+            remaining = offset
+            while remaining:
+                chunk = f.read(min(remaining, HASH_CHUNK_SIZE))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            appended = remaining == 0 and digest.hexdigest() == prefix_hash
+            if not appended:
+                f.seek(0)
+                digest = hashlib.sha256()
+        data = f.read()
+
+    end = complete_length(data)
+    digest.update(memoryview(data)[:end])
+    size = (offset if appended else 0) + end
+    if appended and end < len(data):
+        logger.warning(
+            f'{file_path}: last line has no newline yet; '
+            'holding it back until the next run'
+        )
+        data = data[:end]
+    return parse_weather_bytes(data), appended, size, mtime, digest.hexdigest()
+
+
+def read_station_data(
+    data: bytes, mtime: float, offset: int = 0, prefix_hash: str | None = None
+):
+    """`read_station_file` for bytes that were already streamed into memory.
+
+    Archive and compressed members are complete when read, so every line is
+    parsed, including a last one without a newline.
+    """
+    view = memoryview(data)
+    appended = bool(offset and prefix_hash) and offset <= len(data) and (
+        hashlib.sha256(view[:offset]).hexdigest() == prefix_hash
+    )
+    tail = data[offset:] if appended else data
+    return (
+        parse_weather_bytes(tail),
+        appended,
+        len(data),
+        mtime,
+        hashlib.sha256(view).hexdigest(),
+    )
+
+
+def read_station_source(
+    source: StationSource, offset: int = 0, prefix_hash: str | None = None
+):
+    """Process-pool entry point: read and parse any `StationSource`."""
+    if source.seekable:
+        return read_station_file(source.path, offset, prefix_hash)
+    return read_station_data(source.data, source.mtime, offset, prefix_hash)
@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 from datetime import date
@@ -8,6 +9,7 @@ import pytest
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
 
 import database
+import aggregation
 import analyze_data
 import models
 
@@ -58,9 +60,241 @@ def test_compute_and_store_stats(tmp_path):
 
     session = dbm.get_session()
     try:
-        stats = session.query(models.YearlyStationStats).filter_by(station_id=station_id_val, year=2020).one()
+        stats = (
+            session.query(models.YearlyStationStats)
+            .filter_by(station_id=station_id_val, year=2020)
+            .one()
+        )
         assert pytest.approx(stats.avg_max_celsius, rel=1e-3) == 27.5
         assert pytest.approx(stats.avg_min_celsius, rel=1e-3) == 7.5
         assert pytest.approx(stats.total_precip_cm, rel=1e-3) == 3.0
     finally:
         session.close()
+
+
+def _seed_random_records(dbm, seed=7):
+    import random
+    rng = random.Random(seed)
+    session = dbm.get_session()
+    try:
+        for code in ('ST0', 'ST1', 'ST2'):
+            station = models.WeatherStation(station_id=code)
+            session.add(station)
+            session.flush()
+            for year in (1999, 2000):
+                for day in range(1, 29):
+                    session.add(
+                        models.WeatherRecord(
+                            station_id=station.id,
+                            observation_date=date(year, 2, day),
+                            max_temperature_tenths_celsius=rng.choice(
+                                [-9999, rng.randint(-300, 400)]
+                            ),
+                            min_temperature_tenths_celsius=rng.choice(
+                                [-9999, rng.randint(-400, 300)]
+                            ),
+                            precipitation_tenths_mm=rng.choice(
+                                [-9999, rng.randint(0, 999)]
+                            ),
+                        )
+                    )
+        session.commit()
+    finally:
+        session.close()
+
+
+def _all_stats(dbm):
+    session = dbm.get_session()
+    try:
+        return [
+            (
+                s.station_id,
+                s.year,
+                s.avg_max_celsius,
+                s.avg_min_celsius,
+                s.total_precip_cm,
+            )
+            for s in session.query(models.YearlyStationStats).order_by(
+                models.YearlyStationStats.station_id, models.YearlyStationStats.year
+            )
+        ]
+    finally:
+        session.close()
+
+
+def test_set_based_upsert_matches_python_fallback(tmp_path, monkeypatch):
+    sql_url = f'sqlite:///{tmp_path / "sql.db"}'
+    py_url = f'sqlite:///{tmp_path / "py.db"}'
+    sql_dbm = database.get_database_manager(sql_url)
+    py_dbm = database.get_database_manager(py_url)
+    for dbm in (sql_dbm, py_dbm):
+        dbm.init_db()
+        _seed_random_records(dbm)
+
+    assert analyze_data.supports_upsert(sql_dbm.engine)
+    assert analyze_data.compute_and_store_stats(sql_url) == 6
+    # Re-running updates in place
+    assert analyze_data.compute_and_store_stats(sql_url) == 6
+    monkeypatch.setattr(aggregation, 'supports_upsert', lambda engine: False)
+    assert analyze_data.compute_and_store_stats(py_url) == 6
+    assert analyze_data.compute_and_store_stats(py_url) == 6
+
+    sql_stats = _all_stats(sql_dbm)
+    assert len(sql_stats) == 6
+    assert sql_stats == _all_stats(py_dbm)
+
+
+def test_incremental_recomputes_only_dirty_partitions(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    wx_dir.mkdir()
+    (wx_dir / 'ST0.txt').write_text(
+        '19991231\t  100\t    0\t   10\n20000101\t  200\t   10\t   20\n'
+    )
+    (wx_dir / 'ST1.txt').write_text('20000101\t  300\t   20\t   30\n')
+
+    db_url = f'sqlite:///{tmp_path / "incremental.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+
+    def dirty():
+        session = dbm.get_session()
+        try:
+            return sorted(
+                (d.station_id, d.year)
+                for d in session.query(models.StatsDirtyPartition)
+            )
+        finally:
+            session.close()
+
+    assert len(dirty()) == 3
+    assert analyze_data.compute_and_store_stats(db_url, incremental=True) == 3
+    assert dirty() == []
+    assert analyze_data.compute_and_store_stats(db_url, incremental=True) == 0
+
+    # Appending to one station dirties only that station's new year
+    with open(wx_dir / 'ST0.txt', 'a') as f:
+        f.write('20010101\t  400\t   40\t   40\n')
+    dbm.ingest_weather_data(str(wx_dir))
+    assert len(dirty()) == 1
+    assert analyze_data.compute_and_store_stats(db_url, incremental=True) == 1
+
+    incremental = _all_stats(dbm)
+    assert len(incremental) == 4
+    assert analyze_data.compute_and_store_stats(db_url) == 4
+    assert _all_stats(dbm) == incremental
+
+
+def test_ingest_with_stats_matches_analysis(tmp_path):
+    import random
+    rng = random.Random(11)
+    wx_dir = tmp_path / 'wx_data'
+    wx_dir.mkdir()
+    for code in ('ST0', 'ST1'):
+        lines = []
+        for year in (1998, 1999, 2000):
+            for day in range(1, 29):
+                values = [rng.choice([-9999, rng.randint(-300, 400)]) for _ in range(3)]
+                lines.append(
+                    f'{year}03{day:02d}\t' + '\t'.join(f'{v:5d}' for v in values)
+                )
+        (wx_dir / f'{code}.txt').write_text('\n'.join(lines) + '\n')
+    # A year with no valid values at all still gets a row of NULLs.
+    (wx_dir / 'ST2.txt').write_text('20000101\t-9999\t-9999\t-9999\n')
+
+    fused_url = f'sqlite:///{tmp_path / "fused.db"}'
+    fused = database.get_database_manager(fused_url)
+    fused.init_db()
+    fused.ingest_weather_data(str(wx_dir), with_stats=True)
+
+    with open(wx_dir / 'ST0.txt', 'a') as f:
+        f.write('20001231\t  123\t  -45\t    6\n20010101\t  200\t   10\t    7\n')
+    fused.ingest_weather_data(str(wx_dir), with_stats=True)
+    fused_stats = _all_stats(fused)
+    assert len(fused_stats) == 8
+    assert fused_stats[-1][1:] == (2000, None, None, None)
+
+    session = fused.get_session()
+    try:
+        assert session.query(models.StatsDirtyPartition).count() == 0
+    finally:
+        session.close()
+
+    assert analyze_data.compute_and_store_stats(fused_url) == 8
+    assert _all_stats(fused) == fused_stats
+
+    with pytest.raises(ValueError):
+        fused.ingest_weather_data(str(wx_dir), mode='orm', with_stats=True)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parallel_engine_matches_sql_bit_for_bit(tmp_path, workers):
+    sql_url = f'sqlite:///{tmp_path / "sql.db"}'
+    par_url = f'sqlite:///{tmp_path / "parallel.db"}'
+    sql_dbm = database.get_database_manager(sql_url)
+    par_dbm = database.get_database_manager(par_url)
+    for dbm in (sql_dbm, par_dbm):
+        dbm.init_db()
+        _seed_random_records(dbm)
+
+    assert analyze_data.compute_and_store_stats(sql_url) == 6
+    assert (
+        analyze_data.compute_and_store_stats(
+            par_url, engine='parallel', workers=workers
+        )
+        == 6
+    )
+    # Compare exact float values, not approximations.
+    assert _all_stats(par_dbm) == _all_stats(sql_dbm)
+
+    assert analyze_data.station_ranges([5, 1, 3, 2, 4], 2) == [(1, 3), (4, 5)]
+    assert analyze_data.station_ranges([], 4) == []
+    with pytest.raises(ValueError):
+        analyze_data.compute_and_store_stats(
+            par_url, engine='parallel', incremental=True
+        )
+
+
+@pytest.mark.skipif(
+    not os.environ.get('TEST_POSTGRES_URL'),
+    reason='set TEST_POSTGRES_URL to run against PostgreSQL',
+)
+def test_parallel_engine_matches_sql_bit_for_bit_on_postgres():
+    db_url = os.environ['TEST_POSTGRES_URL']
+    dbm = database.get_database_manager(db_url)
+    dbm.drop_db()
+    dbm.init_db()
+    try:
+        _seed_random_records(dbm)
+        assert analyze_data.compute_and_store_stats(db_url) == 6
+        sql_stats = _all_stats(dbm)
+
+        session = dbm.get_session()
+        try:
+            session.query(models.YearlyStationStats).delete()
+            session.commit()
+        finally:
+            session.close()
+        assert (
+            analyze_data.compute_and_store_stats(db_url, engine='parallel', workers=2)
+            == 6
+        )
+        assert _all_stats(dbm) == sql_stats
+    finally:
+        dbm.drop_db()
+        dbm.dispose()
+
+
+@pytest.mark.parametrize(
+    'argv, incremental', [([], False), (['--full'], False), (['--incremental'], True)]
+)
+def test_command_line_defaults_to_full_analysis(monkeypatch, argv, incremental):
+    calls = []
+    monkeypatch.setattr(
+        analyze_data,
+        'compute_and_store_stats',
+        lambda db, **kwargs: calls.append(kwargs) or 0,
+    )
+    monkeypatch.setattr(sys, 'argv', ['analyze_data.py', '--db', 'sqlite://', *argv])
+    analyze_data.main()
+    assert calls[0]['incremental'] is incremental
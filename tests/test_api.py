@@ -8,6 +8,7 @@ import pytest
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
 
 from app import create_app
+import api
 import database
 import models
 
@@ -75,3 +76,558 @@ def test_get_stats(client):
     assert 'data' in payload
     # at least one stat row should be present
     assert len(payload['data']) >= 1
+
+
+def _walk(client, url, limit):
+    pages = []
+    cursor = None
+    while True:
+        page = client.get(
+            f'{url}&limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        ).get_json()
+        pages.extend(page['data'])
+        cursor = page['pagination']['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pagination_matches_offset_pagination(tmp_path):
+    db_url = f'sqlite:///{tmp_path / "pages.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    session = dbm.get_session()
+    try:
+        for code in ('B', 'A', 'C'):
+            s = models.WeatherStation(station_id=code)
+            session.add(s)
+            session.flush()
+            for day in range(1, 8):
+                session.add(
+                    models.WeatherRecord(
+                        station_id=s.id,
+                        observation_date=date(2020 + day % 2, 1, day),
+                        max_temperature_tenths_celsius=day,
+                        min_temperature_tenths_celsius=0,
+                        precipitation_tenths_mm=0,
+                    )
+                )
+        session.commit()
+    finally:
+        session.close()
+    from analyze_data import compute_and_store_stats
+    compute_and_store_stats(db_url)
+
+    client = create_app(database_url=db_url).test_client()
+    everything = client.get('/api/weather?limit=1000').get_json()
+    assert everything['pagination']['next_cursor'] is None
+    assert _walk(client, '/api/weather?start_date=2020-01-02', 4) == [
+        r for r in everything['data'] if r['date'] >= '2020-01-02'
+    ]
+    assert len(_walk(client, '/api/weather?x=1', 5)) == 21
+
+    stats = client.get('/api/weather/stats?limit=1000').get_json()['data']
+    assert _walk(client, '/api/weather/stats?x=1', 4) == stats
+    assert _walk(client, '/api/weather/stats?station_id=A', 1) == [
+        s for s in stats if s['station_id'] == 'A'
+    ]
+
+    weather_cursor = client.get('/api/weather?limit=1').get_json()['pagination'][
+        'next_cursor'
+    ]
+    assert client.get(f'/api/weather/stats?cursor={weather_cursor}').status_code == 400
+    assert client.get('/api/weather?cursor=not-a-cursor').status_code == 400
+
+
+def test_total_kinds_and_maintained_record_counts(tmp_path):
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    (wx_dir / 'ST1.txt').write_text(
+        '20191231\t  10\t   0\t   0\n'
+        '20200101\t  20\t   0\t   0\n'
+        '20200102\t  30\t   0\t   0\n'
+    )
+    (wx_dir / 'ST2.txt').write_text('20200101\t  40\t   0\t   0\n')
+    orm_dir = tmp_path / 'wx_orm'
+    orm_dir.mkdir()
+    (orm_dir / 'ST3.txt').write_text(
+        '20210101\t  50\t   0\t   0\n20210102\t  60\t   0\t   0\n'
+    )
+    db_url = f'sqlite:///{tmp_path / "totals.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+    with open(wx_dir / 'ST1.txt', 'a') as f:
+        f.write('20200103\t  35\t   0\t   0\n')
+    dbm.ingest_weather_data(str(wx_dir))
+    dbm.ingest_weather_data(str(orm_dir), mode='orm')
+
+    def counts():
+        with dbm.engine.connect() as conn:
+            return sorted(conn.exec_driver_sql(
+                'SELECT s.station_id, c.year, c.row_count FROM weather_record_counts c '
+                'JOIN weather_stations s ON s.id = c.station_id'
+            ).all())
+
+    expected = [('ST1', 2019, 1), ('ST1', 2020, 3), ('ST2', 2020, 1), ('ST3', 2021, 2)]
+    assert counts() == expected
+    # Databases created before the summary table are backfilled by init_db.
+    with dbm.engine.begin() as conn:
+        conn.exec_driver_sql('DROP TABLE weather_record_counts')
+    dbm.init_db()
+    assert counts() == expected
+
+    client = create_app(database_url=db_url).test_client()
+    for query in (
+        'x=1',
+        'station_id=ST1',
+        'start_date=2020-01-01&end_date=2020-12-31',
+        'start_date=2021-01-01',
+    ):
+        exact = client.get(f'/api/weather?{query}&limit=1').get_json()['pagination']
+        estimate = client.get(
+            f'/api/weather?{query}&limit=1&total=estimate'
+        ).get_json()['pagination']
+        assert exact['total_kind'] == 'exact' and estimate['total_kind'] == 'estimate'
+        assert estimate['total_count'] == exact['total_count']
+    # A partial year is pro-rated by the days it covers.
+    partial = client.get(
+        '/api/weather?station_id=ST1&start_date=2020-01-01&end_date=2020-01-31'
+        '&total=estimate'
+    ).get_json()
+    assert partial['pagination']['total_count'] == round(3 * 31 / 366)
+    assert len(partial['data']) == 3
+
+    none = client.get('/api/weather?total=none&limit=2').get_json()['pagination']
+    assert none['total_count'] is None and none['total_kind'] == 'none'
+    assert none['next_cursor'] is not None
+    assert client.get('/api/weather?total=approximate').status_code == 400
+
+    from analyze_data import compute_and_store_stats
+    compute_and_store_stats(db_url)
+    stats = client.get('/api/weather/stats?start_year=2020&total=estimate').get_json()[
+        'pagination'
+    ]
+    assert stats['total_count'] == 3 and stats['total_kind'] == 'estimate'
+    assert (
+        client.get('/api/weather/stats?total=none').get_json()['pagination'][
+            'total_count'
+        ]
+        is None
+    )
+
+
+def test_statement_count_does_not_depend_on_page_size(tmp_path):
+    db_url = f'sqlite:///{tmp_path / "n_plus_one.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    session = dbm.get_session()
+    try:
+        for code in ('A', 'B', 'C', 'D'):
+            s = models.WeatherStation(station_id=code)
+            session.add(s)
+            session.flush()
+            for day in range(1, 11):
+                session.add(
+                    models.WeatherRecord(
+                        station_id=s.id,
+                        observation_date=date(2010 + day, 1, day),
+                        max_temperature_tenths_celsius=day,
+                        min_temperature_tenths_celsius=None,
+                        precipitation_tenths_mm=0,
+                    )
+                )
+        session.commit()
+    finally:
+        session.close()
+    from analyze_data import compute_and_store_stats
+    compute_and_store_stats(db_url)
+
+    # No response cache, and a dataset version that is read once up front.
+    app = create_app(database_url=db_url, response_cache_size=0, version_ttl=3600)
+    client = app.test_client()
+    client.get('/api/weather?limit=1')
+    statements = []
+    from sqlalchemy import event
+    for engine in (
+        app.config['DB_MANAGER'].engine,
+        app.config['DB_MANAGER'].read_engine,
+    ):
+        event.listen(
+            engine,
+            'before_cursor_execute',
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+
+    for url, per_request in (
+        ('/api/weather?', 2),
+        ('/api/weather/stats?', 2),
+        ('/api/weather?total=none&', 1),
+    ):
+        for limit in (1, 7, 1000):
+            statements.clear()
+            payload = client.get(f'{url}limit={limit}').get_json()
+            assert payload['pagination']['returned'] == min(limit, 40)
+            assert len(statements) == per_request, (url, limit, statements)
+    row = client.get('/api/weather?station_id=B&limit=1').get_json()['data'][0]
+    assert row == {
+        'id': 'B:2011-01-01',
+        'station_id': 'B',
+        'date': '2011-01-01',
+        'max_temperature_celsius': 0.1,
+        'min_temperature_celsius': None,
+        'precipitation_mm': 0.0,
+    }
+
+
+def test_export_streams_ndjson_and_csv(tmp_path, monkeypatch):
+    import api
+    import csv
+    import gzip
+    import io
+    import json
+
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    (wx_dir / 'ST1.txt').write_text(
+        ''.join(f'202001{d:02d}\t  {d}0\t  -{d}\t    {d}\n' for d in range(1, 11))
+        + '20200111\t-9999\t-9999\t-9999\n'
+    )
+    (wx_dir / 'ST2.txt').write_text('20200105\t  100\t    0\t    0\n')
+    db_url = f'sqlite:///{tmp_path / "export.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+    # Small chunks so the export spans several cursor partitions.
+    monkeypatch.setattr(api, 'EXPORT_CHUNK_ROWS', 3)
+    client = create_app(database_url=db_url).test_client()
+
+    def paged(query):
+        rows = client.get(f'/api/weather?{query}&limit=1000').get_json()['data']
+        return sorted(rows, key=lambda r: (r['station_id'], r['date']))
+
+    response = client.get('/api/weather/export')
+    assert response.status_code == 200 and response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    assert [
+        json.loads(line) for line in response.get_data(as_text=True).splitlines()
+    ] == paged('x=1')
+
+    query = 'station_id=ST1&start_date=2020-01-03&end_date=2020-01-11'
+    response = client.get(
+        f'/api/weather/export?{query}&format=csv', headers={'Accept-Encoding': 'gzip'}
+    )
+    assert (
+        response.headers['Content-Encoding'] == 'gzip'
+        and response.mimetype == 'text/csv'
+    )
+    rows = list(
+        csv.DictReader(io.StringIO(gzip.decompress(response.get_data()).decode()))
+    )
+    expected = paged(query)
+    assert len(rows) == len(expected) == 9
+    assert [r['date'] for r in rows] == [r['date'] for r in expected]
+    assert (
+        rows[0]['max_temperature_celsius'] == '3.0'
+        and rows[-1]['precipitation_mm'] == ''
+    )
+
+    assert client.get('/api/weather/export?format=xml').status_code == 400
+    assert client.get('/api/weather/export?start_date=2020-13-01').status_code == 400
+    assert (
+        client.get('/api/weather/export?station_id=NOPE&format=csv').get_data(
+            as_text=True
+        )
+        == ','.join(api.EXPORT_FIELDS) + '\n'
+    )
+
+
+def test_station_directory_resolves_codes_without_queries(tmp_path):
+    from sqlalchemy import event
+
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    (wx_dir / 'ST1.txt').write_text('20200101\t  10\t   0\t   0\n')
+    db_url = f'sqlite:///{tmp_path / "directory.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+    assert dbm.station_directory.pk('ST1') is not None
+
+    app = create_app(database_url=db_url, response_cache_size=0, version_ttl=0)
+    client = app.test_client()
+    assert (
+        client.get('/api/weather?station_id=ST1').get_json()['data'][0]['station_id']
+        == 'ST1'
+    )
+
+    statements = []
+    for engine in (
+        app.config['DB_MANAGER'].engine,
+        app.config['DB_MANAGER'].read_engine,
+    ):
+        event.listen(
+            engine,
+            'before_cursor_execute',
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+    for url in (
+        '/api/weather?station_id=NOPE',
+        '/api/weather/stats?station_id=NOPE&total=estimate',
+    ):
+        statements.clear()
+        payload = client.get(url).get_json()
+        assert payload['data'] == [] and payload['pagination']['total_count'] == 0
+        # Only the dataset version is read.
+        assert statements and all('dataset_version' in s for s in statements)
+
+    # A station added by another process shows up once the version moves.
+    (wx_dir / 'ST2.txt').write_text('20200102\t  20\t   0\t   0\n')
+    database.get_database_manager(db_url).ingest_weather_data(str(wx_dir))
+    assert (
+        client.get('/api/weather?station_id=ST2').get_json()['data'][0]['date']
+        == '2020-01-02'
+    )
+    assert [r['station_id'] for r in client.get('/api/weather').get_json()['data']] == [
+        'ST1',
+        'ST2',
+    ]
+
+
+def test_reads_use_read_only_engine_while_a_load_holds_the_write_lock(tmp_path):
+    import sqlite3
+
+    from sqlalchemy import event
+    from sqlalchemy.exc import OperationalError
+
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    (wx_dir / 'ST1.txt').write_text('20200101\t  10\t   0\t   0\n')
+    db_url = f'sqlite:///{tmp_path / "split.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+
+    app = create_app(
+        database_url=db_url, response_cache_size=0, version_ttl=0, read_pool_size=2
+    )
+    read_dbm = app.config['DB_MANAGER']
+    assert read_dbm.read_engine is not read_dbm.engine
+    assert read_dbm.station_directory.engine is read_dbm.read_engine
+    write_queries = []
+    event.listen(
+        read_dbm.engine,
+        'before_cursor_execute',
+        lambda *args: write_queries.append(args[2]),
+    )
+    with read_dbm.read_engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql('DELETE FROM weather_records')
+
+    # An uncommitted write transaction (as during a nightly load) does not block
+    # readers.
+    writer = sqlite3.connect(tmp_path / 'split.db', isolation_level=None)
+    try:
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute('UPDATE dataset_version SET version = version + 1')
+        writer.execute('DELETE FROM weather_records')
+        client = app.test_client()
+        assert [
+            r['station_id'] for r in client.get('/api/weather').get_json()['data']
+        ] == ['ST1']
+        assert client.get('/api/weather/stats').status_code == 200
+        # Station lookups reload the directory for the new version on the
+        # read engine as well.
+        response = client.get('/api/weather/stats?station_id=ST1')
+        assert response.status_code == 200
+        assert write_queries == []
+        writer.execute('ROLLBACK')
+    finally:
+        writer.close()
+
+    replica = database.get_database_manager(
+        db_url, read_url=f'sqlite:///{tmp_path / "replica.db"}'
+    )
+    assert replica.read_engine.url.database.endswith('replica.db')
+    replica.dispose()
+    dbm.dispose()
+    read_dbm.dispose()
+
+
+def test_batch_answers_many_stations_with_one_query_per_table(tmp_path):
+    from sqlalchemy import event
+
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    for n in range(1, 6):
+        (wx_dir / f'ST{n}.txt').write_text(
+            ''.join(
+                f'{y}0{m}01\t  {n}{m}\t   -{m}\t    {y % 10}\n'
+                for y in (2019, 2020)
+                for m in range(1, 4)
+            )
+        )
+    db_url = f'sqlite:///{tmp_path / "batch.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir), with_stats=True)
+    app = create_app(database_url=db_url, version_ttl=3600)
+    client = app.test_client()
+
+    body = {
+        'queries': [
+            {'station_id': 'ST3'},
+            {'station_id': 'ST1', 'start_date': '2020-01-01', 'limit': 2, 'year': 2020},
+            {'station_id': 'NOPE'},
+            {'station_id': 'ST2', 'limit': 1},
+        ],
+        'limit': 4,
+    }
+    client.post('/api/batch', json=body)
+    statements = []
+    event.listen(
+        app.config['DB_MANAGER'].read_engine,
+        'before_cursor_execute',
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    payload = client.post('/api/batch', json=body).get_json()
+    assert len(statements) == 2
+    assert [r['station_id'] for r in payload['results']] == [
+        'ST3',
+        'ST1',
+        'NOPE',
+        'ST2',
+    ]
+    assert payload['unknown_stations'] == ['NOPE']
+    assert payload['results'][2]['weather'] == {
+        'data': [],
+        'returned': 0,
+        'next_cursor': None,
+    }
+
+    # Each station's page is the first page of the single-station endpoints.
+    for query, result in zip(body['queries'], payload['results']):
+        if query['station_id'] == 'NOPE':
+            continue
+        args = {'limit': body['limit'], **query}
+        weather_args = '&'.join(f'{k}={v}' for k, v in args.items() if k != 'year')
+        expected = client.get(f'/api/weather?{weather_args}').get_json()
+        assert result['weather']['data'] == sorted(
+            expected['data'], key=lambda r: r['date']
+        )
+        assert result['weather']['next_cursor'] == expected['pagination']['next_cursor']
+        stats_args = '&'.join(f'{k}={v}' for k, v in args.items() if 'date' not in k)
+        expected = client.get(f'/api/weather/stats?{stats_args}').get_json()
+        assert result['stats']['data'] == expected['data']
+        assert result['stats']['next_cursor'] == expected['pagination']['next_cursor']
+    assert [r['weather']['returned'] for r in payload['results']] == [4, 2, 0, 1]
+    assert payload['results'][1]['stats']['returned'] == 1
+
+    only_stats = client.post(
+        '/api/batch', json={'queries': [{'station_id': 'ST1'}], 'include': ['stats']}
+    ).get_json()
+    assert set(only_stats['results'][0]) == {'station_id', 'stats'}
+    for bad in (
+        {},
+        {'queries': [{}]},
+        {'queries': [{'station_id': 'ST1'}, {'station_id': 'ST1'}]},
+        {'queries': [{'station_id': 'ST1', 'start_date': '2020-02-30'}]},
+        {'queries': [], 'include': ['x']},
+        {'queries': [{'station_id': f'S{n}'} for n in range(20)], 'limit': 10000},
+    ):
+        assert client.post('/api/batch', json=bad).status_code == 400
+
+
+def test_columnar_format_and_gzip_responses(tmp_path):
+    import gzip
+    import json
+
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    (wx_dir / 'ST1.txt').write_text(
+        ''.join(
+            f'2020{m:02d}{d:02d}\t  {d}{m}\t  -{d}\t    {m}\n'
+            for m in range(1, 4)
+            for d in range(1, 29)
+        )
+        + '20200401\t-9999\t   -5\t-9999\n'
+    )
+    (wx_dir / 'ST2.txt').write_text('20190105\t  100\t    0\t    0\n')
+    db_url = f'sqlite:///{tmp_path / "format.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir), with_stats=True)
+    client = create_app(database_url=db_url).test_client()
+
+    def transposed(records, fields):
+        return {field: [r[field] for r in records] for field in fields}
+
+    for path, fields in (
+        ('/api/weather', api.WEATHER_FIELDS),
+        ('/api/weather/stats', api.STATS_FIELDS),
+    ):
+        for query in (
+            'limit=50',
+            'station_id=ST1&limit=7&total=estimate',
+            'station_id=NOPE',
+        ):
+            records = client.get(f'{path}?{query}').get_json()
+            columnar = client.get(f'{path}?{query}&format=columnar').get_json()
+            assert columnar['data'] == transposed(records['data'], fields)
+            assert columnar['pagination'] == records['pagination']
+        assert client.get(f'{path}?format=xml').status_code == 400
+    records = client.get(
+        '/api/weather?station_id=ST1&start_date=2020-04-01'
+    ).get_json()['data']
+    assert records == [
+        {
+            'id': 'ST1:2020-04-01',
+            'station_id': 'ST1',
+            'date': '2020-04-01',
+            'max_temperature_celsius': None,
+            'min_temperature_celsius': -0.5,
+            'precipitation_mm': None,
+        }
+    ]
+
+    body = {'queries': [{'station_id': 'ST1', 'limit': 3}, {'station_id': 'ST2'}]}
+    records = client.post('/api/batch', json=body).get_json()
+    columnar = client.post('/api/batch', json={**body, 'format': 'columnar'}).get_json()
+    for r, c in zip(records['results'], columnar['results']):
+        assert c['weather']['data'] == transposed(
+            r['weather']['data'], api.WEATHER_FIELDS
+        )
+        assert c['stats']['data'] == transposed(r['stats']['data'], api.STATS_FIELDS)
+    assert client.post('/api/batch', json={**body, 'format': 'xml'}).status_code == 400
+
+    # Large pages are gzip-compressed when accepted; the compressed body is a
+    # separate cache entry.
+    identity = client.get('/api/weather?limit=100')
+    assert (
+        'Content-Encoding' not in identity.headers
+        and 'Accept-Encoding' in identity.headers['Vary']
+    )
+    for _ in range(2):
+        compressed = client.get(
+            '/api/weather?limit=100', headers={'Accept-Encoding': 'gzip, deflate'}
+        )
+        assert compressed.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(compressed.get_data()) == identity.get_data()
+    assert compressed.headers['ETag'] != identity.headers['ETag']
+    assert (
+        client.get(
+            '/api/weather?limit=100',
+            headers={
+                'Accept-Encoding': 'gzip',
+                'If-None-Match': compressed.headers['ETag'],
+            },
+        ).status_code
+        == 304
+    )
+    batch = client.post('/api/batch', json=body, headers={'Accept-Encoding': 'gzip'})
+    assert (
+        batch.headers['Content-Encoding'] == 'gzip'
+        and json.loads(gzip.decompress(batch.get_data())) == records
+    )
+    small = client.get('/api/weather?limit=1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
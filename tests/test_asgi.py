@@ -0,0 +1,157 @@
+import asyncio
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
+
+from app import create_app
+from asgi import create_asgi_app
+import database
+
+
+def http_scope(path, query='', headers=()):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(k.encode(), v.encode()) for k, v in headers],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 1),
+    }
+
+
+async def request(app, path, query='', headers=(), disconnect_after=None):
+    """Drive one request; returns `(status, headers, body chunks)`.
+
+    With `disconnect_after=n` the client goes away after `n` body chunks.
+    """
+    sent = []
+    gone = asyncio.Event()
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await gone.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        if (
+            disconnect_after is not None
+            and sum(m['type'] == 'http.response.body' for m in sent) >= disconnect_after
+        ):
+            gone.set()
+            await asyncio.sleep(0)
+
+    await app(http_scope(path, query, headers), receive, send)
+    start = sent[0]
+    return start['status'], dict(start['headers']), [m['body'] for m in sent[1:]]
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    (wx_dir / 'ST1.txt').write_text(
+        ''.join(f'202001{d:02d}\t  {d}0\t  -{d}\t    {d}\n' for d in range(1, 21))
+    )
+    (wx_dir / 'ST2.txt').write_text('20200105\t  100\t    0\t    0\n')
+    url = f'sqlite:///{tmp_path / "asgi.db"}'
+    dbm = database.get_database_manager(url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+    dbm.dispose()
+    return url
+
+
+def test_asgi_serves_the_flask_routes(db_url):
+    flask_app = create_app(database_url=db_url)
+    app = create_asgi_app(flask_app, max_concurrency=2)
+    client = flask_app.test_client()
+
+    async def main():
+        return await asyncio.gather(
+            request(app, '/api/weather', 'station_id=ST1&limit=5'),
+            request(app, '/api/weather/stats'),
+            request(app, '/api/weather/export', 'format=csv'),
+            request(app, '/api/weather', 'start_date=bad'),
+        )
+
+    weather, stats, export, invalid = asyncio.run(main())
+    expected = client.get('/api/weather?station_id=ST1&limit=5')
+    assert weather[0] == 200 and json.loads(b''.join(weather[2])) == expected.get_json()
+    assert weather[1][b'etag'] == expected.headers['ETag'].encode()
+    assert (
+        stats[0] == 200
+        and json.loads(b''.join(stats[2]))
+        == client.get('/api/weather/stats').get_json()
+    )
+    assert export[1][b'content-type'].startswith(b'text/csv')
+    assert (
+        b''.join(export[2]) == client.get('/api/weather/export?format=csv').get_data()
+    )
+    assert invalid[0] == 400
+    app.shutdown()
+
+
+def test_asgi_sheds_load_beyond_the_queue(db_url):
+    flask_app = create_app(database_url=db_url)
+    release = threading.Event()
+    flask_app.add_url_rule('/slow', 'slow', lambda: release.wait(5) and 'done')
+    app = create_asgi_app(flask_app, max_concurrency=1, max_queue=1, queue_timeout=5)
+
+    async def main():
+        slow = asyncio.ensure_future(request(app, '/slow'))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(request(app, '/api/weather'))
+        await asyncio.sleep(0.05)
+        # One running, one queued: the third is turned away at once.
+        rejected = await request(app, '/api/weather')
+        release.set()
+        return rejected, await slow, await queued
+
+    rejected, slow, queued = asyncio.run(main())
+    assert rejected[0] == 503 and rejected[1][b'retry-after'] == b'1'
+    assert slow[0] == 200 and slow[2] == [b'done']
+    assert queued[0] == 200
+    app.shutdown()
+
+
+def test_asgi_disconnect_closes_streamed_export(db_url, monkeypatch):
+    import api
+
+    monkeypatch.setattr(api, 'EXPORT_CHUNK_ROWS', 2)
+    flask_app = create_app(database_url=db_url)
+    app = create_asgi_app(flask_app, max_concurrency=1, max_queue=1)
+    pool = flask_app.config['DB_MANAGER'].read_engine.pool
+
+    async def main():
+        partial = await request(app, '/api/weather/export', disconnect_after=1)
+        # The slot comes back once the response is closed; the next request waits
+        # for it.
+        following = await request(app, '/api/weather/stats')
+        return partial, following, pool.checkedout()
+
+    partial, following, checked_out = asyncio.run(main())
+    assert partial[0] == 200 and len(partial[2]) == 1
+    assert following[0] == 200
+    assert checked_out == 0
+    app.shutdown()
+
+
+def test_module_level_adapter_wraps_the_existing_app():
+    import api
+    import asgi
+
+    assert asgi.app.wsgi_app is api.app
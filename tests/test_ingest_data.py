@@ -1,5 +1,7 @@
+import os
 import sys
 from pathlib import Path
+from datetime import date
 import sqlite3
 
 import pytest
@@ -80,3 +82,334 @@ def test_ingest_weather_and_crop_yield(tmp_path):
     assert cy == 2
 
     conn.close()
+
+
+@pytest.mark.parametrize('mode', ['bulk', 'orm'])
+def test_ingest_modes_store_identical_rows(tmp_path, mode):
+    wx_dir = tmp_path / 'wx_data'
+    write_wx_file(wx_dir / 'TEST001.txt', [
+        '20200101\t  250\t   50\t  100',
+        '20200102\t  300\t  100\t  200',
+        'not-a-date\t1\t2\t3',
+        '20200103\t-9999\t-9999\t-9999',
+    ])
+    write_wx_file(wx_dir / 'TEST002.txt', [
+        '19991231\t   10\t  -20\t    0',
+    ])
+
+    db_file = tmp_path / f'test_{mode}.db'
+    dbm = database.get_database_manager(f'sqlite:///{db_file}')
+    dbm.init_db()
+
+    assert dbm.ingest_weather_data(str(wx_dir), mode=mode, batch_size=2) == 4
+
+    conn = sqlite3.connect(str(db_file))
+    rows = conn.execute(
+        "SELECT s.station_id, date(r.day_number * 86400, 'unixepoch'), "
+        'r.max_temperature_tenths_celsius, r.min_temperature_tenths_celsius, '
+        'r.precipitation_tenths_mm '
+        'FROM weather_records r JOIN weather_stations s ON s.id = r.station_id '
+        'ORDER BY s.station_id, r.day_number'
+    ).fetchall()
+    conn.close()
+    assert rows == [
+        ('TEST001', '2020-01-01', 250, 50, 100),
+        ('TEST001', '2020-01-02', 300, 100, 200),
+        # Missing values are stored as NULL
+        ('TEST001', '2020-01-03', None, None, None),
+        ('TEST002', '1999-12-31', 10, -20, 0),
+    ]
+
+
+def test_ingest_rejects_unknown_mode(tmp_path):
+    dbm = database.get_database_manager(f'sqlite:///{tmp_path / "x.db"}')
+    with pytest.raises(ValueError):
+        dbm.ingest_weather_data(str(tmp_path), mode='fast')
+
+
+def test_parallel_parsing_matches_serial(tmp_path, caplog):
+    wx_dir = tmp_path / 'wx_data'
+    for n in range(5):
+        write_wx_file(wx_dir / f'ST{n:03d}.txt', [
+            f'2020010{d}\t  {n}0{d}\t   {d}\t    {n}' for d in range(1, 8)
+        ] + ['2020013x\t1\t2\t3'])
+
+    results = {}
+    for workers in (1, 3):
+        db_file = tmp_path / f'workers_{workers}.db'
+        dbm = database.get_database_manager(f'sqlite:///{db_file}')
+        dbm.init_db()
+        caplog.clear()
+        with caplog.at_level('INFO', logger='database'):
+            assert dbm.ingest_weather_data(str(wx_dir), workers=workers) == 35
+        progress = [
+            r.getMessage() for r in caplog.records if r.getMessage().startswith('[')
+        ]
+        assert progress == [
+            f'[{n + 1}/5] ST{n:03d}: 7 records (1 errors skipped)' for n in range(5)
+        ]
+        assert sum('Error parsing line' in r.getMessage() for r in caplog.records) == 5
+
+        conn = sqlite3.connect(str(db_file))
+        results[workers] = conn.execute(
+            'SELECT s.station_id, r.day_number, r.max_temperature_tenths_celsius '
+            'FROM weather_records r JOIN weather_stations s ON s.id = r.station_id '
+            'ORDER BY 1, 2'
+        ).fetchall()
+        conn.close()
+
+    assert results[1] == results[3]
+
+
+def test_fast_load_defers_and_rebuilds_indexes(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    write_wx_file(wx_dir / 'TEST001.txt', [
+        '20200101\t  250\t   50\t  100',
+        '20200102\t  300\t  100\t  200',
+    ])
+    db_file = tmp_path / 'fast.db'
+    dbm = database.get_database_manager(f'sqlite:///{db_file}')
+    dbm.init_db()
+
+    def index_names():
+        conn = sqlite3.connect(str(db_file))
+        names = {
+            r[0]
+            for r in conn.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = 'weather_records'"
+            )
+        }
+        conn.close()
+        return names
+
+    expected = {'idx_day_number'}
+    assert index_names() == expected
+
+    with dbm.fast_load():
+        assert index_names() == set()
+        assert dbm.ingest_weather_data(str(wx_dir)) == 2
+
+    assert index_names() == expected
+    conn = sqlite3.connect(str(db_file))
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert (
+        conn.execute(
+            "SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl = 'weather_records'"
+        ).fetchone()[0]
+        > 0
+    )
+    conn.close()
+
+
+def test_copy_buffer_uses_postgres_text_format():
+    buf = database.copy_buffer([(1, date(2020, 1, 1), -22, None, 0.5)])
+    assert buf.read() == '1\t2020-01-01\t-22\t\\N\t0.5\n'
+
+
+@pytest.mark.skipif(
+    not os.environ.get('TEST_POSTGRES_URL'),
+    reason='set TEST_POSTGRES_URL to run against PostgreSQL',
+)
+def test_postgres_copy_ingestion(tmp_path):
+    import analyze_data
+
+    wx_dir = tmp_path / 'wx_data'
+    yld_dir = tmp_path / 'yld_data'
+    write_wx_file(wx_dir / 'TEST001.txt', [
+        '20200101\t  250\t   50\t  100',
+        '20200102\t  300\t  100\t  200',
+        '20200103\t-9999\t-9999\t-9999',
+    ])
+    write_yld_file(yld_dir / 'yield.txt', ['2020 12345', '2021 23456'])
+
+    db_url = os.environ['TEST_POSTGRES_URL']
+    dbm = database.get_database_manager(db_url)
+    assert dbm.supports_copy
+    dbm.drop_db()
+    dbm.init_db()
+    try:
+        assert dbm.ingest_weather_data(str(wx_dir)) == 3
+        assert dbm.ingest_crop_yield_data(str(yld_dir)) == 2
+        assert dbm.ingest_crop_yield_data(str(yld_dir)) == 0
+        assert analyze_data.compute_and_store_stats(db_url) == 1
+        assert analyze_data.compute_and_store_stats(db_url) == 1
+
+        session = dbm.get_session()
+        try:
+            stats = session.query(models.YearlyStationStats).one()
+            assert stats.avg_max_celsius == pytest.approx(27.5)
+            assert stats.total_precip_cm == pytest.approx(3.0)
+        finally:
+            session.close()
+    finally:
+        dbm.drop_db()
+
+
+def test_incremental_append_reads_only_new_lines(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    wx_file = wx_dir / 'TEST001.txt'
+    write_wx_file(wx_file, [
+        '20200101\t  250\t   50\t  100',
+        '20200102\t  300\t  100\t  200',
+    ])
+    db_file = tmp_path / 'append.db'
+    dbm = database.get_database_manager(f'sqlite:///{db_file}')
+    dbm.init_db()
+
+    assert dbm.ingest_weather_data(str(wx_dir)) == 2
+    # Unchanged file: nothing to do
+    assert dbm.ingest_weather_data(str(wx_dir)) == 0
+
+    with open(wx_file, 'a') as f:
+        f.write('20200103\t  310\t  110\t    0\n')
+        f.write('20200104\t  320\t  120\t    5\n')
+    assert dbm.ingest_weather_data(str(wx_dir)) == 2
+
+    # A rewritten file only contributes dates after the last ingested one
+    write_wx_file(wx_file, [
+        '20200101\t  999\t  999\t  999',
+        '20200104\t  320\t  120\t    5',
+        '20200105\t  330\t  130\t    7',
+    ])
+    assert dbm.ingest_weather_data(str(wx_dir)) == 1
+
+    conn = sqlite3.connect(str(db_file))
+    dates = [
+        r[0]
+        for r in conn.execute(
+            "SELECT date(day_number * 86400, 'unixepoch') "
+            'FROM weather_records ORDER BY day_number'
+        )
+    ]
+    manifest = conn.execute(
+        'SELECT file_size, last_observation_date FROM ingest_manifest'
+    ).fetchone()
+    conn.close()
+    assert dates == [
+        '2020-01-01',
+        '2020-01-02',
+        '2020-01-03',
+        '2020-01-04',
+        '2020-01-05',
+    ]
+    assert manifest == (wx_file.stat().st_size, '2020-01-05')
+
+
+def test_station_load_is_atomic_and_rerun_continues(tmp_path, monkeypatch):
+    wx_dir = tmp_path / 'wx_data'
+    for n in range(3):
+        write_wx_file(
+            wx_dir / f'ST{n}.txt',
+            [f'2020010{d}\t  {n}0{d}\t   {d}\t    0' for d in range(1, 4)],
+        )
+    db_file = tmp_path / 'crash.db'
+    dbm = database.get_database_manager(f'sqlite:///{db_file}')
+    dbm.init_db()
+
+    original_write = database.DatabaseManager._write_station_records
+    calls = []
+
+    def crash_on_second_station(self, conn, station_pk, columns, batch_size):
+        calls.append(station_pk)
+        original_write(self, conn, station_pk, columns, batch_size)
+        if len(calls) == 2:
+            raise RuntimeError('simulated crash')
+
+    monkeypatch.setattr(
+        database.DatabaseManager, '_write_station_records', crash_on_second_station
+    )
+    with pytest.raises(RuntimeError):
+        dbm.ingest_weather_data(str(wx_dir), batch_size=1)
+    monkeypatch.undo()
+
+    conn = sqlite3.connect(str(db_file))
+    assert conn.execute('SELECT station_id FROM weather_stations').fetchall() == [
+        ('ST0',)
+    ]
+    assert conn.execute('SELECT COUNT(*) FROM weather_records').fetchone()[0] == 3
+    conn.close()
+
+    assert dbm.ingest_weather_data(str(wx_dir)) == 6
+
+
+def test_resume_reloads_partial_legacy_station(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    write_wx_file(
+        wx_dir / 'ST0.txt', [f'2020010{d}\t  10{d}\t   {d}\t    0' for d in range(1, 5)]
+    )
+    db_file = tmp_path / 'legacy.db'
+    dbm = database.get_database_manager(f'sqlite:///{db_file}')
+    dbm.init_db()
+
+    # A station left half-loaded by a pre-manifest run: row present, 1 of 4 records
+    session = dbm.get_session()
+    station = models.WeatherStation(station_id='ST0')
+    session.add(station)
+    session.flush()
+    session.add(
+        models.WeatherRecord(
+            station_id=station.id,
+            observation_date=date(2020, 1, 1),
+            max_temperature_tenths_celsius=101,
+            min_temperature_tenths_celsius=1,
+            precipitation_tenths_mm=0,
+        )
+    )
+    session.commit()
+    session.close()
+
+    assert dbm.ingest_weather_data(str(wx_dir)) == 0
+    assert dbm.ingest_weather_data(str(wx_dir), resume=True) == 4
+    assert dbm.ingest_weather_data(str(wx_dir), resume=True) == 0
+
+    conn = sqlite3.connect(str(db_file))
+    assert conn.execute('SELECT COUNT(*) FROM weather_records').fetchone()[0] == 4
+    assert conn.execute('SELECT COUNT(*) FROM ingest_manifest').fetchone()[0] == 1
+    conn.close()
+
+
+def test_orm_mode_writes_manifest(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    write_wx_file(
+        wx_dir / 'ST0.txt', [f'2020010{d}\t  10{d}\t   {d}\t    0' for d in range(1, 5)]
+    )
+    db_file = tmp_path / 'orm.db'
+    dbm = database.get_database_manager(f'sqlite:///{db_file}')
+    dbm.init_db()
+
+    assert dbm.ingest_weather_data(str(wx_dir), mode='orm', batch_size=3) == 4
+    # The bulk path sees the station as complete and unchanged
+    assert dbm.ingest_weather_data(str(wx_dir), resume=True) == 0
+
+    conn = sqlite3.connect(str(db_file))
+    assert conn.execute(
+        'SELECT last_observation_date FROM ingest_manifest'
+    ).fetchone() == ('2020-01-04',)
+    conn.close()
+
+
+def test_compare_reports_the_rate_of_every_mode(tmp_path, monkeypatch, caplog):
+    import ingest_data
+
+    wx_dir = tmp_path / 'wx_data'
+    write_wx_file(
+        wx_dir / 'ST0.txt', [f'2020010{d}\t  10{d}\t   {d}\t    0' for d in range(1, 5)]
+    )
+    db_file = tmp_path / 'untouched.db'
+    monkeypatch.setattr(
+        sys,
+        'argv',
+        ['ingest_data.py', '--compare', '--wx-data', str(wx_dir),
+         '--db', f'sqlite:///{db_file}'],
+    )
+    caplog.set_level('INFO', logger='ingest_data')
+
+    assert ingest_data.main()
+    assert not db_file.exists()
+    for mode in database.INGEST_MODES:
+        assert any(
+            line.startswith(f'  - {mode}: 4 records in ')
+            and line.endswith(' records/second)')
+            for line in caplog.messages
+        )
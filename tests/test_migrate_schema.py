@@ -0,0 +1,94 @@
+import sys
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+# Ensure submission modules are importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
+
+import database
+import migrate_schema
+
+LEGACY_DDL = """
+CREATE TABLE weather_stations (
+    id INTEGER PRIMARY KEY, station_id TEXT NOT NULL UNIQUE, state TEXT
+);
+CREATE TABLE weather_records (
+    id INTEGER PRIMARY KEY,
+    station_id INTEGER NOT NULL,
+    observation_date DATE NOT NULL,
+    max_temperature_tenths_celsius INTEGER,
+    min_temperature_tenths_celsius INTEGER,
+    precipitation_tenths_mm INTEGER
+);
+CREATE INDEX idx_station_date ON weather_records(station_id, observation_date);
+CREATE INDEX idx_observation_date ON weather_records(observation_date);
+CREATE INDEX idx_station_id ON weather_records(station_id);
+"""
+
+
+def test_migrates_legacy_weather_records(tmp_path, caplog):
+    db_file = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(str(db_file))
+    conn.executescript(LEGACY_DDL)
+    conn.execute(
+        "INSERT INTO weather_stations (id, station_id) VALUES (1, 'ST1'), (2, 'ST2')"
+    )
+    conn.executemany(
+        'INSERT INTO weather_records (station_id, observation_date, '
+        'max_temperature_tenths_celsius, min_temperature_tenths_celsius, '
+        'precipitation_tenths_mm) VALUES (?, ?, ?, ?, ?)',
+        [
+            (2, '1970-01-01', 10, 0, 5),
+            (1, '2020-01-02', -9999, 50, -9999),
+            (1, '2020-01-01', 250, -9999, 100),
+            (1, '2020-01-01', 999, 999, 999),  # repeated date: first row wins
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    db_url = f'sqlite:///{db_file}'
+    with pytest.raises(RuntimeError):
+        database.get_database_manager(db_url).init_db()
+
+    assert migrate_schema.migrate_weather_records(db_url) == 3
+    assert (
+        '2 stations have no ingest manifest' in caplog.text
+        and '--resume' in caplog.text
+    )
+    assert migrate_schema.migrate_weather_records(db_url) == 0
+    database.get_database_manager(db_url).init_db()
+
+    conn = sqlite3.connect(str(db_file))
+    rows = conn.execute('SELECT * FROM weather_records').fetchall()
+    ddl = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'weather_records'"
+    ).fetchone()[0]
+    indexes = {
+        r[0]
+        for r in conn.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = 'weather_records'"
+        )
+    }
+    counts = conn.execute(
+        'SELECT station_id, year, row_count FROM weather_record_counts '
+        'ORDER BY station_id'
+    ).fetchall()
+    versions = conn.execute(
+        'SELECT id, version FROM dataset_version ORDER BY id'
+    ).fetchall()
+    conn.close()
+    assert rows == [
+        (1, 18262, 250, None, 100),
+        (1, 18263, None, 50, None),
+        (2, 0, 10, 0, 5),
+    ]
+    assert 'WITHOUT ROWID' in ddl
+    assert indexes == {'idx_day_number'}
+    assert counts == [(1, 2020, 2), (2, 1970, 1)]
+    # Dataset and records versions bumped by the migration only, not by the run
+    # that found nothing to do.
+    assert versions == [(1, 1), (2, 1)]
@@ -27,3 +27,15 @@ def test_weatherrecord_properties():
     assert wr2.max_temperature_celsius is None
     assert wr2.min_temperature_celsius is None
     assert wr2.precipitation_mm is None
+
+
+def test_weatherrecord_day_number_and_missing_values():
+    from datetime import date
+
+    wr = models.WeatherRecord(
+        observation_date=date(1970, 1, 2), max_temperature_tenths_celsius=-9999
+    )
+    assert wr.day_number == 1
+    assert wr.observation_date == date(1970, 1, 2)
+    # -9999 is normalized to NULL on assignment
+    assert wr.max_temperature_tenths_celsius is None
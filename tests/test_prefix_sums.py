@@ -0,0 +1,132 @@
+import sys
+from pathlib import Path
+
+# Ensure submission modules are importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
+
+import numpy as np
+
+from api import create_app
+from analyze_data import compute_and_store_stats
+import database
+import prefix_sums
+
+
+def write_station(path, days):
+    lines = []
+    for d in days:
+        day = np.datetime64('2019-11-01') + d
+        values = [
+            '-9999' if (d * k) % 7 == 3 else str((d * k) % 400 - 100)
+            for k in (3, 5, 11)
+        ]
+        lines.append(
+            day.astype(str).replace('-', '') + ''.join(f'\t{v:>5}' for v in values)
+        )
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def test_range_aggregates_match_yearly_stats_and_raw_rows(tmp_path):
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    write_station(wx_dir / 'ST1.txt', range(0, 500))
+    write_station(wx_dir / 'ST2.txt', range(40, 200, 3))
+    db_url = f'sqlite:///{tmp_path / "sums.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+    sums_dir = tmp_path / 'sums'
+    compute_and_store_stats(db_url, prefix_sum_dir=str(sums_dir))
+    assert sorted(p.name for p in sums_dir.iterdir()) == ['ST1.wxp', 'ST2.wxp']
+    with dbm.engine.connect() as conn:
+        assert prefix_sums.PrefixSumStore(sums_dir).read(
+            'ST1'
+        ).version == database.read_dataset_version(conn)
+
+    client = create_app(database_url=db_url, prefix_sum_dir=str(sums_dir)).test_client()
+
+    # A calendar year reproduces the stored yearly row bit for bit.
+    stats = client.get('/api/weather/stats?limit=100').get_json()['data']
+    assert len(stats) == 5
+    for row in stats:
+        agg = client.get(
+            f"/api/weather/aggregate?station_id={row['station_id']}"
+            f"&start_date={row['year']}-01-01&end_date={row['year']}-12-31"
+        ).get_json()
+        for field in ('avg_max_celsius', 'avg_min_celsius', 'total_precip_cm'):
+            assert agg[field] == row[field]
+
+    # Arbitrary ranges agree with the raw records (missing values excluded).
+    raw = client.get('/api/weather?station_id=ST1&limit=10000').get_json()['data']
+    for start, end in (
+        ('2020-04-15', '2020-10-31'),
+        ('2019-11-01', '2019-11-01'),
+        ('2021-02-01', '2030-01-01'),
+    ):
+        rows = [r for r in raw if start <= r['date'] <= end]
+        agg = client.get(
+            f'/api/weather/aggregate?station_id=ST1&start_date={start}&end_date={end}'
+        ).get_json()
+        assert agg['record_count'] == len(rows)
+        max_values = [
+            round(r['max_temperature_celsius'] * 10)
+            for r in rows
+            if r['max_temperature_celsius'] is not None
+        ]
+        precip_values = [
+            round(r['precipitation_mm'] * 10)
+            for r in rows
+            if r['precipitation_mm'] is not None
+        ]
+        assert agg['valid_counts']['max_temperature'] == len(max_values)
+        assert agg['avg_max_celsius'] == (
+            sum(max_values) / len(max_values) / 10.0 if max_values else None
+        )
+        assert agg['total_precip_cm'] == (
+            float(sum(precip_values)) / 100.0 if precip_values else None
+        )
+
+    empty = client.get(
+        '/api/weather/aggregate?station_id=ST2&start_date=2021-01-01'
+    ).get_json()
+    assert (
+        empty['record_count'] == 0
+        and empty['avg_max_celsius'] is None
+        and empty['total_precip_cm'] is None
+    )
+    assert client.get('/api/weather/aggregate?station_id=NOPE').status_code == 404
+    assert client.get('/api/weather/aggregate').status_code == 400
+    assert (
+        client.get(
+            '/api/weather/aggregate?station_id=ST1&end_date=2020-02-30'
+        ).status_code
+        == 400
+    )
+
+
+def test_stale_files_fall_back_to_the_database(tmp_path):
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    write_station(wx_dir / 'ST1.txt', range(0, 10))
+    db_url = f'sqlite:///{tmp_path / "stale.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+    sums_dir = tmp_path / 'sums'
+    compute_and_store_stats(db_url, prefix_sum_dir=str(sums_dir))
+
+    with open(wx_dir / 'ST1.txt', 'a') as f:
+        f.write('20191111\t  100\t    0\t    0\n')
+    dbm.ingest_weather_data(str(wx_dir))
+
+    client = create_app(
+        database_url=db_url, prefix_sum_dir=str(sums_dir), version_ttl=0
+    ).test_client()
+    assert (
+        client.get('/api/weather/aggregate?station_id=ST1').get_json()['record_count']
+        == 11
+    )
+    assert (
+        prefix_sums.PrefixSumStore(sums_dir).read('ST1').version
+        < client.application.config['DATASET_VERSION'].current()
+    )
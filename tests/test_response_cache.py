@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+
+# Ensure submission modules are importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
+
+from sqlalchemy import event
+
+from api import create_app
+from analyze_data import compute_and_store_stats
+import database
+from response_cache import ResponseCache
+
+
+def test_lru_evicts_by_entries_bytes_and_version():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put('a', 1, b'aaa')
+    cache.put('b', 1, b'bbb')
+    assert cache.get('a', 1) == b'aaa'
+    cache.put('c', 1, b'ccc')
+    assert cache.get('b', 1) is None  # least recently used
+    assert cache.get('a', 1) == b'aaa' and cache.get('c', 1) == b'ccc'
+    cache.put('d', 1, b'dddddddd')
+    assert len(cache) == 1 and cache.get('d', 1) == b'dddddddd'
+    cache.put('e', 1, b'x' * 11)
+    assert cache.get('e', 1) is None
+
+    # A newer version drops everything; an older one is never stored.
+    assert cache.get('d', 2) is None
+    cache.put('a', 2, b'new')
+    assert len(cache) == 1 and cache.get('d', 1) is None
+    cache.put('b', 1, b'old')
+    assert cache.get('b', 1) is None and cache.get('a', 2) == b'new'
+
+
+def test_etag_304_and_cached_responses_follow_the_dataset_version(tmp_path):
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    wx_file = wx_dir / 'ST1.txt'
+    wx_file.write_text('20200101\t  10\t   0\t   0\n20200102\t  20\t   0\t   0\n')
+    db_url = f'sqlite:///{tmp_path / "versions.db"}'
+    dbm = database.get_database_manager(db_url)
+    dbm.init_db()
+
+    def version():
+        with dbm.engine.connect() as conn:
+            return database.read_dataset_version(conn)
+
+    assert version() == 0
+    dbm.ingest_weather_data(str(wx_dir))
+    assert version() == 1
+    compute_and_store_stats(db_url)
+    assert version() == 2
+
+    app = create_app(database_url=db_url, version_ttl=3600)
+    client = app.test_client()
+    first = client.get('/api/weather?station_id=ST1&limit=5')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('"2-')
+    # Parameter order does not matter; other queries get other tags.
+    assert client.get('/api/weather?limit=5&station_id=ST1').headers['ETag'] == etag
+    assert client.get('/api/weather?station_id=ST1&limit=6').headers['ETag'] != etag
+
+    statements = []
+    event.listen(app.config['DB_MANAGER'].engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    not_modified = client.get(
+        '/api/weather?station_id=ST1&limit=5', headers={'If-None-Match': etag}
+    )
+    assert not_modified.status_code == 304 and not_modified.headers['ETag'] == etag
+    assert (
+        client.get('/api/weather?station_id=ST1&limit=5').get_json() == first.get_json()
+    )
+    assert statements == []
+    assert client.get('/api/weather?date=bad').status_code == 400
+
+    # New data bumps the version, so the old tag no longer matches.
+    with open(wx_file, 'a') as f:
+        f.write('20200103\t  30\t   0\t   0\n')
+    dbm.ingest_weather_data(str(wx_dir))
+    fresh = create_app(database_url=db_url, version_ttl=0).test_client()
+    updated = fresh.get(
+        '/api/weather?station_id=ST1&limit=5', headers={'If-None-Match': etag}
+    )
+    assert updated.status_code == 200 and updated.headers['ETag'].startswith('"3-')
+    assert updated.get_json()['pagination']['returned'] == 3
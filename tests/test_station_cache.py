@@ -0,0 +1,196 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure submission modules are importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
+
+from api import create_app
+import database
+import station_cache
+from analyze_data import compute_and_store_stats
+
+
+def write_wx_file(path, lines):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as f:
+        for ln in lines:
+            f.write(ln + '\n')
+
+
+def records_version(dbm):
+    with dbm.engine.connect() as conn:
+        return database.read_dataset_version(conn, database.RECORDS_VERSION_ID)
+
+
+def test_api_serves_cached_stations_like_the_database(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    write_wx_file(
+        wx_dir / 'ST1.txt',
+        [f'202001{d:02d}\t  {d}5\t  -{d}\t    {d}' for d in range(1, 21)],
+    )
+    write_wx_file(wx_dir / 'ST1.txt', ['20200121\t-9999\t-9999\t-9999'])
+    write_wx_file(wx_dir / 'ST2.txt', ['20200101\t  100\t    0\t    0'])
+
+    db_url = f'sqlite:///{tmp_path / "cache.db"}'
+    cache_dir = tmp_path / 'cache'
+    dbm = database.get_database_manager(db_url, cache_dir)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+    assert sorted(p.name for p in cache_dir.iterdir()) == ['ST1.wxc', 'ST2.wxc']
+
+    # Appending re-exports the station
+    write_wx_file(wx_dir / 'ST1.txt', ['20200122\t  222\t   22\t    2'])
+    dbm.ingest_weather_data(str(wx_dir))
+    assert (
+        len(station_cache.StationCache(cache_dir).get('ST1', records_version(dbm)))
+        == 22
+    )
+
+    # Response caching off: both apps must really read their sources.
+    cached = create_app(
+        database_url=db_url, station_cache_dir=str(cache_dir), response_cache_size=0
+    ).test_client()
+    uncached = create_app(database_url=db_url, response_cache_size=0).test_client()
+    for query in (
+        'station_id=ST1',
+        'station_id=ST1&start_date=2020-01-05&end_date=2020-01-15&limit=4&offset=3',
+        'station_id=ST1&date=2020-01-21',
+        'station_id=ST1&start_date=2020-01-20',
+        'station_id=ST1&offset=100',
+        'station_id=ST2&end_date=2019-12-31',
+        'station_id=NOPE',
+    ):
+        expected = uncached.get(f'/api/weather?{query}').get_json()
+        assert cached.get(f'/api/weather?{query}').get_json() == expected, query
+    assert (
+        cached.get('/api/weather?station_id=ST1&date=2020-01-21').get_json()['data'][0][
+            'max_temperature_celsius'
+        ]
+        is None
+    )
+    assert cached.get('/api/weather?station_id=ST1&date=bad').status_code == 400
+
+    # Cursors are interchangeable between the cached and database paths
+    first = uncached.get('/api/weather?station_id=ST1&limit=5').get_json()[
+        'pagination'
+    ]['next_cursor']
+    assert (
+        first
+        == cached.get('/api/weather?station_id=ST1&limit=5').get_json()['pagination'][
+            'next_cursor'
+        ]
+    )
+    for query in (
+        f'station_id=ST1&limit=7&cursor={first}',
+        f'station_id=ST1&limit=100&cursor={first}',
+    ):
+        assert (
+            cached.get(f'/api/weather?{query}').get_json()
+            == uncached.get(f'/api/weather?{query}').get_json()
+        )
+
+    # Cached answers come from the mapped file, not the table
+    conn = sqlite3.connect(str(tmp_path / 'cache.db'))
+    conn.execute('DELETE FROM weather_records')
+    conn.commit()
+    conn.close()
+    assert (
+        cached.get('/api/weather?station_id=ST1').get_json()['pagination'][
+            'total_count'
+        ]
+        == 22
+    )
+    assert (
+        uncached.get('/api/weather?station_id=ST1').get_json()['pagination'][
+            'total_count'
+        ]
+        == 0
+    )
+
+
+def test_cache_ignores_unsafe_station_codes(tmp_path):
+    cache = station_cache.StationCache(tmp_path / 'cache')
+    assert cache.get('../cache', 1) is None
+    with pytest.raises(ValueError):
+        cache.write_station('../evil', 1, 1, [1], [1], [1], [1])
+    with pytest.raises(ValueError):
+        cache.write_station('BIG', 1, 1, [1], [40000], [1], [1])
+
+
+def test_stale_files_fall_back_to_the_database(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    write_wx_file(
+        wx_dir / 'ST1.txt',
+        [f'202001{d:02d}\t  {d}5\t  -{d}\t    {d}' for d in range(1, 11)],
+    )
+    write_wx_file(wx_dir / 'ST2.txt', ['20200101\t  100\t    0\t    0'])
+    db_url = f'sqlite:///{tmp_path / "stale.db"}'
+    cache_dir = tmp_path / 'cache'
+    dbm = database.get_database_manager(db_url, cache_dir)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+
+    # Files of stations loaded earlier in the run are carried over to its final version.
+    cache = station_cache.StationCache(cache_dir)
+    version = records_version(dbm)
+    assert len(cache.get('ST1', version)) == 10 and len(cache.get('ST2', version)) == 1
+
+    # A load without the cache leaves every file behind the database.
+    write_wx_file(wx_dir / 'ST1.txt', ['20200111\t  100\t    0\t    0'])
+    uncached_dbm = database.get_database_manager(db_url)
+    uncached_dbm.ingest_weather_data(str(wx_dir))
+    uncached_dbm.dispose()
+    assert (
+        cache.get('ST1', records_version(dbm)) is None
+        and cache.get('ST2', records_version(dbm)) is None
+    )
+
+    client = create_app(
+        database_url=db_url, station_cache_dir=str(cache_dir), version_ttl=0
+    ).test_client()
+    assert (
+        client.get('/api/weather?station_id=ST1').get_json()['pagination'][
+            'total_count'
+        ]
+        == 11
+    )
+    # Files already stale when a cached load starts stay stale: only re-exported
+    # stations come back.
+    write_wx_file(wx_dir / 'ST1.txt', ['20200112\t  100\t    0\t    0'])
+    dbm.ingest_weather_data(str(wx_dir))
+    assert len(cache.get('ST1', records_version(dbm))) == 12
+    assert cache.get('ST2', records_version(dbm)) is None
+
+
+def test_analysis_does_not_invalidate_the_cache(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    write_wx_file(
+        wx_dir / 'ST1.txt',
+        [f'202001{d:02d}\t  {d}5\t  -{d}\t    {d}' for d in range(1, 11)],
+    )
+    db_url = f'sqlite:///{tmp_path / "analyzed.db"}'
+    cache_dir = tmp_path / 'cache'
+    dbm = database.get_database_manager(db_url, cache_dir)
+    dbm.init_db()
+    dbm.ingest_weather_data(str(wx_dir))
+    dbm.dispose()
+    for incremental in (False, True):
+        compute_and_store_stats(db_url, incremental=incremental)
+
+    # Records removed behind the API's back: only a cache hit still sees them.
+    conn = sqlite3.connect(str(tmp_path / 'analyzed.db'))
+    conn.execute('DELETE FROM weather_records')
+    conn.commit()
+    conn.close()
+    client = create_app(
+        database_url=db_url, station_cache_dir=str(cache_dir), version_ttl=0
+    ).test_client()
+    assert (
+        client.get('/api/weather?station_id=ST1').get_json()['pagination'][
+            'total_count'
+        ]
+        == 10
+    )
@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+from datetime import date
+
+import numpy as np
+
+# Ensure submission modules are importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
+
+import weather_parser
+
+
+def test_fixed_width_fast_path():
+    data = (
+        b'19850101\t  -22\t -128\t   94\n'
+        b'19850102\t -122\t -217\t    0\n'
+        b'20000229\t-9999\t-9999\t-9999\n'
+    )
+    cols = weather_parser.parse_weather_bytes(data)
+
+    assert len(cols) == 3
+    assert cols.error_count == 0
+    assert cols.day_numbers.dtype == np.int32
+    assert cols.dates() == [date(1985, 1, 1), date(1985, 1, 2), date(2000, 2, 29)]
+    assert cols.max_tenths.tolist() == [-22, -122, -9999]
+    assert cols.min_tenths.tolist() == [-128, -217, -9999]
+    assert cols.precip_tenths.tolist() == [94, 0, -9999]
+    assert weather_parser.day_number_to_date(cols.day_numbers[0]) == date(1985, 1, 1)
+
+
+def test_irregular_and_malformed_lines_keep_scalar_semantics():
+    lines = [
+        '19850101\t  -22\t -128\t   94',
+        '19850102\t1\t2\t3',             # valid but not fixed width
+        '',                                # blank: skipped silently
+        '19850103\t  abc\t    0\t    0',  # fixed width, bad value
+        '20200231\t    1\t    1\t    1',  # fixed width, impossible date
+        '19850104\t  5',                   # too few fields: counted only
+        '19850105\t   -1\t    2\t   30',
+    ]
+    data = ('\n'.join(lines) + '\n').encode()
+    cols = weather_parser.parse_weather_bytes(data)
+
+    rows, error_count, bad_lines = weather_parser.parse_station_lines(lines)
+    assert list(cols.iter_rows()) == rows
+    assert cols.error_count == error_count == 3
+    assert cols.bad_lines == bad_lines == [lines[3], lines[4]]
+    assert [d.day for d in cols.dates()] == [1, 2, 5]
+
+
+def test_matches_scalar_parser_on_station_file():
+    data_file = (
+        Path(__file__).resolve().parents[1] / 'data' / 'wx_data' / 'USC00110072.txt'
+    )
+    cols = weather_parser.parse_weather_file(data_file)
+    with open(data_file) as f:
+        rows, error_count, _ = weather_parser.parse_station_lines(f)
+    assert cols.error_count == error_count
+    assert list(cols.iter_rows()) == rows
@@ -0,0 +1,175 @@
+import gzip
+import io
+import sys
+import tarfile
+from pathlib import Path
+from datetime import date
+import sqlite3
+
+import pytest
+
+# Ensure submission modules are importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'submission'))
+
+import database
+import weather_sources
+from weather_parser import day_number_to_date
+
+
+def station_bytes(*days):
+    return ''.join(f'2020010{d}\t  10{d}\t   {d}\t    0\n' for d in days).encode()
+
+
+def make_tar(path_or_buf, members, mode='w:gz'):
+    kwargs = (
+        {'fileobj': path_or_buf}
+        if isinstance(path_or_buf, io.BytesIO)
+        else {'name': path_or_buf}
+    )
+    with tarfile.open(mode=mode, **kwargs) as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 1600000000
+            tar.addfile(info, io.BytesIO(data))
+
+
+def test_directory_with_plain_compressed_and_archived_files(tmp_path):
+    wx_dir = tmp_path / 'wx_data'
+    wx_dir.mkdir()
+    (wx_dir / 'PLAIN01.txt').write_bytes(station_bytes(1, 2))
+    with gzip.open(wx_dir / 'GZ01.txt.gz', 'wb') as f:
+        f.write(station_bytes(1, 2, 3))
+    make_tar(wx_dir / 'bundle.tar.gz', {
+        'wx/TAR01.txt': station_bytes(1),
+        'wx/TAR02.txt.gz': gzip.compress(station_bytes(4, 5)),
+        'wx/README': b'not a station',
+    })
+    (wx_dir / 'notes.md').write_text('ignored')
+
+    assert weather_sources.count_station_sources(wx_dir) is None
+    sources = list(weather_sources.iter_station_sources(wx_dir))
+    assert [s.station_id for s in sources] == ['GZ01', 'PLAIN01', 'TAR01', 'TAR02']
+    assert [s.seekable for s in sources] == [False, True, False, False]
+
+    db_file = tmp_path / 'sources.db'
+    dbm = database.get_database_manager(f'sqlite:///{db_file}')
+    dbm.init_db()
+    assert dbm.ingest_weather_data(str(wx_dir), workers=2) == 8
+    # Streamed members are unchanged on the second run
+    assert dbm.ingest_weather_data(str(wx_dir)) == 0
+
+    conn = sqlite3.connect(str(db_file))
+    counts = dict(
+        conn.execute(
+            'SELECT s.station_id, COUNT(*) FROM weather_records r '
+            'JOIN weather_stations s ON s.id = r.station_id GROUP BY s.station_id'
+        )
+    )
+    conn.close()
+    assert counts == {'GZ01': 3, 'PLAIN01': 2, 'TAR01': 1, 'TAR02': 2}
+
+
+def test_stdin_tar_stream(tmp_path, monkeypatch):
+    buf = io.BytesIO()
+    make_tar(buf, {'A.txt': station_bytes(1, 2), 'B.txt': station_bytes(3)})
+    buf.seek(0)
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(buf))
+
+    dbm = database.get_database_manager(f'sqlite:///{tmp_path / "stdin.db"}')
+    dbm.init_db()
+    assert dbm.ingest_weather_data('-') == 3
+
+
+def test_streamed_member_appends_only_new_lines(tmp_path):
+    archive = tmp_path / 'wx.tar'
+    make_tar(archive, {'A.txt': station_bytes(1, 2)}, mode='w')
+    dbm = database.get_database_manager(f'sqlite:///{tmp_path / "tar.db"}')
+    dbm.init_db()
+    assert dbm.ingest_weather_data(str(archive)) == 2
+
+    make_tar(archive, {'A.txt': station_bytes(1, 2, 3)}, mode='w')
+    assert dbm.ingest_weather_data(str(archive)) == 1
+
+
+def test_read_station_file_parses_only_the_tail(tmp_path):
+    wx_file = tmp_path / 'TEST001.txt'
+    wx_file.write_bytes(station_bytes(1))
+    columns, appended, size, _, digest = weather_sources.read_station_file(wx_file)
+    assert (len(columns), appended) == (1, False)
+
+    with open(wx_file, 'ab') as f:
+        f.write(station_bytes(2))
+    columns, appended, new_size, _, _ = weather_sources.read_station_file(
+        wx_file, size, digest
+    )
+    assert appended
+    assert new_size == wx_file.stat().st_size
+    assert columns.dates() == [date(2020, 1, 2)]
+
+    data = wx_file.read_bytes()
+    columns, appended, _, _, _ = weather_sources.read_station_data(
+        data, 0.0, size, digest
+    )
+    assert appended
+    assert columns.dates() == [date(2020, 1, 2)]
+
+
+def test_partial_last_line_is_held_back_only_when_appending(tmp_path, caplog):
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    wx_file = wx_dir / 'TEST001.txt'
+    wx_file.write_bytes(station_bytes(1))
+    db_path = tmp_path / 'partial.db'
+    dbm = database.get_database_manager(f'sqlite:///{db_path}')
+    dbm.init_db()
+    assert dbm.ingest_weather_data(str(wx_dir)) == 1
+
+    # A writer is halfway through day 2: it is held back, with a warning.
+    partial = station_bytes(2)
+    with open(wx_file, 'ab') as f:
+        f.write(partial[:-6])
+    with caplog.at_level('WARNING', logger='weather_sources'):
+        assert dbm.ingest_weather_data(str(wx_dir)) == 0
+    assert 'holding it back' in caplog.text
+
+    # The writer finishes the line, then appends another day: nothing is lost.
+    with open(wx_file, 'ab') as f:
+        f.write(partial[-6:])
+    assert dbm.ingest_weather_data(str(wx_dir)) == 1
+    with open(wx_file, 'ab') as f:
+        f.write(station_bytes(3))
+    assert dbm.ingest_weather_data(str(wx_dir)) == 1
+
+    conn = sqlite3.connect(str(db_path))
+    rows = conn.execute(
+        'SELECT day_number, max_temperature_tenths_celsius FROM weather_records '
+        'ORDER BY 1'
+    ).fetchall()
+    conn.close()
+    assert [(day_number_to_date(day), value) for day, value in rows] == [
+        (date(2020, 1, 1), 101), (date(2020, 1, 2), 102), (date(2020, 1, 3), 103)]
+
+
+@pytest.mark.parametrize('name', ['A.txt', 'A.txt.gz'])
+def test_last_line_without_newline_is_loaded(tmp_path, name):
+    data = station_bytes(1, 2).rstrip(b'\n')
+    wx_dir = tmp_path / 'wx'
+    wx_dir.mkdir()
+    (wx_dir / name).write_bytes(gzip.compress(data) if name.endswith('.gz') else data)
+    counts = {}
+    for mode in ('bulk', 'orm'):
+        if mode == 'orm' and name.endswith('.gz'):
+            continue
+        dbm = database.get_database_manager(f'sqlite:///{tmp_path / f"{mode}.db"}')
+        dbm.init_db()
+        counts[mode] = dbm.ingest_weather_data(str(wx_dir), mode=mode)
+        # Nothing new on the next run.
+        assert dbm.ingest_weather_data(str(wx_dir), mode=mode) == 0
+        dbm.dispose()
+    assert set(counts.values()) == {2}
+
+
+def test_missing_input_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(weather_sources.iter_station_sources(tmp_path / 'missing'))